@@ -1,102 +1,128 @@
 import streamlit as st
-from openai import OpenAI
 import os
-from datetime import datetime
-from docx import Document
-import fitz  # PyMuPDF
+import uuid
+from clientes import obtener_cliente
+from concurrencia import ejecutar_en_orden, MAX_EN_VUELO_POR_DEFECTO
+from traduccion import (
+    iter_text_chunks, translator_for, generate_filename, chunk_hash, document_id,
+    load_chunk_manifest, save_chunk_manifest, models_for, CASCADE, CASCADE_MODELS
+)
+from ingesta import iterar_paginas_pdf, iterar_parrafos_docx, iterar_documento, hash_contenido, detectar_formato
+from normalizacion import normalizar_bloques, resumen_normalizacion
+from instrumentacion import IterableMedido, tramo, traza_actual
+from trabajos import Informe, clave_trabajo, enviar_trabajo, trabajo_de_sesion, mostrar_trabajo
+from salidas import VolcadoSalida, SalidaEnDisco, mostrar_salida
 
-# Inicializar el cliente de OpenAI
-def initialize_openai_client():
-    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Obtener el cliente de OpenAI compartido del proceso para el modelo elegido (ver clientes.py). En la cascada se usa
+# el cliente del modelo grande, cuyo tiempo de espera cubre también las respuestas del rápido.
+def initialize_openai_client(model=None):
+    client = obtener_cliente(models_for(model)[-1] if model else None)
+    if not client:
+        st.error("API Key de OpenAI no configurada. Verifica la variable de entorno.")
+        return None
+    return client
 
-# Función para dividir el texto en fragmentos manejables
-def split_text_into_chunks(text, max_chars=5000):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + max_chars, len(text))
-        if end < len(text):
-            potential_end = text.rfind('\n', start, end)
-            if potential_end == -1:
-                potential_end = text.rfind('. ', start, end)
-            if potential_end != -1:
-                end = potential_end + 1  # Incluir el punto y espacio en el corte
-        chunks.append(text[start:end].strip())
-        start = end
-    return chunks
-
-# Función para traducir un fragmento de texto a español conciso usando la API de OpenAI
-@st.cache_data  # Uso de cache_data para almacenar resultados serializables
-def translate_chunk_to_concise_spanish(_client, chunk, model):
-    prompt = (
-        "You are an assistant specialized in translating text into concise Spanish. "
-        "Translate the following text into Spanish, preserving the informational integrity with the minimum possible characters. "
-        "Do not omit key details, especially in lists. Reduce words without summarizing. Use abbreviations when possible, without losing clarity. "
-        "Do not use bold or other emphasis formats. Omit metadata, links, and references. "
-        "The text to be translated is: {chunk}"
-    )
-    
-    response = _client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt.format(chunk=chunk)}
-        ],
-        temperature=0,
-        max_tokens=4095,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0
-    )
-    
-    return f"<©>{response.choices[0].message.content.strip()}</©>"
-
-# Función para traducir un fragmento de texto a inglés conciso usando la API de OpenAI
-@st.cache_data  # Uso de cache_data para almacenar resultados serializables
-def translate_chunk_to_concise_english(_client, chunk, model):
-    prompt = (
-        "You are an assistant specialized in translating text into concise English. "
-        "Translate the following text into English, preserving the informational integrity with the minimum possible characters. "
-        "Do not omit key details, especially in lists. Reduce words without summarizing. Use abbreviations when possible, without losing clarity. "
-        "Do not use bold or other emphasis formats. Omit metadata, links, and references. "
-        "The text to be translated is: {chunk}"
+# Función para procesar el texto completo, traduciendo los fragmentos en paralelo y conservando su orden.
+# `text` puede ser una cadena o un iterable de bloques (p. ej. páginas que aún se están extrayendo): los fragmentos
+# se envían a traducir en cuanto se forman, de modo que la extracción y la traducción se solapan.
+# Con `doc_id`, los fragmentos que no cambiaron desde la última traducción del documento se toman de su manifiesto
+# y solo los fragmentos nuevos o editados se envían a la API. El avance y los avisos se notifican a `informe`.
+# Con `output` (un salidas.VolcadoSalida), cada fragmento traducido se vuelca a disco en cuanto está listo en lugar
+# de acumularse en memoria, y se devuelve la ruta de la salida en lugar del texto.
+def process_text(_client, text, model, chunk_size, language, max_concurrency=MAX_EN_VUELO_POR_DEFECTO, doc_id=None, informe=None, output=None):
+    blocks = [text] if isinstance(text, str) else text
+    informe = informe or Informe()
+    
+    translate_chunk = translator_for(language)
+    previous = load_chunk_manifest(doc_id) if doc_id else {}
+    hashes = []
+    reused = 0
+    # Fragmentos cuya traducción no superó las comprobaciones: no se guardan en el manifiesto, para repetirlos
+    failed_checks = set()
+    
+    informe.progreso(0.0, f"Procesando fragmentos con el modelo {model}...")
+    submitted = 0
+    
+    # Contar los fragmentos a medida que se forman y se envían, identificándolos por su hash
+    def count_submitted(chunks):
+        nonlocal submitted, reused
+        for chunk in chunks:
+            submitted += 1
+            key = chunk_hash(chunk)
+            hashes.append(key)
+            if key in previous:
+                reused += 1
+            yield key, chunk
+    
+    # Reutilizar la traducción guardada de un fragmento sin cambios o traducirlo
+    def translate_or_reuse(item):
+        key, chunk = item
+        if key in previous:
+            return previous[key]
+        translated_chunk, passed = translate_chunk(_client, chunk, model)
+        if not passed:
+            failed_checks.add(key)
+        return translated_chunk
+    
+    # Los fragmentos fallidos se marcan en su posición, conservando los resultados parciales
+    def untranslated(index, error):
+        return f"<©>[Fragmento {index + 1} sin traducir: {error}]</©>"
+    
+    # Actualizar el progreso (y volcar la salida) a medida que llegan los fragmentos traducidos
+    def on_chunk_done(index, translated_chunk, error, completed):
+        if error is not None:
+            informe.aviso(f"Error al traducir el fragmento {index + 1}: {error}")
+        if output is not None:
+            output.escribir(index, untranslated(index, error) if error is not None else translated_chunk)
+        informe.progreso(completed / max(submitted, completed), f"Fragmento {index + 1} listo ({completed}/{submitted} enviados)")
+    
+    translated_chunks, errors = ejecutar_en_orden(
+        translate_or_reuse,
+        count_submitted(IterableMedido("fragmentacion", iter_text_chunks(blocks, max_chars=chunk_size, model=model), interno=blocks)),
+        max_en_vuelo=max_concurrency,
+        al_completar=on_chunk_done,
+        conservar=output is None
     )
+    informe.nota(f"El texto se ha dividido en {len(translated_chunks)} fragmentos.")
+    if reused:
+        informe.nota(f"{reused} fragmentos sin cambios se reutilizaron de la traducción anterior; {len(translated_chunks) - reused} se tradujeron.")
+    
+    # Fragmentos casi idénticos a otros ya traducidos, en este u otros documentos (ver duplicados.py)
+    trace = traza_actual()
+    near_duplicates = [t.atributos["resultado"] for t in trace.tramos if t.etapa == "duplicados"] if trace else []
+    if near_duplicates.count("reutilizada") or near_duplicates.count("parcheada"):
+        informe.nota(
+            f"{near_duplicates.count('reutilizada')} fragmentos casi idénticos a otros ya traducidos reutilizaron su "
+            f"traducción (llamadas a la API evitadas); {near_duplicates.count('parcheada')} se actualizaron traduciendo "
+            "solo las oraciones que cambiaron."
+        )
+    
+    total = len(translated_chunks)
+    with tramo("ensamblado", fragmentos=total, reutilizados=reused):
+        if output is not None:
+            translation = output.cerrar()
+            translated_chunks = SalidaEnDisco(translation).iterar_fragmentos()
+        else:
+            translated_chunks = [
+                untranslated(i, errors[i]) if i in errors else translated_chunk for i, translated_chunk in enumerate(translated_chunks)
+            ]
+            translation = "".join(translated_chunk + "\n\n" for translated_chunk in translated_chunks)
     
-    response = _client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt.format(chunk=chunk)}
-        ],
-        temperature=0,
-        max_tokens=4095,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0
-    )
+    # Guardar el manifiesto con los fragmentos traducidos de esta versión del documento (leídos de la salida en disco)
+    if doc_id:
+        save_chunk_manifest(doc_id, (
+            (hashes[i], translated_chunk) for i, translated_chunk in enumerate(translated_chunks)
+            if i not in errors and hashes[i] not in failed_checks
+        ))
     
-    return f"<©>{response.choices[0].message.content.strip()}</©>"
-
-# Función para procesar el texto completo
-def process_text(_client, text, model, chunk_size, language):
-    chunks = split_text_into_chunks(text, max_chars=chunk_size)
-    st.write(f"El texto se ha dividido en {len(chunks)} fragmentos.")
-    
-    translation = ""
-    for i, chunk in enumerate(chunks):
-        st.write(f"Procesando fragmento {i + 1} con el modelo {model}...")
-        if language == "Español Conciso":
-            translated_chunk = translate_chunk_to_concise_spanish(_client, chunk, model)
-        else:
-            translated_chunk = translate_chunk_to_concise_english(_client, chunk, model)
-        translation += translated_chunk + "\n\n"
+    if errors:
+        informe.aviso(f"{len(errors)} de {total} fragmentos no se pudieron traducir; se conservan los demás.")
     
     return translation
 
 # Función para leer archivos .docx
 def read_docx(file):
-    doc = Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
+    return "".join(iterar_parrafos_docx(file))
 
 # Función para leer archivos .md
 def read_md(file):
@@ -104,38 +130,60 @@ def read_md(file):
 
 # Función para leer archivos PDF
 def read_pdf(file):
-    pdf_reader = fitz.open(stream=file.read(), filetype="pdf")
-    text = ""
-    for page_num in range(len(pdf_reader)):
-        page = pdf_reader.load_page(page_num)
-        text += page.get_text()
-    return text
+    return "".join(iterar_paginas_pdf(file))
+
+# Función para obtener el contenido de un archivo subido como flujo de bloques (None si no está soportado).
+# El texto extraído se guarda en la caché de documentos, por lo que las siguientes ejecuciones no vuelven
+# a analizar el archivo; la primera vez, los PDF se extraen página a página a medida que se traducen.
+def iter_document_blocks(uploaded_file):
+    return iterar_documento(uploaded_file)
 
-# Función para generar el nombre del archivo con los detalles adicionales
-def generate_filename(base_name, model, chunk_size, language):
-    date_str = datetime.now().strftime("%Y%m%d")
-    chunk_str = f"_{chunk_size // 1000}k" if chunk_size >= 1000 else f"_{chunk_size}"
-    lang_str = "es_conciso" if language == "Español Conciso" else "en_conciso"
-    return f"{base_name}_{lang_str}_{date_str}_{model}{chunk_str}.txt"
+# Trabajo en segundo plano de traducción de un documento (ver trabajos.py). `source` es el texto ingresado o el
+# archivo subido; antes de fragmentarlo se normaliza (encabezados y pies repetidos, líneas partidas, espacios,
+# marcado) para no pagar tokens que no aportan contenido. La traducción se vuelca a disco fragmento a fragmento
+# y el resultado del trabajo es la ruta de esa salida.
+def translation_job(informe, client, source, model, chunk_size, language, max_concurrency, doc_id):
+    if isinstance(source, str):
+        blocks = normalizar_bloques([source], model=model)
+    else:
+        blocks = normalizar_bloques(iter_document_blocks(source), detectar_formato(source.name, source.type), model)
+    output = VolcadoSalida(informe.ruta_salida(), separador="\n\n")
+    try:
+        path = process_text(client, blocks, model, chunk_size, language, max_concurrency, doc_id, informe, output)
+    except BaseException:
+        output.descartar()
+        raise
+    informe.nota(resumen_normalizacion(blocks.atributos))
+    return path
+
+# Identificador del texto ingresado en esta sesión para su manifiesto: las versiones sucesivas del texto de una
+# sesión comparten manifiesto sin mezclarse con las de otras sesiones. Se guarda en la URL para sobrevivir a las recargas.
+def manual_input_id():
+    if "texto_concis" not in st.query_params:
+        st.query_params["texto_concis"] = uuid.uuid4().hex
+    return st.query_params["texto_concis"]
 
 # Página principal para la traducción
 def main():
     st.title("Traductor Conciso")
     st.write("Sube un documento de texto o ingresa el texto directamente para traducirlo a una versión concisa en el idioma seleccionado.")
     
-    client = initialize_openai_client()
-    
     # Selección del idioma
     language_option = st.selectbox(
         "Selecciona el idioma para la traducción:",
         ("Español Conciso", "Inglés Conciso")
     )
     
-    # Selección del modelo
+    # Selección del modelo: la cascada traduce con el modelo rápido y escala al grande solo los fragmentos que
+    # no superan las comprobaciones de calidad (truncados, de longitud anómala o con listas incompletas)
     model_option = st.selectbox(
         "Selecciona el modelo para la traducción:",
-        ("gpt-4o-mini", "gpt-4o-2024-08-06")
+        (CASCADE, "gpt-4o-mini", "gpt-4o-2024-08-06"),
+        format_func=lambda model: f"Cascada ({' → '.join(CASCADE_MODELS)})" if model == CASCADE else model
     )
+    client = initialize_openai_client(model_option)
+    if not client:
+        return
     
     # Selección del tamaño de los fragmentos
     chunk_size = st.selectbox(
@@ -144,65 +192,59 @@ def main():
         index=0  # 5000 caracteres por defecto
     )
     
+    # Número de fragmentos que se traducen simultáneamente
+    max_concurrency = st.slider(
+        "Fragmentos traducidos en paralelo:",
+        min_value=1, max_value=16, value=MAX_EN_VUELO_POR_DEFECTO
+    )
+    
     # Opción 1: Subir archivo
     uploaded_file = st.file_uploader("Sube tu archivo de texto", type=["txt", "doc", "docx", "md", "pdf"])
     
     # Opción 2: Ingresar texto directamente
     user_text = st.text_area("O ingresa el texto a traducir")
     
+    # Trabajo de traducción asociado a la sesión: sigue en curso aunque la página se vuelva a ejecutar o se recargue
+    job_id = trabajo_de_sesion("concis")
+    file_name = None
+    
     if uploaded_file:
-        # Leer el texto del archivo según su tipo
-        text = ""
-        if uploaded_file.type == "text/plain":
-            text = uploaded_file.read().decode('utf-8')
-        elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            text = read_docx(uploaded_file)
-        elif uploaded_file.type == "text/markdown" or uploaded_file.name.endswith(".md"):
-            text = read_md(uploaded_file)
-        elif uploaded_file.type == "application/pdf":
-            text = read_pdf(uploaded_file)
-        else:
+        # El texto del archivo se extrae en el trabajo, como flujo de bloques, solo si hay que traducirlo
+        if detectar_formato(uploaded_file.name, uploaded_file.type) is None:
             st.error("Tipo de archivo no soportado.")
             return
-        
-        # Verificar si ya existe una traducción en el estado de la sesión
-        cache_key = f"{uploaded_file.name}_{language_option}"
-        if 'concise_translation' not in st.session_state or st.session_state.get('file_name') != cache_key:
-            st.session_state['concise_translation'] = process_text(client, text, model_option, chunk_size, language_option)
-            st.session_state['file_name'] = cache_key
-        
-        # Mostrar la traducción completa
-        if language_option == "Español Conciso":
-            st.header("Traducción Completa en Español Conciso")
+        file_name = os.path.splitext(uploaded_file.name)[0]
+    
+    # Botón para traducir: el trabajo solo se envía al pulsarlo. Se reutiliza el trabajo de este contenido y
+    # configuración si sigue en curso o terminó con éxito; los que fallaron o se interrumpieron se repiten.
+    if st.button("Traducir"):
+        if uploaded_file:
+            job_key = clave_trabajo(uploaded_file.name, language_option, model_option, chunk_size, hash_contenido(uploaded_file))
+            doc_id = document_id(uploaded_file.name, model_option, chunk_size, language_option)
+            job_id = enviar_trabajo("concis", job_key, translation_job, client, uploaded_file, model_option, chunk_size, language_option, max_concurrency, doc_id, reutilizar_completado=True)
+        elif user_text:
+            # Procesar el texto ingresado manualmente
+            job_key = clave_trabajo("manual_input", language_option, model_option, chunk_size, chunk_hash(user_text))
+            doc_id = document_id(f"manual_input:{manual_input_id()}", model_option, chunk_size, language_option)
+            job_id = enviar_trabajo("concis", job_key, translation_job, client, user_text, model_option, chunk_size, language_option, max_concurrency, doc_id, reutilizar_completado=True)
         else:
-            st.header("Complete Translation in Concise English")
-        st.text_area("Traducción", st.session_state['concise_translation'], height=300)
+            st.error("Por favor, sube un archivo o ingresa un texto para traducirlo.")
     
-        # Generar el nombre del archivo de descarga con los detalles adicionales
-        translated_file_name = generate_filename(os.path.splitext(uploaded_file.name)[0], model_option, chunk_size, language_option)
-    
-        # Botón para descargar la traducción
-        st.download_button("Descargar Traducción", st.session_state['concise_translation'].encode('utf-8'), translated_file_name)
-    
-    elif user_text:
-        # Procesar el texto ingresado manualmente
-        cache_key = "manual_input_" + language_option
-        if 'concise_translation' not in st.session_state or st.session_state.get('file_name') != cache_key:
-            st.session_state['concise_translation'] = process_text(client, user_text, model_option, chunk_size, language_option)
-            st.session_state['file_name'] = cache_key
-        
-        # Mostrar la traducción completa
+    # Mostrar el avance del trabajo y, al terminar, la traducción leída de disco página a página
+    job = mostrar_trabajo(job_id)
+    if job:
         if language_option == "Español Conciso":
             st.header("Traducción Completa en Español Conciso")
         else:
             st.header("Complete Translation in Concise English")
-        st.text_area("Traducción", st.session_state['concise_translation'], height=300)
     
         # Generar el nombre del archivo de descarga con los detalles adicionales
-        translated_file_name = generate_filename("traducción_concisa" if language_option == "Español Conciso" else "concise_translation", model_option, chunk_size, language_option)
+        if file_name is None:
+            file_name = "traducción_concisa" if language_option == "Español Conciso" else "concise_translation"
+        translated_file_name = generate_filename(file_name, model_option, chunk_size, language_option)
     
-        # Botón para descargar la traducción
-        st.download_button("Descargar Traducción", st.session_state['concise_translation'].encode('utf-8'), translated_file_name)
+        # Visor paginado y botón para descargar la traducción, que se lee del disco al pulsarlo
+        mostrar_salida(job["resultado"], "Traducción", translated_file_name, "Descargar Traducción")
 
 if __name__ == "__main__":
     main()
@@ -1,171 +1,118 @@
 import streamlit as st
-import os
-import fitz  # PyMuPDF para manejo de PDFs
-from docx import Document
-import markdown
-from openai import OpenAI
-
-# Inicializar el cliente OpenAI
-openai_client = OpenAI()
-
-# Configurar la clave API de OpenAI desde las variables de entorno
-openai_client.api_key = os.getenv("OPENAI_API_KEY")
-
-def generar_prompt_descomposicion(texto, arbol_referencial=None):
-    if arbol_referencial:
-        prompt = f"""
-## Task: Deepening the Provided Hierarchical Content Tree
-
-### Important Instructions:
-
-1. Start from the Provided Tree:
-   - Use the given reference tree as the foundation.
-   - Do not alter the initial structure of the tree.
-   - Only deepen the hierarchy further by breaking down the content into more granular, atomic units.
-
-2. Deepen Each Branch:
-   - Expand each branch of the provided tree by decomposing the text down to the most detailed level possible.
-   - The goal is to reach the atomic units of information for each segment of the tree.
-
-3. Line-by-Line Analysis:
-   - Perform the analysis on a line-by-line basis, ensuring that each line is fully broken down to the atomic level before moving to the next.
-   - Continue deepening until you reach the maximum level of detail possible.
-
-4. Output in Spanish:
-   - Ensure that all outputs, including titles, subtitles, and atomic units, are written in Spanish.
-
-### Reference Content Tree:
-{arbol_referencial}
-
-### Example of Expected Output:
-
-Given the following tree:
-```
-- Título General
-  - Título Principal 1
-    - Subtítulo 1.1
-```
-
-Expand it as follows:
-```
-- Título General
-  - Título Principal 1
-    - Subtítulo 1.1
-      - Unidad Atómica 1.1.1
-      - Unidad Atómica 1.1.2
-      - Unidad Atómica 1.1.3
-  - Título Principal 2
-    - Subtítulo 2.1
-      - Unidad Atómica 2.1.1
-      - Unidad Atómica 2.1.2
-```
-
-### Text to Decompose:
-<cont>{texto}</cont>
-
-### Execute:
-- Decompose the text provided by deepening the reference tree down to the atomic level for each branch.
-"""
-    else:
-        prompt = f"""
-## Task: Recursive Hierarchical Decomposition of Text
-
-### Steps:
-
-1. Analyze the Text:
-   - Read the text between `<cont>` tags. Ensure complete understanding.
-
-2. Define General Title:
-   - Create a clear, concise title that encapsulates the entire text.
-
-3. Perform Hierarchical Decomposition:
-   - Main Titles: Identify and define the main sections.
-   - Subtitles: Break down each main title into precise subtitles.
-   - Atomic Units: Further decompose each subtitle down to the most granular, atomic level. Ensure every line reaches this level.
-
-4. Structure the Hierarchy:
-   - Use dashes (`-`) to represent each level of the hierarchy.
-   - Indent properly to reflect subordination.
-   - Ensure each level is consistently detailed. Each title and subtitle must be fully broken down to atomic units.
-
-5. Line-by-Line Analysis:
-   - Perform the analysis on a line-by-line basis, ensuring that each line is fully broken down to the atomic level before moving to the next.
-   - Continue deepening until you reach the maximum level of detail possible.
-
-6. Output in Spanish:
-   - Ensure that all outputs, including titles, subtitles, and atomic units, are written in Spanish.
-
-### Guidelines:
-
-- Be Concise: Titles and subtitles must be short, descriptive, and devoid of redundancy.
-- Consistency: Maintain uniform detail across all levels.
-- Classify Unclear Content: Any ambiguous sections go under "Others."
-- Exclude Irrelevant Information: Disregard non-essential elements like metadata or side notes.
-
-### Example of Expected Output:
-```
-- Título General
-  - Título Principal 1
-    - Subtítulo 1.1
-      - Unidad Atómica 1.1.1
-      - Unidad Atómica 1.1.2
-  - Título Principal 2
-    - Subtítulo 2.1
-      - Unidad Atómica 2.1.1
-```
-
-### Text to Decompose:
-<cont>{texto}</cont>
-"""
-    return prompt
-
-def procesar_texto_con_openai(texto, arbol_referencial=None):
+from clientes import obtener_cliente
+from llm import completar_chat, transmitir_chat
+from fragmentacion import contar_tokens, calcular_presupuesto_entrada
+from concurrencia import ejecutar_en_orden, MAX_EN_VUELO_POR_DEFECTO
+from ingesta import detectar_formato, extraer_documento
+from instrumentacion import tramo
+from normalizacion import normalizar_documento, normalizar_texto, resumen_normalizacion
+from trabajos import Informe, clave_trabajo, consumir_flujo, enviar_trabajo, trabajo_de_sesion, mostrar_trabajo
+from arbol import Arbol
+from descomposicion import (
+    MODELO_DESCOMPOSICION, MAX_TOKENS_DESCOMPOSICION, TOKENS_POR_SECCION,
+    preparar_solicitud_descomposicion, dividir_en_secciones, descomponer_seccion, fusionar_arboles,
+    fuentes_de_ramas, profundizar_rama
+)
+
+# Obtener el cliente OpenAI compartido del proceso para el modelo de descomposición (ver clientes.py)
+def cliente_openai():
+    return obtener_cliente(MODELO_DESCOMPOSICION)
+
+# Función para descomponer un documento extenso por secciones: las secciones se descomponen en paralelo
+# y los árboles parciales se fusionan en una sola jerarquía. El avance y los errores se notifican a `informe`.
+def descomponer_por_secciones(texto, tokens_por_seccion=TOKENS_POR_SECCION, max_concurrencia=MAX_EN_VUELO_POR_DEFECTO, informe=None):
+    informe = informe or Informe()
+    with tramo("fragmentacion") as atributos:
+        secciones = dividir_en_secciones(texto, tokens_por_seccion)
+        atributos["secciones"] = len(secciones)
+    informe.progreso(0.0, f"Descomponiendo {len(secciones)} secciones...")
+
+    def al_completar(indice, resultado, error, completados):
+        if error is not None:
+            informe.aviso(f"Error al descomponer la sección {indice + 1}: {error}")
+        informe.progreso(completados / len(secciones), f"Sección {indice + 1} lista ({completados}/{len(secciones)})")
+
+    openai_client = cliente_openai()
+    arboles, errores = ejecutar_en_orden(lambda seccion: descomponer_seccion(openai_client, seccion), secciones, max_en_vuelo=max_concurrencia, al_completar=al_completar)
+    arboles = [arbol for arbol in arboles if arbol]
+    if not arboles:
+        return ""
+    if len(arboles) == 1:
+        return arboles[0]
+    informe.progreso(1.0, "Fusionando los árboles parciales...")
     try:
-        prompt = generar_prompt_descomposicion(texto, arbol_referencial)
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": "Eres un asistente de IA para análisis de texto y estructuración de contenido."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=16000,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
-        return response.choices[0].message.content
+        with tramo("ensamblado", arboles=len(arboles)):
+            return fusionar_arboles(openai_client, arboles)
     except Exception as e:
-        st.error(f"Error al procesar el texto con OpenAI: {str(e)}")
-        return ""
-
+        informe.aviso(f"Error al fusionar los árboles parciales: {str(e)}")
+        return "\n".join(arboles)
+
+# Función para profundizar el árbol referencial por ramas: cada rama principal se profundiza en paralelo con el
+# texto fuente que le corresponde y los resultados se injertan bajo el título general original, en el orden del
+# árbol. Las ramas que fallan se conservan sin profundizar. El avance y los errores se notifican a `informe`.
+def profundizar_por_ramas(texto, arbol_referencial, max_concurrencia=MAX_EN_VUELO_POR_DEFECTO, informe=None):
+    informe = informe or Informe()
+    titulo, ramas = Arbol.desde_cadena(arbol_referencial).dividir_en_ramas()
+    informe.progreso(0.0, "Seleccionando el texto de cada rama...")
+    with tramo("seleccion", ramas=len(ramas)):
+        fuentes = fuentes_de_ramas(texto, ramas)
+    informe.progreso(0.0, f"Profundizando {len(ramas)} ramas...")
+
+    def al_completar(indice, resultado, error, completados):
+        if error is not None:
+            informe.aviso(f"Error al profundizar la rama {indice + 1}; se conserva sin profundizar: {error}")
+        informe.progreso(completados / len(ramas), f"Rama {indice + 1} lista ({completados}/{len(ramas)})")
+
+    openai_client = cliente_openai()
+    ramas_profundizadas, errores = ejecutar_en_orden(
+        lambda indice: profundizar_rama(
+            openai_client, ramas[indice], fuentes[indice], " > ".join(filter(None, [titulo, ramas[indice].textos[0]]))
+        ),
+        range(len(ramas)), max_en_vuelo=max_concurrencia, al_completar=al_completar
+    )
+    with tramo("ensamblado", ramas=len(ramas)):
+        resultado = Arbol()
+        if titulo is not None:
+            resultado.agregar(0, titulo)
+        for rama, profundizada in zip(ramas, ramas_profundizadas):
+            resultado.injertar(profundizada or rama, 1 if titulo is not None else 0)
+        return resultado.a_texto()
+
+# Trabajo en segundo plano de descomposición (ver trabajos.py): por secciones en paralelo, por ramas del árbol
+# referencial en paralelo, en flujo (el árbol parcial se publica a medida que se genera) o en una sola solicitud
+def trabajo_descomposicion(informe, texto, arbol_referencial, por_secciones, por_ramas, tokens_por_seccion, max_concurrencia, en_flujo):
+    if por_secciones:
+        return descomponer_por_secciones(texto, tokens_por_seccion, max_concurrencia, informe)
+    if por_ramas and len(Arbol.desde_cadena(arbol_referencial).dividir_en_ramas()[1]) > 1:
+        return profundizar_por_ramas(texto, arbol_referencial, max_concurrencia, informe)
+    solicitud = preparar_solicitud_descomposicion(texto, arbol_referencial)
+    if en_flujo:
+        return consumir_flujo(transmitir_chat(cliente_openai(), **solicitud), informe)
+    return completar_chat(cliente_openai(), **solicitud)["contenido"]
+
+# Funciones para leer un archivo subido y normalizar su texto (encabezados y pies repetidos, líneas partidas,
+# espacios y marcado), que no aporta contenido y sí tokens de entrada. Devuelven (texto, estadísticas).
 def leer_pdf(archivo_pdf):
     try:
-        bytes_pdf = archivo_pdf.read()
-        doc = fitz.open(stream=bytes_pdf, filetype="pdf")
-        texto = ""
-        for pagina in doc:
-            texto += pagina.get_text()
-        return texto
+        return normalizar_documento(extraer_documento(archivo_pdf, tipo="application/pdf"), MODELO_DESCOMPOSICION)
     except Exception as e:
         st.error(f"Error al leer el archivo PDF: {str(e)}")
-        return ""
+        return "", None
 
 def leer_docx(archivo_docx):
     try:
-        doc = Document(archivo_docx)
-        return "\n".join([p.text for p in doc.paragraphs])
+        return normalizar_documento(extraer_documento(archivo_docx, tipo="application/vnd.openxmlformats-officedocument.wordprocessingml.document"), MODELO_DESCOMPOSICION)
     except Exception as e:
         st.error(f"Error al leer el archivo DOCX: {str(e)}")
-        return ""
+        return "", None
 
+# El markdown se pasa a texto sin marcado (antes se convertía a HTML, que añadía las etiquetas como tokens)
 def leer_markdown(archivo_md):
     try:
-        texto_md = archivo_md.read().decode("utf-8")
-        return markdown.markdown(texto_md)
+        return normalizar_documento(extraer_documento(archivo_md, tipo="text/markdown"), MODELO_DESCOMPOSICION)
     except Exception as e:
         st.error(f"Error al leer el archivo Markdown: {str(e)}")
-        return ""
+        return "", None
 
 def main():
     st.title("Descomponedor de Contenidos")
@@ -180,34 +127,64 @@ def main():
     # Entrada opcional del árbol referencial
     arbol_referencial = st.text_area("Ingresa el árbol de contenidos referencial (opcional):")
 
+    # Profundizar cada rama principal del árbol referencial por separado y en paralelo, con solo el texto que le corresponde
+    por_ramas = bool(arbol_referencial) and st.checkbox("Profundizar cada rama del árbol referencial en paralelo", value=True)
+
     texto_a_procesar = ""
+    normalizacion = None
 
     # Verifica si el usuario ingresó texto manualmente o subió un archivo
     if texto_ingresado:
-        texto_a_procesar = texto_ingresado
+        texto_a_procesar, normalizacion = normalizar_texto(texto_ingresado, model=MODELO_DESCOMPOSICION)
     elif archivo_subido:
-        if archivo_subido.type == "application/pdf":
-            texto_a_procesar = leer_pdf(archivo_subido)
-        elif archivo_subido.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            texto_a_procesar = leer_docx(archivo_subido)
-        elif archivo_subido.type == "text/markdown":
-            texto_a_procesar = leer_markdown(archivo_subido)
+        # Los archivos ya analizados se recuperan de la caché de documentos en cada nueva ejecución
+        formato = detectar_formato(archivo_subido.name, archivo_subido.type)
+        if formato == "pdf":
+            texto_a_procesar, normalizacion = leer_pdf(archivo_subido)
+        elif formato == "docx":
+            texto_a_procesar, normalizacion = leer_docx(archivo_subido)
+        elif formato == "md":
+            texto_a_procesar, normalizacion = leer_markdown(archivo_subido)
         else:
             try:
-                texto_a_procesar = archivo_subido.getvalue().decode("utf-8")
+                texto_a_procesar, normalizacion = normalizar_texto(archivo_subido.getvalue().decode("utf-8"), "txt", MODELO_DESCOMPOSICION)
             except Exception as e:
                 st.error(f"Error al leer el archivo de texto: {str(e)}")
 
+    # Tokens de entrada que se ahorran al normalizar el texto
+    if normalizacion and normalizacion["tokens_ahorrados"] > 0:
+        st.caption(resumen_normalizacion(normalizacion))
+
+    # Mostrar la respuesta a medida que se genera
+    en_flujo = st.checkbox("Mostrar el resultado mientras se genera", value=True)
+
+    # Los textos más extensos que una sección se descomponen por secciones en paralelo y luego se fusionan
+    with st.expander("Documentos extensos"):
+        tokens_por_seccion = st.number_input("Tokens por sección:", min_value=1000, max_value=100000, value=TOKENS_POR_SECCION, step=1000)
+        max_concurrencia = st.slider("Secciones o ramas procesadas en paralelo:", min_value=1, max_value=16, value=MAX_EN_VUELO_POR_DEFECTO)
+
+    # Trabajo de descomposición asociado a la sesión: sigue en curso aunque la página se vuelva a ejecutar o se recargue
+    id_trabajo = trabajo_de_sesion("descom")
+
     # Botón para procesar el texto
     if st.button("Procesar Texto"):
         if texto_a_procesar:
-            with st.spinner("Procesando..."):
-                resultado = procesar_texto_con_openai(texto_a_procesar, arbol_referencial)
-            if resultado:
-                st.success("Texto procesado exitosamente!")
-                st.text_area("Resultado:", value=resultado, height=300)
+            # Advertir si el texto no cabe en la ventana de contexto del modelo
+            tokens_texto = contar_tokens(texto_a_procesar, MODELO_DESCOMPOSICION)
+            presupuesto = calcular_presupuesto_entrada(MODELO_DESCOMPOSICION, MAX_TOKENS_DESCOMPOSICION, ratio_salida=0)
+            por_secciones = not arbol_referencial and tokens_texto > tokens_por_seccion
+            if tokens_texto > presupuesto and not por_secciones and not por_ramas:
+                st.warning(f"El texto tiene unos {tokens_texto} tokens y supera los {presupuesto} que admite el modelo; el resultado puede quedar incompleto.")
+            parametros = (texto_a_procesar, arbol_referencial, por_secciones, por_ramas, tokens_por_seccion, max_concurrencia, en_flujo)
+            id_trabajo = enviar_trabajo("descom", clave_trabajo(*parametros), trabajo_descomposicion, *parametros)
         else:
             st.error("Por favor, ingresa un texto o sube un archivo para continuar.")
 
+    # Mostrar el avance del trabajo (y el árbol a medida que se genera) y, al terminar, el resultado
+    trabajo = mostrar_trabajo(id_trabajo)
+    if trabajo and trabajo["resultado"]:
+        st.success("Texto procesado exitosamente!")
+        st.text_area("Resultado:", value=trabajo["resultado"], height=300)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
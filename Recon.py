@@ -1,27 +1,62 @@
 import streamlit as st
-import openai
-import os
-from io import StringIO
-
-# Función para inicializar el cliente de OpenAI
+import re
+from llm import completar_chat, transmitir_chat
+from fragmentacion import contar_tokens, calcular_presupuesto_entrada
+from corpus import CorpusFuente
+from concurrencia import ejecutar_en_orden, MAX_EN_VUELO_POR_DEFECTO
+from arbol import Arbol
+from ingesta import extraer_documento
+from instrumentacion import tramo
+from normalizacion import normalizar_documento, normalizar_texto, resumen_normalizacion
+from clientes import obtener_cliente
+from trabajos import Informe, clave_trabajo, consumir_flujo, enviar_trabajo, trabajo_de_sesion, mostrar_trabajo
+
+# Función para obtener el cliente de OpenAI compartido del proceso (ver clientes.py)
 def initialize_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    client = obtener_cliente(RECONSTRUCTION_MODEL)
+    if not client:
         st.error("API Key de OpenAI no configurada. Verifica la variable de entorno.")
         return None
-    return openai.OpenAI(api_key=api_key)
+    return client
+
+# Formatos admitidos para los archivos de entrada
+SUPPORTED_TYPES = ["txt", "pdf", "docx", "md"]
 
-# Cargar contenido desde uno o varios archivos o desde una entrada de texto
-def load_content(files=None, text_input=None, placeholder="", height=200):
+# Cargar contenido desde uno o varios archivos (TXT, PDF, DOCX o MD) o desde una entrada de texto.
+# El texto extraído de cada archivo se guarda en la caché de documentos, así que no se vuelve a analizar en cada ejecución.
+# Con `normalize`, el texto se normaliza (encabezados y pies repetidos, líneas partidas, espacios, marcado) y se
+# muestra cuántos tokens de entrada se ahorran; no se usa con el árbol, cuyas líneas y sangrías importan.
+def load_content(files=None, text_input=None, placeholder="", height=200, normalize=False):
     content = ""
+    savings = []
     if files:
+        parts = []
         for file in files:
             if file is not None:
-                content += StringIO(file.getvalue().decode("utf-8")).read() + "\n"
-    elif text_input:
-        content = text_input
+                try:
+                    document = extraer_documento(file)
+                except Exception as e:
+                    st.error(f"Error al leer el archivo {file.name}: {e}")
+                    continue
+                if document is None:
+                    st.error(f"Tipo de archivo no soportado: {file.name}")
+                    continue
+                if normalize:
+                    text, statistics = normalizar_documento(document, RECONSTRUCTION_MODEL)
+                    savings.append(statistics)
+                    parts.append(text + "\n")
+                else:
+                    parts.append(document["texto"] + "\n")
+        content = "".join(parts)
     else:
-        content = st.text_area(placeholder, height=height)
+        content = text_input or st.text_area(placeholder, height=height)
+        if normalize and content:
+            content, statistics = normalizar_texto(content, model=RECONSTRUCTION_MODEL)
+            savings.append(statistics)
+    if savings and sum(statistics["tokens_ahorrados"] for statistics in savings) > 0:
+        st.caption(resumen_normalizacion({
+            key: sum(statistics[key] for statistics in savings) for key in ("tokens_antes", "tokens_despues", "tokens_ahorrados")
+        }))
     return content
 
 # Función para generar el prompt para el modelo de OpenAI
@@ -61,25 +96,102 @@ Steps:
 Important: The final text must be exhaustive, detailed, and faithful to the source. Each line must be treated with maximum depth.
 """
 
-# Función para realizar la reconstrucción del texto utilizando OpenAI
-def reconstruct_text(client, prompt):
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-2024-08-06",  # Ajustar al modelo adecuado
-            messages=[
-                {"role": "system", "content": "Eres un asistente de IA que ayuda a reconstruir textos."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0,
-            max_tokens=16383,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"Error al reconstruir el texto: {e}")
-        return None
+# Modelo y salida máxima de la reconstrucción
+RECONSTRUCTION_MODEL = "gpt-4o-2024-08-06"  # Ajustar al modelo adecuado
+RECONSTRUCTION_MAX_TOKENS = 16383
+
+# Parámetros de la solicitud de reconstrucción, compartidos por el modo completo y el modo en flujo
+def build_request(prompt):
+    return dict(
+        model=RECONSTRUCTION_MODEL,
+        messages=[
+            {"role": "system", "content": "Eres un asistente de IA que ayuda a reconstruir textos."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0,
+        max_tokens=RECONSTRUCTION_MAX_TOKENS,
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0
+    )
+
+# Presupuesto de texto fuente por rama (en tokens) y pasajes consultados por cada línea del árbol
+BRANCH_SOURCE_TOKENS = 12000
+PASSAGES_PER_LINE = 3
+
+# Crear el corpus indexado de los textos fuente: los archivos subidos (normalizados) o, si no hay, el texto ingresado
+def build_corpus(files=None, text_source=""):
+    texts = []
+    for file in files or []:
+        document = extraer_documento(file) if file is not None else None
+        if document is not None:
+            texts.append((file.name, normalizar_documento(document, RECONSTRUCTION_MODEL)[0]))
+    if not texts:
+        texts = [("texto_fuente", text_source)]
+    with tramo("indexacion", archivos=len(texts)) as attributes:
+        corpus = CorpusFuente.desde_textos(texts)
+        attributes["pasajes"] = len(corpus)
+    return corpus
+
+# Función para seleccionar los pasajes del corpus relevantes para una rama del árbol: se consultan los mejores
+# pasajes de cada línea y se conservan los de mayor puntuación hasta el presupuesto, en el orden del corpus
+def select_passages(branch, corpus, max_tokens=BRANCH_SOURCE_TOKENS):
+    return corpus.seleccionar(branch.textos, max_tokens, RECONSTRUCTION_MODEL, PASSAGES_PER_LINE)
+
+# Función para bajar un nivel los títulos markdown de un texto (p. ej. `#` pasa a `##`)
+def demote_headings(text):
+    lines = []
+    in_code = False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        elif not in_code and re.match(r"#{1,5}\s", line):
+            line = "#" + line
+        lines.append(line)
+    return "\n".join(lines)
+
+# Función para reconstruir el texto por ramas: cada rama principal del árbol se reconstruye en paralelo
+# con solo los pasajes del corpus fuente relevantes para ella, y los resultados se ensamblan en el orden del árbol.
+# El avance y los errores se notifican a `informe`.
+def reconstruct_by_branches(client, tree_structure, corpus, max_concurrency=MAX_EN_VUELO_POR_DEFECTO, informe=None):
+    informe = informe or Informe()
+    root, branches = Arbol.desde_cadena(tree_structure).dividir_en_ramas()
+    with tramo("seleccion", ramas=len(branches)):
+        prompts = [create_prompt(branch.a_texto(), select_passages(branch, corpus)) for branch in branches]
+
+    informe.progreso(0.0, f"Reconstruyendo {len(branches)} ramas...")
+
+    def on_branch_done(index, result, error, completed):
+        if error is not None:
+            informe.aviso(f"Error al reconstruir la rama {index + 1}: {error}")
+        informe.progreso(completed / len(branches), f"Rama {index + 1} lista ({completed}/{len(branches)})")
+
+    results, errors = ejecutar_en_orden(
+        lambda prompt: completar_chat(client, **build_request(prompt))["contenido"],
+        prompts,
+        max_en_vuelo=max_concurrency,
+        al_completar=on_branch_done
+    )
+
+    with tramo("ensamblado", ramas=len(branches)):
+        sections = [f"# {root}"] if root else []
+        for i, result in enumerate(results):
+            if i in errors:
+                result = f"# {branches[i].textos[0]}\n\n[Rama sin reconstruir: {errors[i]}]"
+            sections.append(demote_headings(result) if root else result)
+        return "\n\n".join(sections)
+
+# Trabajo en segundo plano de reconstrucción (ver trabajos.py): por ramas en paralelo o en una sola solicitud,
+# publicando el texto a medida que se genera si se pide el resultado en flujo
+def reconstruction_job(informe, client, tree_structure, text_files, text_source, by_branches, stream_output, max_concurrency):
+    if by_branches and len(Arbol.desde_cadena(tree_structure).dividir_en_ramas()[1]) > 1:
+        informe.progreso(0.0, "Indexando el texto fuente...")
+        with build_corpus(text_files, text_source) as corpus:
+            return reconstruct_by_branches(client, tree_structure, corpus, max_concurrency, informe)
+    request = build_request(create_prompt(tree_structure, text_source))
+    if stream_output:
+        return consumir_flujo(transmitir_chat(client, **request), informe)
+    return completar_chat(client, **request)["contenido"]
 
 # Página principal para la reconstrucción de textos
 def main():
@@ -94,30 +206,46 @@ def main():
     tree_input_option = st.radio("¿Cómo deseas ingresar la estructura del árbol?", ("Subir archivo", "Escribir manualmente"))
 
     if tree_input_option == "Subir archivo":
-        tree_file = st.file_uploader("Sube el archivo con el Árbol de Contenidos", type=["txt"])
+        tree_file = st.file_uploader("Sube el archivo con el Árbol de Contenidos", type=["txt", "md"])
         tree_structure = load_content(files=[tree_file])
     else:
         tree_structure = st.text_area("Introduce la estructura del árbol aquí...", height=200)
 
     # Cargar textos fuente (pueden ser múltiples archivos)
-    text_files = st.file_uploader("Sube los archivos con el Texto Fuente (puedes subir múltiples archivos)", type=["txt"], accept_multiple_files=True)
-    text_source = load_content(files=text_files, placeholder="Introduce el texto fuente aquí...")
+    text_files = st.file_uploader("Sube los archivos con el Texto Fuente (puedes subir múltiples archivos)", type=SUPPORTED_TYPES, accept_multiple_files=True)
+    text_source = load_content(files=text_files, placeholder="Introduce el texto fuente aquí...", normalize=True)
+
+    # Mostrar el texto a medida que se genera
+    stream_output = st.checkbox("Mostrar el texto mientras se genera", value=True)
+
+    # Reconstruir cada rama principal por separado y en paralelo, con solo el texto fuente relevante
+    by_branches = st.checkbox("Reconstruir por ramas en paralelo", value=True)
+    max_concurrency = st.slider("Ramas reconstruidas en paralelo:", min_value=1, max_value=16, value=MAX_EN_VUELO_POR_DEFECTO)
+
+    # Trabajo de reconstrucción asociado a la sesión: sigue en curso aunque la página se vuelva a ejecutar o se recargue
+    job_id = trabajo_de_sesion("recon")
 
     # Botón para iniciar la reconstrucción del texto
     if st.button("Reconstruir Texto"):
-        with st.spinner("Trabajando en la reconstrucción del texto..."):
-            prompt = create_prompt(tree_structure, text_source)
-            reconstructed_text = reconstruct_text(client, prompt)
-            
-            if reconstructed_text:
-                st.markdown("### Texto Reconstruido")
-                st.markdown(reconstructed_text)
-                
-                st.download_button(
-                    label="Descargar Texto Reconstruido",
-                    data=reconstructed_text.encode('utf-8'),
-                    file_name="texto_reconstruido.txt",
-                    mime="text/plain"
-                )
+        if not (by_branches and len(Arbol.desde_cadena(tree_structure).dividir_en_ramas()[1]) > 1):
+            # Advertir si el árbol y el texto fuente no caben en la ventana de contexto del modelo
+            prompt_tokens = contar_tokens(create_prompt(tree_structure, text_source), RECONSTRUCTION_MODEL)
+            budget = calcular_presupuesto_entrada(RECONSTRUCTION_MODEL, RECONSTRUCTION_MAX_TOKENS, ratio_salida=0)
+            if prompt_tokens > budget:
+                st.warning(f"El árbol y el texto fuente suman unos {prompt_tokens} tokens y superan los {budget} que admite el modelo; el resultado puede quedar incompleto.")
+        job_key = clave_trabajo(tree_structure, text_source, by_branches, stream_output, max_concurrency)
+        job_id = enviar_trabajo("recon", job_key, reconstruction_job, client, tree_structure, text_files, text_source, by_branches, stream_output, max_concurrency)
+
+    # Mostrar el avance del trabajo (y el texto a medida que se genera) y, al terminar, el texto reconstruido
+    job = mostrar_trabajo(job_id)
+    if job and job["resultado"]:
+        st.markdown("### Texto Reconstruido")
+        st.markdown(job["resultado"])
+        st.download_button(
+            label="Descargar Texto Reconstruido",
+            data=job["resultado"].encode('utf-8'),
+            file_name="texto_reconstruido.txt",
+            mime="text/plain"
+        )
 
 # Nota: El bloque if __name__ == "__main__": no es necesario en este archivo.
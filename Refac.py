@@ -1,45 +1,36 @@
 import streamlit as st
-import os
-from openai import OpenAI
+from llm import completar_chat, transmitir_chat
+from arbol import Arbol, injertar_en_esqueleto
+from clientes import obtener_cliente
+from concurrencia import ejecutar_en_orden, MAX_EN_VUELO_POR_DEFECTO
+from corpus import extraer_terminos
+from fragmentacion import contar_tokens
+from instrumentacion import tramo
+from trabajos import Informe, clave_trabajo, consumir_flujo, enviar_trabajo, trabajo_de_sesion, mostrar_trabajo
 
-# Inicializar el cliente OpenAI
-def initialize_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        st.error("API Key de OpenAI no configurada. Verifica la variable de entorno.")
-        return None
-    return OpenAI(api_key=api_key)
+# Modelo utilizado para la refactorización y salida máxima de cada solicitud
+REFACTORING_MODEL = "gpt-4o-2024-08-06"
+MAX_REFACTORING_TOKENS = 16000
 
-def main():
-    # Inicializar cliente de OpenAI
-    openai_client = initialize_openai_client()
-    if not openai_client:
-        return
+# Tamaño máximo (en tokens) de los árboles de entrada de cada grupo temático en la refactorización por grupos
+TOKENS_POR_GRUPO = 4000
 
-    # Título de la aplicación
-    st.title("Refactorización de Árboles de Contenido")
+# Fracción mínima de los términos de una rama presentes en un grupo para considerarla del mismo tema
+SIMILITUD_MINIMA = 0.2
 
-    # Descripción de la aplicación
-    st.write("Esta aplicación toma uno o más árboles de contenido, una finalidad específica y especificaciones adicionales para generar un árbol refactorizado.")
+# Separador entre el árbol y el resumen de cambios en las respuestas de cada grupo
+SEPARADOR_CAMBIOS = "### Cambios"
 
-    # Entrada del usuario: Árboles de contenido
-    arboles_input = st.text_area("Introduce los árboles de contenido (en formato JSON o texto estructurado):")
-
-    # Entrada del usuario: Finalidad
-    finalidad_input = st.text_input("Finalidad específica:")
-
-    # Entrada del usuario: Especificaciones
-    especificaciones_input = st.text_area("Especificaciones adicionales (en formato texto o JSON):")
+# Obtener el cliente OpenAI compartido del proceso (ver clientes.py)
+def initialize_openai_client():
+    client = obtener_cliente(REFACTORING_MODEL)
+    if not client:
+        st.error("API Key de OpenAI no configurada. Verifica la variable de entorno.")
+        return None
+    return client
 
-    # Botón para generar el árbol refactorizado
-    if st.button("Generar Árbol Refactorizado"):
-        if arboles_input and finalidad_input and especificaciones_input:
-            try:
-                response = openai_client.chat.completions.create(
-                    model="gpt-4o-2024-08-06",
-                    messages=[
-                        {"role": "system", "content": "Eres un asistente experto en la organización y estructuración de contenidos..."},
-                        {"role": "user", "content": f"""
+# Pasos de la refactorización, comunes a la solicitud única y a la refactorización por grupos
+REFACTORING_STEPS = """
 ### Instructions:
 
 1. Analyze Content:
@@ -65,7 +56,11 @@ def main():
    - Step 1: Check tree for completeness and coherence.
    - Step 2: Get feedback on internal consistency. Adjust as needed.
    - Step 3: Perform final review. Correct errors and inconsistencies.
+"""
 
+# Función para generar el prompt de refactorización
+def create_prompt(arboles_input, finalidad_input, especificaciones_input):
+    return f"""{REFACTORING_STEPS}
 Output Format:
 - Hierarchical content tree with uppercase titles for top levels, sublevels as bullet points.
 - Include a brief summary of significant changes per section.
@@ -74,16 +69,278 @@ Inputs:
 - Content Trees: <trees>{arboles_input}</trees>
 - Purpose: <purpose>{finalidad_input}</purpose>
 - Specifications: <specs>{especificaciones_input}</specs>
-                    """}
-                    ]
-                )
-                # Mostrar el árbol refactorizado en un text area
-                st.subheader("Árbol Refactorizado:")
-                st.text_area("Resultado", response.choices[0].message.content, height=300)
-            except Exception as e:
-                st.error(f"Error al llamar a la API de OpenAI: {e}")
+                    """
+
+# Función para generar el prompt de refactorización de un grupo temático de ramas
+def create_group_prompt(arboles_input, finalidad_input, especificaciones_input, grupo, total):
+    return f"""{REFACTORING_STEPS}
+Output Format:
+- Hierarchical content tree using dashes (`-`) and two-space indentation, with uppercase titles for top levels.
+- These trees are group {grupo} of {total} of a larger set; the groups are ordered and joined in a later step, so do not add a general title.
+- After the tree, write a line `{SEPARADOR_CAMBIOS}` followed by a brief summary of significant changes per section.
+
+Inputs:
+- Content Trees: <trees>{arboles_input}</trees>
+- Purpose: <purpose>{finalidad_input}</purpose>
+- Specifications: <specs>{especificaciones_input}</specs>
+"""
+
+# Función para generar el prompt que ordena las secciones refactorizadas por grupos en un solo árbol
+def create_ordering_prompt(esqueleto, finalidad_input, especificaciones_input):
+    return f"""
+## Task: Order Refactored Sections into a Single Content Tree
+
+The following skeleton lists the top-level sections of a content tree that was refactored in independent thematic groups.
+Each line `[n] Title` (followed by some of its subtitles) stands for a complete branch that will be grafted automatically later.
+
+### Instructions:
+
+1. Write a general title aligned with the purpose as the first line: `- TÍTULO GENERAL`.
+2. Reference every item exactly once, as a line `- [n]` indented under the general title.
+3. Order the items to best serve the purpose. Items on the same topic may be grouped under a new, short uppercase parent title.
+4. Do not invent content. Use dashes (`-`) and two-space indentation. Output only the tree, in Spanish.
+
+### Skeleton:
+{esqueleto}
+
+### Purpose:
+{finalidad_input}
+
+### Specifications:
+{especificaciones_input}
+"""
+
+# Parámetros de la solicitud de refactorización, compartidos por el modo completo y el modo en flujo
+def build_request(arboles_input, finalidad_input, especificaciones_input):
+    return dict(
+        model=REFACTORING_MODEL,
+        messages=[
+            {"role": "system", "content": "Eres un asistente experto en la organización y estructuración de contenidos..."},
+            {"role": "user", "content": create_prompt(arboles_input, finalidad_input, especificaciones_input)}
+        ],
+        max_tokens=MAX_REFACTORING_TOKENS
+    )
+
+# Función para partir un árbol en ramas que quepan en el presupuesto de tokens de un grupo: las ramas principales
+# que lo superan se dividen en sus hijos, que guardan la ruta de títulos desde la rama principal.
+# Devuelve [(ruta, rama, tokens)] en el orden del árbol.
+def split_branches(arbol, tokens_por_grupo=TOKENS_POR_GRUPO):
+    _, ramas = arbol.dividir_en_ramas()
+    pendientes = [([], rama) for rama in reversed(ramas)]
+    unidades = []
+    while pendientes:
+        ruta, rama = pendientes.pop()
+        tokens = contar_tokens(rama.a_texto(), REFACTORING_MODEL)
+        if tokens > tokens_por_grupo and len(rama) > 1:
+            pendientes.extend((ruta + [rama.textos[0]], rama.subarbol(hijo)) for hijo in reversed(rama.hijos(0)))
+        else:
+            unidades.append((ruta, rama, tokens))
+    return unidades
+
+# Función para agrupar las ramas por tema sin superar el presupuesto de tokens de cada grupo: cada rama (de mayor a
+# menor) se une al grupo en el que quepa que contenga más de sus términos, o abre un grupo nuevo si ninguno se le
+# parece; después, los grupos pequeños se reúnen con el más parecido en el que quepan.
+# Devuelve los grupos como listas de posiciones de `unidades`, en el orden del árbol.
+def group_branches(unidades, tokens_por_grupo=TOKENS_POR_GRUPO):
+    terminos = [set(extraer_terminos(" ".join(ruta + rama.textos))) for ruta, rama, _ in unidades]
+    grupos = []  # [posiciones, términos, tokens]
+
+    def parecido(terminos_rama, grupo):
+        return len(terminos_rama & grupo[1]) / len(terminos_rama) if terminos_rama else 0.0
+
+    def mejor_grupo(terminos_rama, tokens, candidatos, minimo):
+        mejor, mejor_parecido = None, minimo
+        for grupo in candidatos:
+            if grupo[2] + tokens <= tokens_por_grupo and parecido(terminos_rama, grupo) >= mejor_parecido:
+                mejor, mejor_parecido = grupo, parecido(terminos_rama, grupo)
+        return mejor
+
+    for posicion in sorted(range(len(unidades)), key=lambda i: -unidades[i][2]):
+        grupo = mejor_grupo(terminos[posicion], unidades[posicion][2], grupos, SIMILITUD_MINIMA)
+        if grupo is None:
+            grupos.append([[posicion], set(terminos[posicion]), unidades[posicion][2]])
+        else:
+            grupo[0].append(posicion)
+            grupo[1] |= terminos[posicion]
+            grupo[2] += unidades[posicion][2]
+
+    # Reunir los grupos pequeños, del menor al mayor, con el grupo más parecido en el que quepan
+    grupos.sort(key=lambda grupo: grupo[2])
+    for grupo in list(grupos):
+        otros = [otro for otro in grupos if otro is not grupo]
+        destino = mejor_grupo(grupo[1], grupo[2], otros, 0.0)
+        if destino is not None:
+            destino[0].extend(grupo[0])
+            destino[1] |= grupo[1]
+            destino[2] += grupo[2]
+            grupos.remove(grupo)
+    return sorted((sorted(grupo[0]) for grupo in grupos), key=lambda posiciones: posiciones[0])
+
+# Función para reconstruir el árbol de un grupo a partir de sus ramas, reuniendo bajo un mismo nodo las que comparten ruta
+def group_tree(unidades):
+    arbol = Arbol()
+    for ruta, rama, _ in unidades:
+        for profundidad, texto in enumerate(ruta):
+            arbol.agregar(profundidad, texto)
+        arbol.injertar(rama, len(ruta))
+    return arbol.fusionado()[0]
+
+# Función para refactorizar un grupo de ramas; devuelve (ramas refactorizadas, resumen de cambios)
+def refactor_group(openai_client, arbol, finalidad_input, especificaciones_input, grupo, total):
+    respuesta = completar_chat(
+        openai_client,
+        model=REFACTORING_MODEL,
+        messages=[
+            {"role": "system", "content": "Eres un asistente experto en la organización y estructuración de contenidos..."},
+            {"role": "user", "content": create_group_prompt(arbol.a_texto(), finalidad_input, especificaciones_input, grupo, total)}
+        ],
+        max_tokens=MAX_REFACTORING_TOKENS
+    )
+    arbol_texto, _, cambios = respuesta["contenido"].partition(SEPARADOR_CAMBIOS)
+    refactorizado = Arbol.desde_texto(arbol_texto)
+    if respuesta["finish_reason"] == "length" or not len(refactorizado):
+        raise ValueError("la respuesta quedó incompleta")
+    return [refactorizado.subarbol(raiz) for raiz in refactorizado.raices()], cambios.strip()
+
+# Función para ordenar las ramas refactorizadas por grupos: un único paso del modelo, que solo recibe los títulos,
+# decide el título general y el orden, y después se injertan localmente las ramas completas
+def order_branches(openai_client, ramas, finalidad_input, especificaciones_input):
+    lineas = []
+    for i, rama in enumerate(ramas):
+        subtitulos = "; ".join(rama.textos[hijo] for hijo in rama.hijos(0)[:3])
+        lineas.append(f"[{i + 1}] {rama.textos[0]}" + (f" ({subtitulos})" if subtitulos else ""))
+    respuesta = completar_chat(
+        openai_client,
+        model=REFACTORING_MODEL,
+        messages=[
+            {"role": "system", "content": "Eres un asistente experto en la organización y estructuración de contenidos..."},
+            {"role": "user", "content": create_ordering_prompt("\n".join(lineas), finalidad_input, especificaciones_input)}
+        ],
+        temperature=0,
+        max_tokens=4000
+    )["contenido"]
+    return injertar_en_esqueleto(respuesta, ramas)
+
+# Función para refactorizar árboles extensos por grupos: los árboles se fusionan localmente (ramas repetidas o con la
+# misma ruta), se reparten en grupos temáticos que caben en `tokens_por_grupo`, los grupos se refactorizan en paralelo
+# y un último paso ordena sus secciones. Si todo cabe en un grupo, se hace una sola solicitud (en flujo si se pide).
+# El avance y los errores se notifican a `informe`.
+def refactor_by_groups(openai_client, arboles_input, finalidad_input, especificaciones_input, tokens_por_grupo=TOKENS_POR_GRUPO,
+                       max_concurrencia=MAX_EN_VUELO_POR_DEFECTO, en_flujo=False, informe=None):
+    informe = informe or Informe()
+    with tramo("fragmentacion") as atributos:
+        entrada = Arbol.desde_cadena(arboles_input)
+        arbol, repetidas = entrada.fusionado()
+        unidades = split_branches(arbol, tokens_por_grupo)
+        grupos = [group_tree([unidades[posicion] for posicion in grupo]) for grupo in group_branches(unidades, tokens_por_grupo)]
+        atributos.update(nodos_entrada=len(entrada), nodos=len(arbol), ramas_repetidas=repetidas, grupos=len(grupos))
+    if len(arbol) < len(entrada):
+        informe.nota(f"Las ramas repetidas o con la misma ruta se fusionaron: {len(entrada)} nodos de entrada, {len(arbol)} tras fusionarlas.")
+
+    if len(grupos) <= 1:
+        solicitud = build_request(arbol.a_texto(), finalidad_input, especificaciones_input)
+        if en_flujo:
+            return consumir_flujo(transmitir_chat(openai_client, **solicitud), informe)
+        return completar_chat(openai_client, **solicitud)["contenido"]
+
+    informe.progreso(0.0, f"Refactorizando {len(grupos)} grupos temáticos...")
+
+    def al_completar(indice, resultado, error, completados):
+        if error is not None:
+            informe.aviso(f"Error al refactorizar el grupo {indice + 1}; se conservan sus ramas sin refactorizar: {error}")
+        informe.progreso(completados / len(grupos), f"Grupo {indice + 1} listo ({completados}/{len(grupos)})")
+
+    resultados, errores = ejecutar_en_orden(
+        lambda elemento: refactor_group(openai_client, elemento[1], finalidad_input, especificaciones_input, elemento[0] + 1, len(grupos)),
+        enumerate(grupos), max_en_vuelo=max_concurrencia, al_completar=al_completar
+    )
+    ramas, cambios = [], []
+    for grupo, resultado in zip(grupos, resultados):
+        if resultado is None:
+            ramas.extend(grupo.subarbol(raiz) for raiz in grupo.raices())
+        else:
+            ramas.extend(resultado[0])
+            if resultado[1]:
+                cambios.append(resultado[1])
+
+    informe.progreso(1.0, "Ordenando las secciones refactorizadas...")
+    try:
+        with tramo("ensamblado", ramas=len(ramas)):
+            arbol_final = order_branches(openai_client, ramas, finalidad_input, especificaciones_input)
+    except Exception as e:
+        informe.aviso(f"Error al ordenar las secciones refactorizadas: {str(e)}")
+        arbol_final = Arbol()
+        for rama in ramas:
+            arbol_final.injertar(rama)
+    # Un título repartido entre varios grupos llega en varias ramas: se fusionan como en descomposicion.profundizar_rama
+    arbol_final = arbol_final.fusionado(min_nodos=None)[0]
+    resumen = "\n\n".join(cambios)
+    return arbol_final.a_texto() + (f"\n\n{SEPARADOR_CAMBIOS}\n{resumen}" if resumen else "")
+
+# Trabajo en segundo plano de refactorización (ver trabajos.py). Los árboles reconocibles (con guiones o en JSON)
+# se refactorizan por grupos; el resto del texto se envía tal cual en una sola solicitud. En flujo, el árbol de una
+# sola solicitud se publica a medida que se genera.
+def trabajo_refactorizacion(informe, openai_client, arboles_input, finalidad_input, especificaciones_input, tokens_por_grupo, max_concurrencia, en_flujo):
+    if len(Arbol.desde_cadena(arboles_input)):
+        return refactor_by_groups(
+            openai_client, arboles_input, finalidad_input, especificaciones_input, tokens_por_grupo, max_concurrencia, en_flujo, informe
+        )
+    solicitud = build_request(arboles_input, finalidad_input, especificaciones_input)
+    if en_flujo:
+        return consumir_flujo(transmitir_chat(openai_client, **solicitud), informe)
+    return completar_chat(openai_client, **solicitud)["contenido"]
+
+def main():
+    # Inicializar cliente de OpenAI
+    openai_client = initialize_openai_client()
+    if not openai_client:
+        return
+
+    # Título de la aplicación
+    st.title("Refactorización de Árboles de Contenido")
+
+    # Descripción de la aplicación
+    st.write("Esta aplicación toma uno o más árboles de contenido, una finalidad específica y especificaciones adicionales para generar un árbol refactorizado.")
+
+    # Entrada del usuario: Árboles de contenido
+    arboles_input = st.text_area("Introduce los árboles de contenido (en formato JSON o texto estructurado):")
+
+    # Entrada del usuario: Finalidad
+    finalidad_input = st.text_input("Finalidad específica:")
+
+    # Entrada del usuario: Especificaciones
+    especificaciones_input = st.text_area("Especificaciones adicionales (en formato texto o JSON):")
+
+    # Mostrar el árbol a medida que se genera
+    en_flujo = st.checkbox("Mostrar el árbol mientras se genera", value=True)
+
+    # Los árboles que no caben en un grupo se refactorizan por grupos temáticos en paralelo y luego se ordenan
+    with st.expander("Árboles extensos"):
+        tokens_por_grupo = st.number_input("Tokens por grupo:", min_value=500, max_value=50000, value=TOKENS_POR_GRUPO, step=500)
+        max_concurrencia = st.slider("Grupos procesados en paralelo:", min_value=1, max_value=16, value=MAX_EN_VUELO_POR_DEFECTO)
+
+    # Trabajo de refactorización asociado a la sesión: sigue en curso aunque la página se vuelva a ejecutar o se recargue
+    id_trabajo = trabajo_de_sesion("refac")
+
+    # Botón para generar el árbol refactorizado
+    if st.button("Generar Árbol Refactorizado"):
+        if arboles_input and finalidad_input and especificaciones_input:
+            parametros = (arboles_input, finalidad_input, especificaciones_input, tokens_por_grupo, max_concurrencia, en_flujo)
+            id_trabajo = enviar_trabajo("refac", clave_trabajo(*parametros), trabajo_refactorizacion, openai_client, *parametros)
         else:
             st.warning("Por favor, completa todos los campos antes de generar el árbol refactorizado.")
 
+    # Mostrar el avance del trabajo (y el árbol a medida que se genera) y, al terminar, el árbol refactorizado
+    trabajo = mostrar_trabajo(id_trabajo)
+    if trabajo:
+        resultado = trabajo["resultado"]
+        # Mostrar el árbol refactorizado en un text area
+        st.subheader("Árbol Refactorizado:")
+        st.text_area("Resultado", resultado, height=300)
+        # Comparar el tamaño de los árboles de entrada y del resultado
+        arbol_entrada = Arbol.desde_cadena(arboles_input)
+        arbol_resultado = Arbol.desde_cadena(resultado)
+        st.caption(f"Árboles de entrada: {len(arbol_entrada)} nodos · Árbol refactorizado: {len(arbol_resultado)} nodos")
+
 if __name__ == "__main__":
     main()
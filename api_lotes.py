@@ -0,0 +1,286 @@
+# Modo diferido con la Batch API de OpenAI: las solicitudes de chat de un corpus se escriben en archivos JSONL con un
+# identificador estable por solicitud, se envían como lotes, se consultan hasta que terminan y sus respuestas se
+# devuelven por identificador. Los lotes no consumen la cuota de las llamadas interactivas y cuestan la mitad;
+# a cambio, pueden tardar hasta 24 h, por lo que solo se usan en el procesamiento por lotes (ver lote.py).
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cache_llm import DIRECTORIO_CACHE, calcular_clave, obtener_cache
+from instrumentacion import tramo
+
+# Endpoint y ventana de finalización de los lotes
+ENDPOINT = "/v1/chat/completions"
+VENTANA = "24h"
+
+# Límites de cada archivo de entrada (la API admite 50 000 solicitudes y 200 MB por lote)
+MAX_SOLICITUDES_POR_ARCHIVO = int(os.getenv("TEXTEADOR_LOTE_MAX_SOLICITUDES", "50000"))
+MAX_BYTES_POR_ARCHIVO = int(float(os.getenv("TEXTEADOR_LOTE_MAX_MB", "190")) * 1024 * 1024)
+
+# Segundos entre consultas del estado de los lotes
+INTERVALO_SONDEO = float(os.getenv("TEXTEADOR_LOTE_SONDEO_S", "30"))
+
+# Reintentos del cliente en las llamadas de archivos y lotes, que no pasan por el limitador de chat
+REINTENTOS = 3
+
+# Directorio de los archivos JSONL y del estado de los lotes enviados
+DIRECTORIO_LOTES = os.path.join(DIRECTORIO_CACHE, "lotes_api")
+
+ESTADOS_FINALES = ("completed", "failed", "expired", "cancelled")
+
+# Función para calcular un identificador estable (custom_id) a partir de las partes que identifican la solicitud:
+# el mismo documento, posición y contenido producen siempre el mismo identificador
+def identificador_solicitud(prefijo, *partes):
+    resumen = hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{prefijo}-{resumen[:32]}"
+
+# Función para calcular la clave de una solicitud de chat en la caché de respuestas (la misma que usa llm.completar_chat)
+def _clave_cache(solicitud):
+    parametros = {clave: valor for clave, valor in solicitud.items() if clave not in ("model", "messages")}
+    return calcular_clave(solicitud["model"], solicitud["messages"], parametros)
+
+# Función para escribir las solicitudes (pares identificador, solicitud) en uno o más archivos JSONL de entrada,
+# respetando los límites de solicitudes y bytes por archivo. Devuelve [(ruta, identificadores)].
+def escribir_archivos(solicitudes, directorio, nombre, max_solicitudes=MAX_SOLICITUDES_POR_ARCHIVO, max_bytes=MAX_BYTES_POR_ARCHIVO):
+    os.makedirs(directorio, exist_ok=True)
+    archivos = []
+    archivo = None
+    bytes_escritos = 0
+    try:
+        for identificador, solicitud in solicitudes:
+            linea = json.dumps(
+                {"custom_id": identificador, "method": "POST", "url": ENDPOINT, "body": solicitud}, ensure_ascii=False
+            ) + "\n"
+            tamano = len(linea.encode("utf-8"))
+            if archivo is None or len(archivos[-1][1]) >= max_solicitudes or bytes_escritos + tamano > max_bytes:
+                if archivo is not None:
+                    archivo.close()
+                ruta = os.path.join(directorio, f"{nombre}-{len(archivos) + 1:03d}.jsonl")
+                archivo = open(ruta, "w", encoding="utf-8")
+                archivos.append((ruta, []))
+                bytes_escritos = 0
+            archivo.write(linea)
+            archivos[-1][1].append(identificador)
+            bytes_escritos += tamano
+    finally:
+        if archivo is not None:
+            archivo.close()
+    return archivos
+
+# Función para leer un archivo de resultados o de errores de un lote.
+# Devuelve (respuestas, errores): identificador -> resultado con el formato de llm.completar_chat, e identificador -> mensaje.
+def leer_resultados(texto):
+    respuestas, errores = {}, {}
+    for linea in texto.splitlines():
+        if not linea.strip():
+            continue
+        registro = json.loads(linea)
+        identificador = registro["custom_id"]
+        respuesta = registro.get("response") or {}
+        cuerpo = respuesta.get("body") or {}
+        if registro.get("error") or respuesta.get("status_code") != 200:
+            error = registro.get("error") or cuerpo.get("error") or {}
+            errores[identificador] = f"{error.get('code') or respuesta.get('status_code')}: {error.get('message', 'error desconocido')}"
+            continue
+        choice = cuerpo["choices"][0]
+        uso = cuerpo.get("usage") or {}
+        respuestas[identificador] = {
+            "contenido": choice["message"].get("content") or "",
+            "finish_reason": choice.get("finish_reason"),
+            "uso": {"prompt_tokens": uso.get("prompt_tokens", 0), "completion_tokens": uso.get("completion_tokens", 0)},
+            "modelo": cuerpo.get("model"),
+        }
+    return respuestas, errores
+
+# Estado de los lotes enviados para un conjunto de solicitudes, guardado en disco para que un lote interrumpido
+# durante la espera retome los lotes ya enviados en lugar de volver a enviarlos. Solo guarda los identificadores y
+# el estado de cada lote; los resultados de cada uno van a su propio archivo JSONL (ver guardar_resultados).
+class EstadoLotes:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.lotes = []
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as archivo:
+                self.lotes = json.load(archivo)["lotes"]
+
+    def guardar(self):
+        temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"lotes": self.lotes}, archivo, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+    def eliminar(self):
+        for lote in self.lotes:
+            for ruta in (lote["archivo"], lote["resultados"]):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+# Función para subir el archivo de entrada de un lote
+def subir_archivo(cliente, ruta):
+    with open(ruta, "rb") as archivo:
+        return cliente.files.create(file=archivo, purpose="batch")
+
+# Función para buscar el lote ya creado con un archivo de entrada y unos metadatos, por si la ejecución se
+# interrumpió entre la creación del lote y el guardado de su estado. Los lotes se listan del más reciente al más
+# antiguo y la búsqueda se detiene en los creados antes de subir el archivo (`desde`, según el reloj de la API).
+def buscar_lote(cliente, id_archivo, metadatos, desde):
+    for lote in cliente.batches.list(limit=100):
+        if lote.created_at < desde:
+            break
+        if lote.input_file_id == id_archivo and (lote.metadata or {}) == metadatos:
+            return lote
+    return None
+
+# Funciones para guardar y leer los resultados de un lote terminado en un archivo JSONL propio, con una línea por
+# solicitud: {"custom_id", "respuesta"} o {"custom_id", "error"}
+def guardar_resultados(ruta, respuestas, errores):
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        for identificador, respuesta in respuestas.items():
+            archivo.write(json.dumps({"custom_id": identificador, "respuesta": respuesta}, ensure_ascii=False) + "\n")
+        for identificador, error in errores.items():
+            archivo.write(json.dumps({"custom_id": identificador, "error": error}, ensure_ascii=False) + "\n")
+    os.replace(temporal, ruta)
+
+def cargar_resultados(ruta):
+    respuestas, errores = {}, {}
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            registro = json.loads(linea)
+            if "respuesta" in registro:
+                respuestas[registro["custom_id"]] = registro["respuesta"]
+            else:
+                errores[registro["custom_id"]] = registro["error"]
+    return respuestas, errores
+
+# Función para descargar y leer los archivos de resultados y de errores de un lote terminado
+def descargar_resultados(cliente, lote):
+    respuestas, errores = {}, {}
+    for id_archivo in (lote["output_file_id"], lote["error_file_id"]):
+        if id_archivo:
+            nuevas, fallidas = leer_resultados(cliente.files.content(id_archivo).text)
+            respuestas.update(nuevas)
+            errores.update(fallidas)
+    # Las solicitudes sin resultado (lote fallido o cancelado antes de procesarlas) se informan como errores
+    for identificador in lote["solicitudes"]:
+        if identificador not in respuestas and identificador not in errores:
+            errores[identificador] = lote.get("error") or f"lote {lote['estado']}"
+    return respuestas, errores
+
+# Función para resolver un conjunto de solicitudes de chat con la Batch API.
+# `solicitudes` asocia identificador estable -> solicitud (modelo, mensajes y parámetros, como en llm.completar_chat).
+# Las solicitudes ya presentes en la caché de respuestas no se envían y las idénticas se envían una sola vez; las
+# respuestas recibidas se guardan en la caché, de modo que las herramientas interactivas también las reutilizan.
+# `al_avanzar(lotes)` se invoca tras cada consulta con el estado de los lotes.
+# Devuelve (respuestas, errores, estadisticas): identificador -> resultado de llm.completar_chat e identificador -> mensaje.
+def resolver_solicitudes(cliente, solicitudes, nombre="lote", directorio=None, intervalo=INTERVALO_SONDEO, al_avanzar=None):
+    directorio = directorio or DIRECTORIO_LOTES
+    cliente = cliente.with_options(max_retries=REINTENTOS)
+    cache = obtener_cache()
+    claves = {identificador: _clave_cache(solicitud) for identificador, solicitud in solicitudes.items()}
+    respuestas, errores = {}, {}
+
+    # Solicitudes pendientes: una por contenido distinto que no esté en la caché
+    representantes = {}
+    for identificador, clave in claves.items():
+        guardado = cache.obtener(clave) if cache else None
+        if guardado is not None:
+            respuestas[identificador] = dict(guardado, desde_cache=True)
+        else:
+            representantes.setdefault(clave, identificador)
+    estadisticas = {
+        "solicitudes": len(solicitudes), "desde_cache": len(respuestas),
+        "duplicadas": len(solicitudes) - len(respuestas) - len(representantes), "enviadas": len(representantes),
+        "lotes": 0, "tokens": 0,
+    }
+    if not representantes:
+        return respuestas, errores, estadisticas
+
+    # El estado se identifica por el contenido de las solicitudes pendientes: la misma ejecución retoma sus lotes
+    firma = hashlib.sha256(json.dumps(sorted(representantes.items())).encode("utf-8")).hexdigest()[:16]
+    os.makedirs(directorio, exist_ok=True)
+    estado = EstadoLotes(os.path.join(directorio, f"{nombre}-{firma}.json"))
+    with tramo("api_lotes", solicitudes=len(representantes), retomado=bool(estado.lotes)) as atributos:
+        if not estado.lotes:
+            archivos = escribir_archivos(
+                ((identificador, solicitudes[identificador]) for identificador in representantes.values()),
+                directorio, f"{nombre}-{firma}"
+            )
+            for ruta, identificadores in archivos:
+                estado.lotes.append({
+                    "archivo": ruta, "resultados": f"{os.path.splitext(ruta)[0]}.resultados.jsonl",
+                    "solicitudes": identificadores, "id_archivo": None, "subido": None, "id": None, "estado": "pendiente",
+                    "output_file_id": None, "error_file_id": None, "error": None, "descargado": False,
+                })
+            estado.guardar()
+
+        # El archivo subido se guarda en el estado antes de crear su lote; si la ejecución se interrumpió después de
+        # crearlo, el lote se recupera por su archivo y sus metadatos en lugar de enviarlo otra vez
+        for numero, lote in enumerate(estado.lotes, 1):
+            if lote["id"] is not None:
+                continue
+            metadatos = {"texteador": nombre, "firma": firma, "parte": str(numero)}
+            creado = None
+            if lote["id_archivo"] is None:
+                subido = subir_archivo(cliente, lote["archivo"])
+                lote.update(id_archivo=subido.id, subido=subido.created_at)
+                estado.guardar()
+            else:
+                creado = buscar_lote(cliente, lote["id_archivo"], metadatos, lote["subido"])
+            if creado is None:
+                creado = cliente.batches.create(
+                    input_file_id=lote["id_archivo"], endpoint=ENDPOINT, completion_window=VENTANA, metadata=metadatos
+                )
+            lote.update(id=creado.id, estado=creado.status)
+            estado.guardar()
+
+        # Consultar los lotes hasta que todos terminen; los resultados de cada uno se descargan a su archivo al
+        # terminar, por si la ejecución se interrumpe antes de que terminen los demás
+        resueltas = {}
+        while True:
+            for lote in estado.lotes:
+                if lote["descargado"]:
+                    continue
+                actual = cliente.batches.retrieve(lote["id"])
+                lote.update(estado=actual.status, output_file_id=actual.output_file_id, error_file_id=actual.error_file_id)
+                if actual.request_counts:
+                    lote["completadas"] = actual.request_counts.completed + actual.request_counts.failed
+                if actual.errors and actual.errors.data:
+                    lote["error"] = "; ".join(error.message or error.code or "" for error in actual.errors.data)
+                if lote["estado"] in ESTADOS_FINALES:
+                    guardar_resultados(lote["resultados"], *descargar_resultados(cliente, lote))
+                    lote["descargado"] = True
+                    estado.guardar()
+            if al_avanzar:
+                al_avanzar(estado.lotes)
+            if all(lote["descargado"] for lote in estado.lotes):
+                break
+            time.sleep(intervalo)
+
+        for lote in estado.lotes:
+            nuevas, fallidas = cargar_resultados(lote["resultados"])
+            resueltas.update(nuevas)
+            for identificador, resultado in nuevas.items():
+                estadisticas["tokens"] += resultado["uso"]["prompt_tokens"] + resultado["uso"]["completion_tokens"]
+                if cache:
+                    cache.guardar(claves[identificador], resultado)
+            errores.update(fallidas)
+        estadisticas["lotes"] = len(estado.lotes)
+        atributos.update(lotes=len(estado.lotes), errores=len(errores), tokens=estadisticas["tokens"])
+
+    # Repartir la respuesta de cada contenido entre todos los identificadores que lo pidieron; solo la solicitud
+    # enviada cuenta como nueva, las duplicadas se marcan como reutilizadas
+    for identificador, clave in claves.items():
+        representante = representantes.get(clave)
+        if representante is None or identificador in respuestas:
+            continue
+        if representante in resueltas:
+            respuestas[identificador] = dict(resueltas[representante], desde_cache=identificador != representante)
+        else:
+            errores[identificador] = errores.get(representante, "sin resultado")
+    estado.eliminar()
+    return respuestas, errores, estadisticas
@@ -1,22 +1,67 @@
 # app.py
 
 import streamlit as st
-import Concis  # Página 1: Traductor a Español Conciso
-import Descom  # Página 2: Descomposición de Contenidos
-import Recon   # Página 3: Reconstrucción de Texto
-import Refac  # Página 4: Refactorización de Árboles de Contenido
+from cache_llm import obtener_cache
+from instrumentacion import ejecucion, iniciar_servidor_metricas, tramo
+from paginas import (
+    PAGINAS, PRECARGAR, PRECALENTAR_CLIENTES, cargar_pagina, nombre_herramienta, precargar_paginas, precalentar_clientes
+)
+from trabajos import trabajo_de_sesion, traza_de_trabajo
+
+# Publicar las métricas en formato Prometheus si TEXTEADOR_METRICAS_PUERTO está definido
+iniciar_servidor_metricas()
+
+# Con TEXTEADOR_PRECALENTAR, los clientes de la API se crean y abren sus conexiones en segundo plano
+if PRECALENTAR_CLIENTES:
+    precalentar_clientes()
 
 # Configuración de la barra lateral
 st.sidebar.title("Utilidades")
 st.sidebar.markdown("### Selecciona una herramienta:")
-seleccion = st.sidebar.radio("", ["Concisión", "Descomposición", "Reconstrucción", "Refactorización"])
-
-# Navegación entre las aplicaciones/páginas
-if seleccion == "Concisión":
-    Concis.main()  # Llamar a la función principal de la primera página
-elif seleccion == "Descomposición":
-    Descom.main()  # Llamar a la función principal de la segunda página
-elif seleccion == "Reconstrucción":
-    Recon.main()  # Llamar a la función principal de la tercera página
-elif seleccion == "Refactorización":
-    Refac.main()  # Llamar a la función principal de la cuarta página
+seleccion = st.sidebar.radio("", list(PAGINAS))
+
+# Navegación entre las aplicaciones/páginas: el módulo de la página elegida se importa la primera vez que se
+# necesita y cada ejecución registra los tiempos de sus etapas
+with ejecucion(nombre_herramienta(seleccion)) as traza:
+    with st.spinner("Cargando la herramienta..."), tramo("importacion", pagina=seleccion) as atributos:
+        pagina, segundos_importacion = cargar_pagina(seleccion)
+        atributos["desde_cache"] = segundos_importacion is None
+    pagina.main()  # Llamar a la función principal de la página elegida
+if segundos_importacion is not None or len(traza.tramos) > 1:
+    st.session_state["ultima_traza"] = traza
+
+# Los trabajos en segundo plano registran su propia traza al terminar: si el trabajo de la sesión terminó después
+# de la última ejecución registrada, el panel muestra sus etapas
+traza_trabajo = traza_de_trabajo(trabajo_de_sesion(nombre_herramienta(seleccion)))
+if traza_trabajo and traza_trabajo.inicio >= getattr(st.session_state.get("ultima_traza"), "inicio", 0):
+    st.session_state["ultima_traza"] = traza_trabajo
+
+# Con TEXTEADOR_PRECARGAR_PAGINAS, las demás páginas se importan en segundo plano tras mostrar la primera
+if PRECARGAR:
+    precargar_paginas()
+
+# Panel de tiempos de la última ejecución que hizo trabajo (extracción, fragmentación, llamadas a la API...)
+ultima_traza = st.session_state.get("ultima_traza")
+if ultima_traza:
+    st.sidebar.markdown("### Última ejecución")
+    st.sidebar.caption(f"{ultima_traza.herramienta} · {ultima_traza.duracion:.1f} s en total")
+    st.sidebar.dataframe(
+        [
+            {
+                "Etapa": etapa["etapa"], "Tramos": etapa["tramos"], "Total (s)": etapa["total_s"], "p95 (s)": etapa["p95_s"],
+                "Espera (s)": etapa["espera_s"], "Tokens": etapa["tokens_prompt"] + etapa["tokens_completion"],
+                "Caché": etapa["aciertos_cache"], "Reintentos": etapa["reintentos"],
+            }
+            for etapa in ultima_traza.resumen()
+        ],
+        hide_index=True
+    )
+
+# Estado de la caché persistente de respuestas de la API
+cache = obtener_cache()
+if cache:
+    estadisticas = cache.estadisticas()
+    st.sidebar.caption(
+        f"Caché de respuestas: {estadisticas['aciertos']} aciertos / {estadisticas['fallos']} fallos "
+        f"en este proceso · {estadisticas['entradas']} entradas ({estadisticas['bytes'] // 1024} KB)"
+    )
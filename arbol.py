@@ -0,0 +1,318 @@
+import json
+import re
+from array import array
+
+# Claves reconocidas en los árboles en formato JSON
+CLAVES_TITULO = ("titulo", "título", "title", "nombre", "name", "texto", "text", "tema")
+CLAVES_HIJOS = ("hijos", "children", "subtemas", "subtitulos", "subtítulos", "items", "nodos", "nodes")
+
+# Vista ligera de un nodo: solo guarda el árbol y la posición, los datos viven en los arreglos del árbol
+class Nodo:
+    __slots__ = ("arbol", "indice")
+
+    def __init__(self, arbol, indice):
+        self.arbol = arbol
+        self.indice = indice
+
+    @property
+    def texto(self):
+        return self.arbol.textos[self.indice]
+
+    @property
+    def profundidad(self):
+        return self.arbol.profundidades[self.indice]
+
+    @property
+    def padre(self):
+        padre = self.arbol.padres[self.indice]
+        return None if padre < 0 else Nodo(self.arbol, padre)
+
+    def hijos(self):
+        return [Nodo(self.arbol, indice) for indice in self.arbol.hijos(self.indice)]
+
+    def __repr__(self):
+        return f"Nodo({self.indice}, {self.texto!r})"
+
+# Árbol de contenidos guardado en arreglos paralelos en preorden (texto, padre y profundidad de cada nodo).
+# En preorden, el subárbol de un nodo ocupa un rango contiguo de posiciones, lo que permite extraer, contar
+# y recorrer ramas sin estructuras anidadas.
+class Arbol:
+    __slots__ = ("textos", "padres", "profundidades", "_fines", "_ultimo_por_profundidad")
+
+    def __init__(self):
+        self.textos = []
+        self.padres = array("i")
+        self.profundidades = array("H")
+        self._fines = None
+        self._ultimo_por_profundidad = []
+
+    # Añadir un nodo al final (en preorden). La profundidad se limita a un nivel por debajo del nodo anterior.
+    def agregar(self, profundidad, texto):
+        profundidad = max(0, min(profundidad, len(self._ultimo_por_profundidad)))
+        del self._ultimo_por_profundidad[profundidad:]
+        padre = self._ultimo_por_profundidad[-1] if profundidad else -1
+        indice = len(self.textos)
+        self.textos.append(texto)
+        self.padres.append(padre)
+        self.profundidades.append(profundidad)
+        self._ultimo_por_profundidad.append(indice)
+        self._fines = None
+        return indice
+
+    # Añadir una copia de otro árbol colgando a la profundidad indicada
+    def injertar(self, otro, profundidad=0):
+        for texto, profundidad_otro in zip(otro.textos, otro.profundidades):
+            self.agregar(profundidad + profundidad_otro, texto)
+
+    # Crear un árbol a partir de un texto con guiones (`-`, `*` o `+`) e indentación; se ignoran las demás líneas
+    @classmethod
+    def desde_texto(cls, texto_arbol):
+        arbol = cls()
+        sangrias = []
+        for linea in texto_arbol.splitlines():
+            contenido = linea.expandtabs(2)
+            texto = contenido.lstrip()
+            if not texto or texto[0] not in "-*+":
+                continue
+            sangria = len(contenido) - len(texto)
+            while sangrias and sangrias[-1] > sangria:
+                sangrias.pop()
+            if not sangrias or sangrias[-1] < sangria:
+                sangrias.append(sangria)
+            arbol.agregar(len(sangrias) - 1, texto[1:].strip())
+        return arbol
+
+    # Crear un árbol a partir de JSON (cadena u objeto ya cargado): nodos con título e hijos,
+    # diccionarios de título -> hijos o listas de nodos
+    @classmethod
+    def desde_json(cls, datos):
+        if isinstance(datos, str):
+            datos = json.loads(datos)
+        arbol = cls()
+        pendientes = [(datos, 0)]
+        while pendientes:
+            valor, profundidad = pendientes.pop()
+            if isinstance(valor, list):
+                pendientes.extend((elemento, profundidad) for elemento in reversed(valor))
+            elif isinstance(valor, dict):
+                clave_titulo = _primera_clave(valor, CLAVES_TITULO)
+                if clave_titulo is not None:
+                    arbol.agregar(profundidad, str(valor[clave_titulo]))
+                    clave_hijos = _primera_clave(valor, CLAVES_HIJOS)
+                    if clave_hijos is not None:
+                        pendientes.append((valor[clave_hijos], profundidad + 1))
+                else:
+                    for clave, hijos in reversed(list(valor.items())):
+                        pendientes.append(((clave, hijos), profundidad))
+            elif isinstance(valor, tuple):
+                titulo, hijos = valor
+                arbol.agregar(profundidad, str(titulo))
+                if hijos not in (None, "", [], {}):
+                    pendientes.append((hijos, profundidad + 1))
+            elif valor is not None:
+                arbol.agregar(profundidad, str(valor))
+        return arbol
+
+    # Crear un árbol detectando el formato: JSON si lo parece y es válido, texto con guiones en otro caso
+    @classmethod
+    def desde_cadena(cls, texto):
+        contenido = texto.strip()
+        if contenido[:1] in ("{", "["):
+            try:
+                return cls.desde_json(contenido)
+            except ValueError:
+                pass
+        return cls.desde_texto(texto)
+
+    def __len__(self):
+        return len(self.textos)
+
+    def __iter__(self):
+        return (Nodo(self, indice) for indice in range(len(self.textos)))
+
+    # Posición siguiente al último nodo del subárbol de cada nodo (calculada en una pasada y guardada)
+    def _fin(self, indice):
+        if self._fines is None:
+            total = len(self.textos)
+            fines = array("i", [total]) * total
+            pila = []
+            for posicion, profundidad in enumerate(self.profundidades):
+                while pila and self.profundidades[pila[-1]] >= profundidad:
+                    fines[pila.pop()] = posicion
+                pila.append(posicion)
+            self._fines = fines
+        return self._fines[indice]
+
+    def raices(self):
+        return [indice for indice, padre in enumerate(self.padres) if padre < 0]
+
+    def hijos(self, indice):
+        hijos = []
+        posicion, fin = indice + 1, self._fin(indice)
+        while posicion < fin:
+            hijos.append(posicion)
+            posicion = self._fin(posicion)
+        return hijos
+
+    # Número de nodos del subárbol de un nodo (incluido él mismo)
+    def tamano_subarbol(self, indice):
+        return self._fin(indice) - indice
+
+    # Copia del subárbol de un nodo como árbol independiente
+    def subarbol(self, indice):
+        fin = self._fin(indice)
+        base = self.profundidades[indice]
+        nuevo = Arbol()
+        nuevo.textos = self.textos[indice:fin]
+        nuevo.profundidades = array("H", (profundidad - base for profundidad in self.profundidades[indice:fin]))
+        nuevo.padres = array("i", (padre - indice if padre >= indice else -1 for padre in self.padres[indice:fin]))
+        nuevo._ultimo_por_profundidad = _ultimos_por_profundidad(nuevo)
+        return nuevo
+
+    # Textos desde la raíz hasta un nodo
+    def ruta(self, indice):
+        ruta = []
+        while indice >= 0:
+            ruta.append(self.textos[indice])
+            indice = self.padres[indice]
+        ruta.reverse()
+        return ruta
+
+    # Buscar un nodo por su ruta de textos desde la raíz; devuelve su posición o None
+    def buscar_ruta(self, ruta):
+        candidatos = self.raices()
+        indice = None
+        for texto in ruta:
+            indice = next((candidato for candidato in candidatos if self.textos[candidato] == texto), None)
+            if indice is None:
+                return None
+            candidatos = self.hijos(indice)
+        return indice
+
+    # Número de nodos por profundidad
+    def contar_por_profundidad(self):
+        conteo = {}
+        for profundidad in self.profundidades:
+            conteo[profundidad] = conteo.get(profundidad, 0) + 1
+        return conteo
+
+    # Separar el árbol en su título general y sus ramas principales (como árboles independientes).
+    # Si hay una única raíz, las ramas son sus hijos; si no, cada raíz es una rama.
+    def dividir_en_ramas(self):
+        raices = self.raices()
+        if len(raices) == 1 and len(self) > 1:
+            return self.textos[0], [self.subarbol(hijo) for hijo in self.hijos(0)]
+        return None, [self.subarbol(raiz) for raiz in raices]
+
+    # Identificadores de ruta de cada nodo: rutas iguales (mismos textos desde la raíz) comparten identificador
+    def _identificadores_ruta(self, tabla):
+        identificadores = array("i")
+        for padre, texto in zip(self.padres, self.textos):
+            clave = (identificadores[padre] if padre >= 0 else -1, texto)
+            identificador = tabla.get(clave)
+            if identificador is None:
+                identificador = tabla[clave] = len(tabla)
+            identificadores.append(identificador)
+        return identificadores
+
+    # Diferencias con otro árbol por rutas: nodos agregados en `otro` y nodos eliminados respecto de este
+    def diferencias(self, otro):
+        tabla = {}
+        propios = self._identificadores_ruta(tabla)
+        ajenos = otro._identificadores_ruta(tabla)
+        conjunto_propio, conjunto_ajeno = set(propios), set(ajenos)
+        agregados = [otro.ruta(i) for i, identificador in enumerate(ajenos) if identificador not in conjunto_propio]
+        eliminados = [self.ruta(i) for i, identificador in enumerate(propios) if identificador not in conjunto_ajeno]
+        return {"agregados": agregados, "eliminados": eliminados}
+
+    # Copia del árbol con las ramas fusionadas: los nodos hermanos con el mismo texto (sin distinguir mayúsculas ni
+    # espacios) se funden en uno que reúne sus hijos, y los subárboles repetidos en otra posición con al menos
+    # `min_nodos` nodos se desarrollan solo la primera vez (con None, se desarrollan todos): en las siguientes queda
+    # su nodo raíz como referencia, sin hijos, para no dejar vacío a su padre.
+    # Devuelve (árbol, subárboles repetidos reducidos a su referencia).
+    def fusionado(self, min_nodos=3):
+        # Nodos fusionados (el 0 es una raíz ficticia): texto y texto normalizado -> hijo, en orden de aparición.
+        # Cada nodo se crea después que su padre, por lo que los identificadores crecen con la profundidad.
+        textos, claves, hijos = [None], [None], [{}]
+        asignados = array("i")
+        for padre, texto in zip(self.padres, self.textos):
+            destino = asignados[padre] if padre >= 0 else 0
+            clave = " ".join(texto.casefold().split()).rstrip(".:;")
+            identificador = hijos[destino].get(clave)
+            if identificador is None:
+                identificador = hijos[destino][clave] = len(textos)
+                textos.append(texto)
+                claves.append(clave)
+                hijos.append({})
+            asignados.append(identificador)
+
+        # Firma y tamaño de cada subárbol fusionado, de las hojas hacia la raíz
+        firmas, tamanos = [0] * len(textos), [1] * len(textos)
+        for identificador in range(len(textos) - 1, 0, -1):
+            descendientes = list(hijos[identificador].values())
+            firmas[identificador] = hash((claves[identificador], tuple(firmas[hijo] for hijo in descendientes)))
+            tamanos[identificador] += sum(tamanos[hijo] for hijo in descendientes)
+
+        # Recorrido en preorden que reduce a su nodo raíz los subárboles ya vistos en otra posición
+        resultado = Arbol()
+        vistos, repetidos = set(), 0
+        pendientes = [(hijo, 0) for hijo in reversed(list(hijos[0].values()))]
+        while pendientes:
+            identificador, profundidad = pendientes.pop()
+            resultado.agregar(profundidad, textos[identificador])
+            if min_nodos is not None and tamanos[identificador] >= min_nodos:
+                if firmas[identificador] in vistos:
+                    repetidos += 1
+                    continue
+                vistos.add(firmas[identificador])
+            pendientes.extend((hijo, profundidad + 1) for hijo in reversed(list(hijos[identificador].values())))
+        return resultado, repetidos
+
+    # Serializar en texto con guiones e indentación de dos espacios
+    def a_texto(self):
+        return "\n".join(f"{'  ' * profundidad}- {texto}" for profundidad, texto in zip(self.profundidades, self.textos))
+
+    # Serializar en JSON como lista de nodos {"titulo": ..., "hijos": [...]}
+    def a_json(self, **opciones):
+        raices = []
+        pila = []
+        for profundidad, texto in zip(self.profundidades, self.textos):
+            nodo = {"titulo": texto, "hijos": []}
+            del pila[profundidad:]
+            (pila[-1]["hijos"] if pila else raices).append(nodo)
+            pila.append(nodo)
+        return json.dumps(raices, ensure_ascii=False, **opciones)
+
+# Función para construir un árbol a partir de un esqueleto con guiones en el que las líneas `[n]` hacen referencia a
+# ramas completas (numeradas desde 1), que se injertan en su lugar. Las referencias inválidas o repetidas se
+# ignoran y las ramas que el esqueleto omita se conservan al final, en su orden original.
+def injertar_en_esqueleto(esqueleto, ramas):
+    resultado = Arbol()
+    usadas = set()
+    for nodo in Arbol.desde_texto(esqueleto):
+        referencia = re.match(r"^\[(\d+)\]", nodo.texto)
+        if referencia is None:
+            resultado.agregar(nodo.profundidad, nodo.texto)
+            continue
+        indice = int(referencia.group(1)) - 1
+        if 0 <= indice < len(ramas) and indice not in usadas:
+            usadas.add(indice)
+            resultado.injertar(ramas[indice], nodo.profundidad)
+    profundidad_base = 1 if len(resultado.raices()) == 1 else 0
+    for indice, rama in enumerate(ramas):
+        if indice not in usadas:
+            resultado.injertar(rama, profundidad_base)
+    return resultado
+
+def _primera_clave(diccionario, claves):
+    for clave in claves:
+        if clave in diccionario:
+            return clave
+    return None
+
+def _ultimos_por_profundidad(arbol):
+    ultimos = []
+    for indice, profundidad in enumerate(arbol.profundidades):
+        del ultimos[profundidad:]
+        ultimos.append(indice)
+    return ultimos
@@ -0,0 +1,43 @@
+# Benchmark del modelo de árboles de contenido: análisis, división en ramas, serialización y diferencias.
+# Uso: python benchmarks/bench_arbol.py [--nodos 100000] [--salida resultados.jsonl]
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arbol import Arbol
+from generadores import generar_arbol
+from resultados import medir, registrar
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del modelo de árboles de contenido")
+    parser.add_argument("--nodos", type=int, default=100000)
+    parser.add_argument("--salida", help="Archivo JSONL donde acumular los resultados")
+    argumentos = parser.parse_args()
+
+    texto = generar_arbol(argumentos.nodos)
+    arbol, analisis_s = medir(lambda: Arbol.desde_texto(texto))
+    (_, ramas), ramas_s = medir(arbol.dividir_en_ramas)
+    _, texto_s = medir(arbol.a_texto)
+    datos_json, json_s = medir(arbol.a_json)
+    _, desde_json_s = medir(lambda: Arbol.desde_json(datos_json))
+    modificado = Arbol.desde_texto(texto.replace("Nodo 5", "Nodo cinco"))
+    diferencias, diferencias_s = medir(lambda: arbol.diferencias(modificado))
+
+    registrar({
+        "benchmark": "arbol",
+        "nodos": len(arbol),
+        "ramas": len(ramas),
+        "analisis_s": analisis_s,
+        "division_ramas_s": ramas_s,
+        "serializacion_texto_s": texto_s,
+        "serializacion_json_s": json_s,
+        "analisis_json_s": desde_json_s,
+        "diferencias_s": diferencias_s,
+        "nodos_cambiados": len(diferencias["agregados"]),
+    }, argumentos.salida)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Benchmark del arranque en frío de la aplicación: tiempo de importación de la estructura de app.py (sin páginas)
+# y de cada página, medido en procesos nuevos de Python. Streamlit se importa antes de medir, porque su coste no
+# depende de este código. Falla (código de salida 1) si algún tiempo supera su presupuesto o si el arranque carga
+# dependencias pesadas que solo necesitan las páginas, para detectar regresiones.
+# Uso: python benchmarks/bench_arranque.py [--repeticiones 5] [--factor 1.0] [--salida resultados.jsonl]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resultados import RAIZ, registrar
+
+# Módulos que importa app.py al arrancar y presupuesto de importación de cada escenario, en segundos
+MODULOS_ARRANQUE = ["cache_llm", "instrumentacion", "paginas"]
+PRESUPUESTOS_S = {"arranque": 0.15, "Concis": 1.5, "Descom": 1.5, "Recon": 1.5, "Refac": 1.2}
+
+# Dependencias pesadas que el arranque no debe importar (se cargan con la primera página que las usa)
+DEPENDENCIAS_PESADAS = ["fitz", "docx", "markdown", "openai", "tiktoken"]
+
+CODIGO_MEDICION = """
+import json, sys, time
+import streamlit
+inicio = time.perf_counter()
+for modulo in sys.argv[1:]:
+    __import__(modulo)
+segundos = time.perf_counter() - inicio
+print(json.dumps({"segundos": segundos, "pesados": [m for m in %r if m in sys.modules]}))
+""" % DEPENDENCIAS_PESADAS
+
+# Función para importar unos módulos en un proceso nuevo; devuelve (segundos, dependencias pesadas cargadas)
+def medir_importacion(modulos):
+    proceso = subprocess.run(
+        [sys.executable, "-c", CODIGO_MEDICION, *modulos], cwd=RAIZ, capture_output=True, text=True, check=True
+    )
+    resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+    return resultado["segundos"], resultado["pesados"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación del arranque y de cada página")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Mediciones por escenario (se toma la mediana)")
+    parser.add_argument("--factor", type=float, default=1.0, help="Multiplicador de los presupuestos (máquinas lentas)")
+    parser.add_argument("--salida", help="Archivo JSONL donde acumular los resultados")
+    argumentos = parser.parse_args()
+
+    from paginas import PAGINAS
+    escenarios = {"arranque": MODULOS_ARRANQUE}
+    escenarios.update({modulo: [modulo] for modulo, _ in PAGINAS.values()})
+
+    fallos = []
+    for nombre, modulos in escenarios.items():
+        mediciones = [medir_importacion(modulos) for _ in range(argumentos.repeticiones)]
+        segundos = statistics.median(medicion[0] for medicion in mediciones)
+        presupuesto = PRESUPUESTOS_S[nombre] * argumentos.factor
+        pesados = mediciones[0][1] if nombre == "arranque" else []
+        resultado = {
+            "benchmark": "arranque", "escenario": nombre, "importacion_s": round(segundos, 4),
+            "presupuesto_s": round(presupuesto, 4),
+        }
+        if nombre == "arranque":
+            resultado["dependencias_pesadas"] = pesados
+        registrar(resultado, argumentos.salida)
+        if segundos > presupuesto:
+            fallos.append(f"{nombre}: {segundos:.3f} s supera el presupuesto de {presupuesto:.3f} s")
+        if pesados:
+            fallos.append(f"{nombre}: el arranque importa {', '.join(pesados)}")
+
+    for fallo in fallos:
+        print(fallo, file=sys.stderr)
+    sys.exit(1 if fallos else 0)
+
+if __name__ == "__main__":
+    main()
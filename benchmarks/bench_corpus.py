@@ -0,0 +1,79 @@
+# Benchmark del corpus de textos fuente: tiempo de indexación y de consulta sobre un corpus sintético.
+# Uso: python benchmarks/bench_corpus.py [--mb 50] [--archivos 20] [--consultas 200] [--salida resultados.jsonl]
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import CorpusFuente
+from resultados import percentil, registrar
+
+# Función para generar un vocabulario sintético con distribución de frecuencias tipo Zipf
+def generar_vocabulario(tamano, semilla=0):
+    aleatorio = random.Random(semilla)
+    letras = "abcdefghijklmnopqrstuvwxyzáéíóúñ"
+    palabras = ["".join(aleatorio.choice(letras) for _ in range(aleatorio.randint(3, 10))) for _ in range(tamano)]
+    pesos_acumulados = list(itertools.accumulate(1 / (rango + 1) for rango in range(tamano)))
+    return palabras, pesos_acumulados
+
+# Función para escribir un corpus sintético de `megabytes` repartido en varios archivos
+def generar_corpus(directorio, megabytes, archivos, semilla=0):
+    aleatorio = random.Random(semilla)
+    palabras, pesos = generar_vocabulario(50000, semilla)
+    bytes_por_archivo = megabytes * 1024 * 1024 // archivos
+    rutas = []
+    for numero in range(archivos):
+        ruta = os.path.join(directorio, f"fuente_{numero:03d}.txt")
+        escritos = 0
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            while escritos < bytes_por_archivo:
+                parrafo = " ".join(aleatorio.choices(palabras, cum_weights=pesos, k=aleatorio.randint(40, 160))) + ".\n\n"
+                archivo.write(parrafo)
+                escritos += len(parrafo.encode("utf-8"))
+        rutas.append(ruta)
+    return rutas, palabras, pesos
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de indexación y consulta del corpus de Recon")
+    parser.add_argument("--mb", type=int, default=50)
+    parser.add_argument("--archivos", type=int, default=20)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--salida", help="Archivo JSONL donde acumular los resultados")
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        rutas, palabras, pesos = generar_corpus(directorio, argumentos.mb, argumentos.archivos)
+
+        inicio = time.perf_counter()
+        corpus = CorpusFuente(rutas)
+        tiempo_indexacion = time.perf_counter() - inicio
+
+        aleatorio = random.Random(1)
+        consultas = [" ".join(aleatorio.choices(palabras, cum_weights=pesos, k=aleatorio.randint(3, 12))) for _ in range(argumentos.consultas)]
+        tiempos = []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            corpus.buscar(consulta, k=argumentos.k)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        corpus.cerrar()
+
+    registrar({
+        "benchmark": "corpus",
+        "mb": argumentos.mb,
+        "archivos": argumentos.archivos,
+        "pasajes": len(corpus),
+        "terminos": len(corpus.indice),
+        "indexacion_s": round(tiempo_indexacion, 3),
+        "consulta_ms_media": round(sum(tiempos) / len(tiempos), 3),
+        "consulta_ms_p95": round(percentil(tiempos, 0.95), 3),
+    }, argumentos.salida)
+
+if __name__ == "__main__":
+    main()
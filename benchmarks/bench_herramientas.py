@@ -0,0 +1,175 @@
+# Benchmark de extremo a extremo de las cuatro herramientas contra el servidor simulado de la API:
+# rendimiento y latencia de Concis (process_text), Descom (descomposición por secciones), Recon (reconstrucción
+# por ramas), Refac (solicitud completa y en flujo) y la traducción de Concis en modo diferido con la Batch API
+# (lotes). La caché de respuestas y el índice de duplicados se desactivan para que cada solicitud llegue al servidor.
+# Uso: python benchmarks/bench_herramientas.py [--herramientas concis,descom,recon,refac,lotes] [--caracteres 200000]
+#      [--concurrencia 4] [--latencia 0.2] [--tokens-por-segundo 1000] [--tasa-errores 0] [--tasa-429 0]
+#      [--latencia-lote 0.5] [--salida resultados.jsonl]
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from servidor_simulado import iniciar_servidor
+from generadores import generar_texto, generar_arbol
+from resultados import percentil, registrar
+
+HERRAMIENTAS = ("concis", "descom", "recon", "refac", "lotes")
+
+# Cliente que registra la duración de cada llamada a la API (hasta recibir la respuesta o el inicio del flujo)
+class _CompletionsMedidas:
+    def __init__(self, completions):
+        self._completions = completions
+        self._bloqueo = threading.Lock()
+        self.duraciones = []
+
+    def create(self, **parametros):
+        inicio = time.perf_counter()
+        try:
+            return self._completions.create(**parametros)
+        finally:
+            with self._bloqueo:
+                self.duraciones.append(time.perf_counter() - inicio)
+
+class _ClienteMedido:
+    def __init__(self, cliente, completions=None):
+        self._cliente = cliente
+        self.chat = argparse.Namespace(completions=completions or _CompletionsMedidas(cliente.chat.completions))
+
+    # Copia con otras opciones del cliente (p. ej. sin reintentos) que sigue registrando en las mismas duraciones
+    def with_options(self, **opciones):
+        cliente = self._cliente.with_options(**opciones)
+        completions = _CompletionsMedidas(cliente.chat.completions)
+        completions.duraciones = self.duraciones
+        completions._bloqueo = self.chat.completions._bloqueo
+        return _ClienteMedido(cliente, completions)
+
+    @property
+    def duraciones(self):
+        return self.chat.completions.duraciones
+
+# Función para ejecutar un escenario y registrar su tiempo total, la latencia por llamada y los contadores del servidor
+def ejecutar_escenario(nombre, funcion, cliente, servidor, configuracion, salida):
+    cliente.duraciones.clear()
+    antes = dict(servidor.estadisticas)
+    inicio = time.perf_counter()
+    extras = funcion()
+    unidades = extras.pop("unidades")
+    total = time.perf_counter() - inicio
+    despues = dict(servidor.estadisticas)
+    diferencia = {clave: despues[clave] - antes[clave] for clave in despues}
+    latencias = [duracion * 1000 for duracion in cliente.duraciones] or [0.0]
+    registrar(dict(
+        configuracion,
+        **extras,
+        benchmark="herramientas",
+        escenario=nombre,
+        total_s=round(total, 3),
+        unidades=unidades,
+        unidades_por_s=round(unidades / total, 3) if total else None,
+        llamadas=len(cliente.duraciones),
+        latencia_ms_media=round(sum(latencias) / len(latencias), 1),
+        latencia_ms_p95=round(percentil(latencias, 0.95), 1),
+        tokens_salida_por_s=round(diferencia["tokens_salida"] / total, 1) if total else None,
+        solicitudes_servidor=diferencia["solicitudes"],
+        solicitudes_lote_servidor=diferencia["solicitudes_lote"],
+        errores_servidor=diferencia["errores"],
+        rechazos_429=diferencia["rechazos_429"],
+    ), salida)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo contra el servidor simulado")
+    parser.add_argument("--herramientas", default=",".join(HERRAMIENTAS))
+    parser.add_argument("--caracteres", type=int, default=200_000, help="Tamaño del documento sintético")
+    parser.add_argument("--nodos", type=int, default=100, help="Nodos del árbol sintético de Recon y Refac")
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--tokens-por-segundo", type=float, default=1000.0)
+    parser.add_argument("--tasa-errores", type=float, default=0.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--latencia-lote", type=float, default=0.5, help="Segundos que tarda el servidor en procesar un lote")
+    parser.add_argument("--salida", help="Archivo JSONL donde acumular los resultados")
+    argumentos = parser.parse_args()
+
+    servidor = iniciar_servidor(
+        latencia=argumentos.latencia, tokens_por_segundo=argumentos.tokens_por_segundo,
+        tasa_errores=argumentos.tasa_errores, tasa_429=argumentos.tasa_429, latencia_lote=argumentos.latencia_lote
+    )
+    # Los clientes del registro usan la configuración del entorno: se dirigen al servidor simulado
+    directorio_cache = tempfile.mkdtemp(prefix="texteador-bench-")
+    os.environ.update({
+        "OPENAI_BASE_URL": servidor.url, "OPENAI_API_KEY": "simulada",
+        "TEXTEADOR_CACHE": "0", "TEXTEADOR_DUPLICADOS": "0", "TEXTEADOR_CACHE_DIR": directorio_cache,
+    })
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    from api_lotes import identificador_solicitud, resolver_solicitudes
+    from clientes import obtener_cliente
+    from corpus import CorpusFuente
+    from llm import transmitir_chat
+    from traduccion import build_concise_request, split_text_into_chunks
+    import Concis
+    import Descom
+    import Recon
+    import Refac
+
+    cliente = _ClienteMedido(obtener_cliente())
+    Descom.cliente_openai = lambda: cliente
+    texto = generar_texto(argumentos.caracteres)
+    arbol = generar_arbol(argumentos.nodos, profundidad_maxima=3)
+    configuracion = {
+        "caracteres": len(texto), "nodos": argumentos.nodos, "concurrencia": argumentos.concurrencia,
+        "latencia_servidor": argumentos.latencia, "tokens_por_segundo_servidor": argumentos.tokens_por_segundo,
+        "tasa_errores": argumentos.tasa_errores, "tasa_429": argumentos.tasa_429,
+    }
+
+    def concis():
+        traduccion = Concis.process_text(cliente, texto, "gpt-4o-mini", 5000, "Español Conciso", argumentos.concurrencia)
+        return {"unidades": traduccion.count("<©>")}
+
+    def descom():
+        Descom.descomponer_por_secciones(texto, max_concurrencia=argumentos.concurrencia)
+        return {"unidades": len(cliente.duraciones)}
+
+    def recon():
+        with CorpusFuente.desde_textos([("fuente", texto)]) as corpus:
+            Recon.reconstruct_by_branches(cliente, arbol, corpus, argumentos.concurrencia)
+        return {"unidades": len(cliente.duraciones)}
+
+    def refac():
+        Refac.refactor_by_groups(cliente, arbol, "Reorganizar por temas", "Máximo cuatro niveles", max_concurrencia=argumentos.concurrencia)
+        inicio = time.perf_counter()
+        flujo = transmitir_chat(cliente, **Refac.build_request(arbol, "Reorganizar por temas", "Máximo tres niveles"))
+        next(flujo, None)
+        primer_token_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        for _ in flujo:
+            pass
+        return {"unidades": len(cliente.duraciones), "primer_token_ms": primer_token_ms}
+
+    def lotes():
+        solicitudes = {
+            identificador_solicitud("bench", indice, fragmento): build_concise_request(fragmento, "gpt-4o-mini", "Spanish")
+            for indice, fragmento in enumerate(split_text_into_chunks(texto, 5000))
+        }
+        respuestas, errores, estadisticas = resolver_solicitudes(
+            obtener_cliente(), solicitudes, "bench", directorio=os.path.join(directorio_cache, "lotes"), intervalo=0.1
+        )
+        return {"unidades": len(respuestas), "errores_lote": len(errores), "lotes": estadisticas["lotes"]}
+
+    escenarios = {"concis": concis, "descom": descom, "recon": recon, "refac": refac, "lotes": lotes}
+    try:
+        for nombre in argumentos.herramientas.split(","):
+            ejecutar_escenario(nombre, escenarios[nombre.strip()], cliente, servidor, configuracion, argumentos.salida)
+    finally:
+        servidor.shutdown()
+        shutil.rmtree(directorio_cache, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Micro-benchmarks sin llamadas a la API: fragmentación, ingesta y normalización de documentos y manejo de árboles.
+# Uso: python benchmarks/bench_micro.py [--caracteres 2000000] [--paginas 150] [--nodos 20000] [--salida resultados.jsonl]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# La caché de documentos se aísla en un directorio temporal para medir extracciones en frío
+os.environ["TEXTEADOR_CACHE_DIR"] = tempfile.mkdtemp(prefix="texteador-bench-")
+
+from arbol import Arbol
+from fragmentacion import generar_fragmentos, generar_fragmentos_por_contenido, contar_tokens
+from descomposicion import dividir_en_secciones
+from normalizacion import normalizar_bloques
+from ingesta import iterar_paginas_pdf, iterar_parrafos_docx, iterar_bloques_texto, extraer_documento
+from generadores import generar_texto, generar_pdf, generar_docx, generar_arbol
+from resultados import medir, registrar
+
+# Benchmark de fragmentación: cortes por presupuesto, cortes definidos por el contenido y secciones de Descom
+def medir_fragmentacion(caracteres, salida):
+    texto = generar_texto(caracteres)
+    _, conteo_s = medir(lambda: contar_tokens(texto))
+    fijos, fijos_s = medir(lambda: list(generar_fragmentos([texto], 1250)))
+    por_contenido, contenido_s = medir(lambda: list(generar_fragmentos_por_contenido([texto], 1250)))
+    secciones, secciones_s = medir(lambda: dividir_en_secciones(texto))
+    mb = len(texto.encode("utf-8")) / (1024 * 1024)
+    registrar({
+        "benchmark": "micro", "escenario": "fragmentacion", "caracteres": len(texto),
+        "conteo_tokens_s": conteo_s,
+        "fragmentos_fijos": len(fijos), "fragmentos_fijos_s": fijos_s,
+        "fragmentos_contenido": len(por_contenido), "fragmentos_contenido_s": contenido_s,
+        "secciones": len(secciones), "secciones_s": secciones_s,
+        "mb_por_s": round(mb / contenido_s, 2) if contenido_s else None,
+    }, salida)
+
+# Benchmark de ingesta: PDF secuencial y en paralelo, DOCX, texto y extracción a través de la caché de documentos
+def medir_ingesta(paginas, directorio, salida):
+    ruta_pdf = generar_pdf(os.path.join(directorio, "sintetico.pdf"), paginas)
+    ruta_docx = generar_docx(os.path.join(directorio, "sintetico.docx"), paginas * 4)
+    ruta_txt = os.path.join(directorio, "sintetico.txt")
+    with open(ruta_txt, "w", encoding="utf-8") as archivo:
+        archivo.write(generar_texto(paginas * 3000))
+
+    _, pdf_secuencial_s = medir(lambda: list(iterar_paginas_pdf(ruta_pdf, procesos=1)))
+    _, pdf_paralelo_s = medir(lambda: list(iterar_paginas_pdf(ruta_pdf)))
+    _, docx_s = medir(lambda: list(iterar_parrafos_docx(ruta_docx)))
+    _, txt_s = medir(lambda: list(iterar_bloques_texto(ruta_txt)))
+    _, cache_fria_s = medir(lambda: extraer_documento(ruta_pdf))
+    _, cache_caliente_s = medir(lambda: extraer_documento(ruta_pdf))
+    registrar({
+        "benchmark": "micro", "escenario": "ingesta", "paginas": paginas, "procesos": os.cpu_count() or 1,
+        "pdf_secuencial_s": pdf_secuencial_s, "pdf_paralelo_s": pdf_paralelo_s,
+        "docx_s": docx_s, "txt_s": txt_s,
+        "documento_cache_fria_s": cache_fria_s, "documento_cache_caliente_s": cache_caliente_s,
+        "paginas_por_s": round(paginas / pdf_paralelo_s, 1) if pdf_paralelo_s else None,
+    }, salida)
+
+# Benchmark de normalización: páginas de PDF con encabezados y pies, y tokens de entrada que se ahorran
+def medir_normalizacion(paginas, directorio, salida):
+    ruta_pdf = generar_pdf(os.path.join(directorio, "encabezados.pdf"), paginas, encabezados=True)
+    texto_paginas = list(iterar_paginas_pdf(ruta_pdf, procesos=1))
+    normalizados = normalizar_bloques(texto_paginas, "pdf")
+    _, normalizacion_s = medir(lambda: list(normalizados))
+    registrar({
+        "benchmark": "micro", "escenario": "normalizacion", "paginas": paginas,
+        "normalizacion_s": normalizacion_s, **{clave: valor for clave, valor in normalizados.atributos.items() if clave != "formato"},
+        "paginas_por_s": round(paginas / normalizacion_s, 1) if normalizacion_s else None,
+    }, salida)
+
+# Benchmark de árboles: análisis, división en ramas y serialización
+def medir_arboles(nodos, salida):
+    texto = generar_arbol(nodos)
+    arbol, analisis_s = medir(lambda: Arbol.desde_texto(texto))
+    (_, ramas), ramas_s = medir(arbol.dividir_en_ramas)
+    _, texto_s = medir(arbol.a_texto)
+    registrar({
+        "benchmark": "micro", "escenario": "arboles", "nodos": len(arbol), "ramas": len(ramas),
+        "analisis_s": analisis_s, "division_ramas_s": ramas_s, "serializacion_texto_s": texto_s,
+    }, salida)
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de fragmentación, ingesta y árboles")
+    parser.add_argument("--caracteres", type=int, default=2_000_000)
+    parser.add_argument("--paginas", type=int, default=150)
+    parser.add_argument("--nodos", type=int, default=20000)
+    parser.add_argument("--salida", help="Archivo JSONL donde acumular los resultados")
+    argumentos = parser.parse_args()
+
+    try:
+        medir_fragmentacion(argumentos.caracteres, argumentos.salida)
+        with tempfile.TemporaryDirectory() as directorio:
+            medir_ingesta(argumentos.paginas, directorio, argumentos.salida)
+            medir_normalizacion(argumentos.paginas, directorio, argumentos.salida)
+        medir_arboles(argumentos.nodos, argumentos.salida)
+    finally:
+        shutil.rmtree(os.environ["TEXTEADOR_CACHE_DIR"], ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Generadores de entradas sintéticas para los benchmarks: texto, PDF, DOCX y árboles de contenido.
+# Todos son deterministas para una misma semilla, de modo que los resultados entre versiones son comparables.
+
+import random
+
+import fitz  # PyMuPDF
+from docx import Document
+
+PALABRAS = """
+análisis contenido documento estructura sección capítulo párrafo tema concepto modelo proceso sistema datos
+resultado método información ejemplo problema solución objetivo requisito diseño evaluación propuesta criterio
+texto lectura escritura traducción jerarquía nivel rama nodo título resumen detalle lista referencia fuente
+""".split()
+
+# Función para generar párrafos de texto sintético (entre 40 y 160 palabras cada uno)
+def generar_parrafos(cantidad, semilla=0):
+    aleatorio = random.Random(semilla)
+    parrafos = []
+    for _ in range(cantidad):
+        palabras = aleatorio.choices(PALABRAS, k=aleatorio.randint(40, 160))
+        palabras[0] = palabras[0].capitalize()
+        parrafos.append(" ".join(palabras) + ".")
+    return parrafos
+
+# Función para generar un texto sintético de aproximadamente `caracteres` caracteres, en párrafos
+def generar_texto(caracteres, semilla=0):
+    aleatorio = random.Random(semilla)
+    parrafos, total = [], 0
+    while total < caracteres:
+        parrafo = generar_parrafos(1, aleatorio.random())[0]
+        parrafos.append(parrafo)
+        total += len(parrafo) + 2
+    return "\n\n".join(parrafos)
+
+# Función para escribir un PDF sintético de `paginas` páginas con varios párrafos por página.
+# Con `encabezados`, cada página lleva un encabezado y un pie con su número, como los de un informe.
+def generar_pdf(ruta, paginas, parrafos_por_pagina=4, semilla=0, encabezados=False):
+    parrafos = generar_parrafos(paginas * parrafos_por_pagina, semilla)
+    with fitz.open() as doc:
+        for numero in range(paginas):
+            pagina = doc.new_page()
+            texto = "\n\n".join(parrafos[numero * parrafos_por_pagina:(numero + 1) * parrafos_por_pagina])
+            pagina.insert_textbox(fitz.Rect(50, 50, 545, 792), texto, fontsize=9)
+            if encabezados:
+                pagina.insert_text((50, 30), "Informe sintético de rendimiento · Texteador", fontsize=8)
+                pagina.insert_text((50, 820), f"Página {numero + 1} de {paginas}", fontsize=8)
+        doc.save(ruta)
+    return ruta
+
+# Función para escribir un DOCX sintético con títulos cada diez párrafos
+def generar_docx(ruta, parrafos, semilla=0):
+    doc = Document()
+    for numero, parrafo in enumerate(generar_parrafos(parrafos, semilla)):
+        if numero % 10 == 0:
+            doc.add_heading(f"Sección {numero // 10 + 1}", level=1)
+        doc.add_paragraph(parrafo)
+    doc.save(ruta)
+    return ruta
+
+# Función para generar un árbol sintético con guiones, con ramas de profundidad y anchura variables
+def generar_arbol(nodos, profundidad_maxima=6, semilla=0):
+    aleatorio = random.Random(semilla)
+    lineas = ["- Título General"]
+    profundidad = 0
+    for numero in range(1, nodos):
+        profundidad = aleatorio.randint(1, min(profundidad + 1, profundidad_maxima))
+        lineas.append(f"{'  ' * profundidad}- Nodo {numero} de nivel {profundidad}")
+    return "\n".join(lineas)
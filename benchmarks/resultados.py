@@ -0,0 +1,97 @@
+# Registro y comparación de resultados de benchmarks. Cada benchmark emite un objeto JSON por escenario, con la
+# versión del código y la fecha; con --salida los resultados se acumulan en un archivo JSONL.
+# Comparar dos ejecuciones (p. ej. antes y después de un cambio):
+#   python benchmarks/resultados.py base.jsonl nuevo.jsonl --tolerancia 0.15
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Función para medir el tiempo de una función; devuelve (resultado, segundos)
+def medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, round(time.perf_counter() - inicio, 4)
+
+def percentil(valores, fraccion):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(fraccion * len(ordenados)))]
+
+# Versión del código medido: commit actual de git (con "+cambios" si hay modificaciones sin confirmar)
+def version():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+        cambios = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ, capture_output=True, text=True).stdout.strip()
+        return commit + ("+cambios" if cambios else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+# Función para emitir un resultado por la salida estándar y, si se indica, añadirlo a un archivo JSONL
+def registrar(resultado, salida=None):
+    resultado = dict(resultado, version=version(), fecha=datetime.now().isoformat(timespec="seconds"), python=platform.python_version())
+    linea = json.dumps(resultado, ensure_ascii=False)
+    print(linea, flush=True)
+    if salida:
+        with open(salida, "a", encoding="utf-8") as archivo:
+            archivo.write(linea + "\n")
+    return resultado
+
+def cargar(ruta):
+    with open(ruta, encoding="utf-8") as archivo:
+        return [json.loads(linea) for linea in archivo if linea.strip()]
+
+# Identificador de un escenario: nombre del benchmark y escenario (se compara el último registro de cada uno)
+def _escenario(resultado):
+    return resultado.get("benchmark", "?"), resultado.get("escenario", "")
+
+# Sentido de una métrica por su nombre: tiempos (menor es mejor) o rendimientos (mayor es mejor)
+def _sentido(clave):
+    if clave.endswith("_por_s"):
+        return 1
+    if clave.endswith(("_s", "_ms")) or "_ms_" in clave:
+        return -1
+    return 0
+
+# Función para comparar dos conjuntos de resultados y devolver las métricas que empeoran más que `tolerancia`
+def comparar(base, nuevo, tolerancia=0.15):
+    anteriores = {_escenario(resultado): resultado for resultado in base}
+    regresiones, comparadas = [], []
+    for resultado in nuevo:
+        anterior = anteriores.get(_escenario(resultado))
+        if anterior is None:
+            continue
+        for clave, valor in resultado.items():
+            sentido = _sentido(clave)
+            previo = anterior.get(clave)
+            if not sentido or not isinstance(valor, (int, float)) or not isinstance(previo, (int, float)) or not previo:
+                continue
+            cambio = (valor - previo) / previo
+            fila = {"benchmark": resultado.get("benchmark"), "escenario": resultado.get("escenario", ""), "metrica": clave,
+                    "base": previo, "nuevo": valor, "cambio": round(cambio, 4)}
+            comparadas.append(fila)
+            if cambio * sentido < -tolerancia:
+                regresiones.append(fila)
+    return comparadas, regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparar dos archivos de resultados de benchmarks")
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Empeoramiento relativo admitido por métrica")
+    argumentos = parser.parse_args()
+
+    comparadas, regresiones = comparar(cargar(argumentos.base), cargar(argumentos.nuevo), argumentos.tolerancia)
+    for fila in comparadas:
+        marca = "REGRESIÓN" if fila in regresiones else ""
+        print(f"{fila['benchmark']:<12} {fila['escenario']:<20} {fila['metrica']:<28} {fila['base']:>12} {fila['nuevo']:>12} {fila['cambio']:>+8.1%} {marca}")
+    return 1 if regresiones else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+# Servidor local que imita el endpoint de chat de la API de OpenAI (/v1/chat/completions), con y sin flujo (SSE),
+# para medir las herramientas sin red ni costo. La latencia, la velocidad de generación y las tasas de errores 500
+# y de respuestas 429 son configurables. Las herramientas lo usan definiendo OPENAI_BASE_URL.
+# También imita la Batch API (/v1/files y /v1/batches): cada lote procesa su archivo JSONL en segundo plano tras
+# `latencia_lote` segundos y deja un archivo de resultados y otro de errores (con la tasa de errores configurada).
+# Uso: python benchmarks/servidor_simulado.py --puerto 8765 --latencia 0.3 --tokens-por-segundo 80 --tasa-429 0.05
+#      OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=simulada streamlit run app.py
+
+import argparse
+import json
+from email.parser import BytesParser
+from email.policy import HTTP
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Caracteres por token usados para estimar los tokens de las solicitudes y las respuestas
+CARACTERES_POR_TOKEN = 4
+
+# Configuración por defecto del servidor simulado
+CONFIGURACION_POR_DEFECTO = {
+    "latencia": 0.2,  # segundos hasta el primer token
+    "tokens_por_segundo": 200.0,  # velocidad de generación (0 = instantánea)
+    "tasa_errores": 0.0,  # fracción de solicitudes que fallan con 500
+    "tasa_429": 0.0,  # fracción de solicitudes rechazadas por límite de uso
+    "reintentar_despues": 0.1,  # segundos indicados en la cabecera retry-after de los 429
+    "ratio_salida": 0.5,  # tokens de respuesta por token de entrada
+    "max_tokens_respuesta": 2000,
+    "tokens_por_evento": 4,  # tokens por evento en las respuestas en flujo
+    "latencia_lote": 0.5,  # segundos que tarda un lote en procesarse
+    "semilla": 0,
+}
+
+# Función para generar una respuesta determinista con forma de árbol con guiones a partir de las palabras del prompt,
+# de modo que sirva tanto para las traducciones como para las herramientas que esperan una jerarquía
+def generar_respuesta(prompt, tokens):
+    palabras = [palabra for palabra in prompt.split() if palabra.isalpha()] or ["contenido"]
+    lineas, caracteres, posicion = [], 0, 0
+    while caracteres < tokens * CARACTERES_POR_TOKEN:
+        nivel = len(lineas) % 3
+        texto = " ".join(palabras[(posicion + i) % len(palabras)] for i in range(6))
+        posicion += 6
+        linea = f"{'  ' * nivel}- {texto}"
+        lineas.append(linea)
+        caracteres += len(linea) + 1
+    return "\n".join(lineas)
+
+class ServidorSimulado(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, **configuracion):
+        super().__init__(direccion, _Manejador)
+        self.configuracion = dict(CONFIGURACION_POR_DEFECTO, **configuracion)
+        self.aleatorio = random.Random(self.configuracion["semilla"])
+        self.bloqueo = threading.Lock()
+        self.estadisticas = {
+            "solicitudes": 0, "respuestas": 0, "errores": 0, "rechazos_429": 0, "tokens_entrada": 0, "tokens_salida": 0,
+            "lotes": 0, "solicitudes_lote": 0,
+        }
+        self.archivos = {}
+        self.lotes = {}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def contar(self, clave, cantidad=1):
+        with self.bloqueo:
+            self.estadisticas[clave] += cantidad
+
+    # Decidir el resultado de una solicitud: "429", "error" u "ok"
+    def sortear(self):
+        with self.bloqueo:
+            valor = self.aleatorio.random()
+        if valor < self.configuracion["tasa_429"]:
+            return "429"
+        if valor < self.configuracion["tasa_429"] + self.configuracion["tasa_errores"]:
+            return "error"
+        return "ok"
+
+    # Generar la respuesta de una solicitud de chat: (contenido, finish_reason, uso)
+    def completar(self, solicitud):
+        prompt = "\n".join(str(mensaje.get("content", "")) for mensaje in solicitud.get("messages", []))
+        tokens_entrada = max(1, len(prompt) // CARACTERES_POR_TOKEN)
+        limite = min(solicitud.get("max_tokens") or self.configuracion["max_tokens_respuesta"], self.configuracion["max_tokens_respuesta"])
+        tokens_pedidos = int(tokens_entrada * self.configuracion["ratio_salida"])
+        tokens_salida = max(1, min(limite, tokens_pedidos))
+        contenido = generar_respuesta(prompt, tokens_salida)
+        finish_reason = "length" if tokens_pedidos > limite else "stop"
+        self.contar("tokens_entrada", tokens_entrada)
+        self.contar("tokens_salida", tokens_salida)
+        return contenido, finish_reason, {"prompt_tokens": tokens_entrada, "completion_tokens": tokens_salida, "total_tokens": tokens_entrada + tokens_salida}
+
+    def guardar_archivo(self, contenido, nombre, proposito):
+        archivo = {
+            "id": f"file-{uuid.uuid4().hex[:24]}", "object": "file", "bytes": len(contenido), "created_at": int(time.time()),
+            "filename": nombre, "purpose": proposito, "status": "processed",
+        }
+        with self.bloqueo:
+            self.archivos[archivo["id"]] = (archivo, contenido)
+        return archivo
+
+    def crear_lote(self, solicitud):
+        lote = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}", "object": "batch", "endpoint": solicitud.get("endpoint"),
+            "input_file_id": solicitud.get("input_file_id"), "completion_window": solicitud.get("completion_window", "24h"),
+            "status": "validating", "created_at": int(time.time()), "metadata": solicitud.get("metadata"),
+            "output_file_id": None, "error_file_id": None, "errors": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.bloqueo:
+            self.lotes[lote["id"]] = lote
+            self.estadisticas["lotes"] += 1
+        threading.Thread(target=self._procesar_lote, args=(lote,), daemon=True).start()
+        return lote
+
+    # Listar los lotes del más reciente al más antiguo, por páginas (`limit` y `after`, como la API)
+    def listar_lotes(self, parametros):
+        with self.bloqueo:
+            lotes = list(reversed(self.lotes.values()))
+        despues = parametros.get("after", [None])[0]
+        if despues is not None:
+            posicion = next((i for i, lote in enumerate(lotes) if lote["id"] == despues), len(lotes))
+            lotes = lotes[posicion + 1:]
+        limite = int(parametros.get("limit", ["20"])[0])
+        pagina = lotes[:limite]
+        return {
+            "object": "list", "data": pagina, "has_more": len(lotes) > limite,
+            "first_id": pagina[0]["id"] if pagina else None, "last_id": pagina[-1]["id"] if pagina else None,
+        }
+
+    # Procesar las solicitudes del archivo de entrada de un lote y publicar sus archivos de resultados y errores
+    def _procesar_lote(self, lote):
+        with self.bloqueo:
+            entrada = self.archivos.get(lote["input_file_id"])
+        if entrada is None:
+            lote.update(status="failed", failed_at=int(time.time()), errors={"object": "list", "data": [
+                {"code": "invalid_file", "message": "El archivo de entrada no existe"}
+            ]})
+            return
+        lineas = [json.loads(linea) for linea in entrada[1].decode("utf-8").splitlines() if linea.strip()]
+        lote.update(status="in_progress", in_progress_at=int(time.time()))
+        lote["request_counts"]["total"] = len(lineas)
+        time.sleep(self.configuracion["latencia_lote"])
+        resultados, errores = [], []
+        for linea in lineas:
+            if lote["status"] == "cancelling":
+                break
+            self.contar("solicitudes_lote")
+            identificador = f"batch_req_{uuid.uuid4().hex[:24]}"
+            if self.sortear() == "error":
+                errores.append({"id": identificador, "custom_id": linea["custom_id"], "response": {
+                    "status_code": 500, "request_id": identificador,
+                    "body": {"error": {"message": "Error simulado del servidor", "type": "server_error"}},
+                }, "error": None})
+                lote["request_counts"]["failed"] += 1
+                continue
+            contenido, finish_reason, uso = self.completar(linea["body"])
+            resultados.append({"id": identificador, "custom_id": linea["custom_id"], "response": {
+                "status_code": 200, "request_id": identificador, "body": {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion", "created": int(time.time()),
+                    "model": linea["body"].get("model", "simulado"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": finish_reason}],
+                    "usage": uso,
+                },
+            }, "error": None})
+            lote["request_counts"]["completed"] += 1
+        lote["status"] = "finalizing"
+        for registros, campo in ((resultados, "output_file_id"), (errores, "error_file_id")):
+            if registros:
+                contenido = "".join(json.dumps(registro) + "\n" for registro in registros).encode("utf-8")
+                lote[campo] = self.guardar_archivo(contenido, f"{lote['id']}_{campo}.jsonl", "batch_output")["id"]
+        if lote["status"] == "cancelling":
+            lote.update(status="cancelled", cancelled_at=int(time.time()))
+        else:
+            lote.update(status="completed", completed_at=int(time.time()))
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *argumentos):
+        pass
+
+    def _responder_json(self, estado, datos, cabeceras=None):
+        cuerpo = json.dumps(datos).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _no_encontrado(self):
+        self._responder_json(404, {"error": {"message": "Ruta no encontrada", "type": "invalid_request_error"}})
+
+    def do_GET(self):
+        ruta = self.path.split("?")[0].rstrip("/")
+        partes = ruta.split("/")
+        servidor = self.server
+        if ruta.endswith("/estadisticas"):
+            with servidor.bloqueo:
+                self._responder_json(200, dict(servidor.estadisticas))
+        elif "/files/" in ruta and partes[-1] == "content" and partes[-2] in servidor.archivos:
+            contenido = servidor.archivos[partes[-2]][1]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(contenido)))
+            self.end_headers()
+            self.wfile.write(contenido)
+        elif "/files/" in ruta and partes[-1] in servidor.archivos:
+            self._responder_json(200, servidor.archivos[partes[-1]][0])
+        elif "/batches/" in ruta and partes[-1] in servidor.lotes:
+            self._responder_json(200, servidor.lotes[partes[-1]])
+        elif ruta.endswith("/batches"):
+            self._responder_json(200, servidor.listar_lotes(parse_qs(urlparse(self.path).query)))
+        else:
+            self._no_encontrado()
+
+    # Subida de un archivo (multipart/form-data con los campos `purpose` y `file`)
+    def _subir_archivo(self, cuerpo):
+        mensaje = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + self.headers.get("Content-Type", "").encode("latin-1") + b"\r\n\r\n" + cuerpo
+        )
+        campos, contenido, nombre = {}, b"", "archivo.jsonl"
+        for parte in mensaje.iter_parts():
+            campo = parte.get_param("name", header="content-disposition")
+            if campo == "file":
+                contenido = parte.get_payload(decode=True) or b""
+                nombre = parte.get_filename() or nombre
+            else:
+                campos[campo] = parte.get_content().strip()
+        self._responder_json(200, self.server.guardar_archivo(contenido, nombre, campos.get("purpose", "batch")))
+
+    def do_POST(self):
+        longitud = int(self.headers.get("Content-Length", 0))
+        cuerpo = self.rfile.read(longitud)
+        ruta = self.path.split("?")[0].rstrip("/")
+        servidor = self.server
+        if ruta.endswith("/files"):
+            self._subir_archivo(cuerpo)
+            return
+        if ruta.endswith("/batches"):
+            self._responder_json(200, servidor.crear_lote(json.loads(cuerpo or b"{}")))
+            return
+        if ruta.endswith("/cancel") and ruta.split("/")[-2] in servidor.lotes:
+            lote = servidor.lotes[ruta.split("/")[-2]]
+            if lote["status"] not in ("completed", "failed", "expired", "cancelled"):
+                lote.update(status="cancelling", cancelling_at=int(time.time()))
+            self._responder_json(200, lote)
+            return
+        if not ruta.endswith("/chat/completions"):
+            self._no_encontrado()
+            return
+        solicitud = json.loads(cuerpo or b"{}")
+        configuracion = servidor.configuracion
+        servidor.contar("solicitudes")
+        resultado = servidor.sortear()
+        if resultado == "429":
+            servidor.contar("rechazos_429")
+            self._responder_json(
+                429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                {"retry-after": str(configuracion["reintentar_despues"])}
+            )
+            return
+        if resultado == "error":
+            servidor.contar("errores")
+            self._responder_json(500, {"error": {"message": "Error simulado del servidor", "type": "server_error"}})
+            return
+
+        contenido, finish_reason, uso = servidor.completar(solicitud)
+        identificador = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        modelo = solicitud.get("model", "simulado")
+        time.sleep(configuracion["latencia"])
+        if solicitud.get("stream"):
+            self._transmitir(identificador, modelo, contenido, finish_reason, uso, solicitud)
+        else:
+            if configuracion["tokens_por_segundo"]:
+                time.sleep(uso["completion_tokens"] / configuracion["tokens_por_segundo"])
+            self._responder_json(200, {
+                "id": identificador, "object": "chat.completion", "created": int(time.time()), "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": finish_reason}],
+                "usage": uso,
+            })
+        servidor.contar("respuestas")
+
+    # Respuesta en flujo con eventos SSE; la conexión se cierra al terminar
+    def _transmitir(self, identificador, modelo, contenido, finish_reason, uso, solicitud):
+        configuracion = self.server.configuracion
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def evento(choices, usage=None):
+            datos = {"id": identificador, "object": "chat.completion.chunk", "created": int(time.time()), "model": modelo, "choices": choices}
+            if usage is not None:
+                datos["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(datos)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        paso = configuracion["tokens_por_evento"] * CARACTERES_POR_TOKEN
+        pausa = configuracion["tokens_por_evento"] / configuracion["tokens_por_segundo"] if configuracion["tokens_por_segundo"] else 0
+        try:
+            evento([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for inicio in range(0, len(contenido), paso):
+                if pausa:
+                    time.sleep(pausa)
+                evento([{"index": 0, "delta": {"content": contenido[inicio:inicio + paso]}, "finish_reason": None}])
+            evento([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            if (solicitud.get("stream_options") or {}).get("include_usage"):
+                evento([], uso)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # el cliente canceló la transmisión
+
+# Función para iniciar el servidor simulado en un hilo en segundo plano; devuelve el servidor (con su `url`).
+# Con `puerto=0` se elige un puerto libre.
+def iniciar_servidor(puerto=0, host="127.0.0.1", **configuracion):
+    servidor = ServidorSimulado((host, puerto), **configuracion)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor simulado de la API de chat de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=CONFIGURACION_POR_DEFECTO["latencia"])
+    parser.add_argument("--tokens-por-segundo", type=float, default=CONFIGURACION_POR_DEFECTO["tokens_por_segundo"])
+    parser.add_argument("--tasa-errores", type=float, default=CONFIGURACION_POR_DEFECTO["tasa_errores"])
+    parser.add_argument("--tasa-429", type=float, default=CONFIGURACION_POR_DEFECTO["tasa_429"])
+    parser.add_argument("--reintentar-despues", type=float, default=CONFIGURACION_POR_DEFECTO["reintentar_despues"])
+    parser.add_argument("--ratio-salida", type=float, default=CONFIGURACION_POR_DEFECTO["ratio_salida"])
+    parser.add_argument("--latencia-lote", type=float, default=CONFIGURACION_POR_DEFECTO["latencia_lote"])
+    parser.add_argument("--semilla", type=int, default=0)
+    argumentos = parser.parse_args()
+
+    configuracion = {clave: valor for clave, valor in vars(argumentos).items() if clave not in ("host", "puerto")}
+    servidor = ServidorSimulado((argumentos.host, argumentos.puerto), **configuracion)
+    print(f"Servidor simulado en {servidor.url}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Configuración de la caché persistente (modificable mediante variables de entorno)
+DIRECTORIO_CACHE = os.getenv("TEXTEADOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "texteador"))
+MAX_BYTES_POR_DEFECTO = int(float(os.getenv("TEXTEADOR_CACHE_MAX_MB", "512")) * 1024 * 1024)
+TTL_POR_DEFECTO = float(os.getenv("TEXTEADOR_CACHE_TTL_DIAS", "30")) * 24 * 3600
+CACHE_ACTIVA = os.getenv("TEXTEADOR_CACHE", "1") != "0"
+
+# Función para calcular la clave de una solicitud a partir de su contenido (modelo, mensajes y parámetros de muestreo)
+def calcular_clave(model, messages, parametros):
+    contenido = json.dumps(
+        {"model": model, "messages": messages, "parametros": parametros},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+# Las lecturas no escriben en la base de datos: los aciertos, los fallos y la fecha de último acceso de las entradas
+# leídas se acumulan en memoria y se registran juntos cada MAX_ACCESOS_PENDIENTES lecturas o INTERVALO_REGISTRO_S
+# segundos, de modo que las lecturas en paralelo no compiten por el bloqueo de escritura de SQLite
+MAX_ACCESOS_PENDIENTES = 64
+INTERVALO_REGISTRO_S = 5.0
+
+# Caché de respuestas de la API en SQLite (modo WAL), compartida por todos los procesos que usen el mismo archivo.
+# Cada hilo abre su propia conexión; la expulsión es LRU por tamaño total y las entradas caducan tras `ttl` segundos.
+# El tamaño total se lleva en el contador "bytes", actualizado en la misma transacción que cada inserción o borrado.
+class CacheLLM:
+    def __init__(self, ruta=None, max_bytes=MAX_BYTES_POR_DEFECTO, ttl=TTL_POR_DEFECTO):
+        self.ruta = ruta or os.path.join(DIRECTORIO_CACHE, "respuestas.sqlite3")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._local = threading.local()
+        self._bloqueo = threading.Lock()
+        self._accesos = {}
+        self._pendientes = {"aciertos": 0, "fallos": 0}
+        self._ultimo_registro = time.time()
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                "clave TEXT PRIMARY KEY, valor TEXT NOT NULL, tamano INTEGER NOT NULL, "
+                "creado REAL NOT NULL, accedido REAL NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_accedido ON respuestas (accedido)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_creado ON respuestas (creado)")
+            conexion.execute("CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+            # Las cachés creadas antes de llevar el tamaño total lo calculan una sola vez
+            conexion.execute(
+                "INSERT OR IGNORE INTO contadores (nombre, valor) SELECT 'bytes', COALESCE(SUM(tamano), 0) FROM respuestas"
+            )
+        atexit.register(self.registrar_accesos)
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def _contar(self, conexion, nombre, cantidad=1):
+        conexion.execute(
+            "INSERT INTO contadores (nombre, valor) VALUES (?, ?) "
+            "ON CONFLICT(nombre) DO UPDATE SET valor = valor + excluded.valor",
+            (nombre, cantidad)
+        )
+
+    # Obtener una respuesta almacenada, o None si no existe o ha caducado (las caducadas se eliminan al guardar)
+    def obtener(self, clave):
+        ahora = time.time()
+        fila = self._conexion().execute("SELECT valor, creado FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+        if fila is not None and self.ttl and ahora - fila[1] > self.ttl:
+            fila = None
+        with self._bloqueo:
+            if fila is None:
+                self.fallos += 1
+                self._pendientes["fallos"] += 1
+            else:
+                self.aciertos += 1
+                self._pendientes["aciertos"] += 1
+                self._accesos[clave] = ahora
+            registrar = sum(self._pendientes.values()) >= MAX_ACCESOS_PENDIENTES or ahora - self._ultimo_registro >= INTERVALO_REGISTRO_S
+        if registrar:
+            self.registrar_accesos()
+        return None if fila is None else json.loads(fila[0])
+
+    # Comprobar si hay una respuesta vigente para la clave, sin contarlo como acierto ni como fallo
+    def contiene(self, clave):
+        fila = self._conexion().execute("SELECT creado FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+        return fila is not None and not (self.ttl and time.time() - fila[0] > self.ttl)
+
+    # Escribir en una sola transacción los accesos y contadores acumulados desde el último registro
+    def registrar_accesos(self):
+        with self._bloqueo:
+            accesos, pendientes = self._accesos, self._pendientes
+            self._accesos, self._pendientes = {}, {"aciertos": 0, "fallos": 0}
+            self._ultimo_registro = time.time()
+        if not accesos and not any(pendientes.values()):
+            return
+        with self._conexion() as conexion:
+            conexion.executemany("UPDATE respuestas SET accedido = ? WHERE clave = ?", [(t, c) for c, t in accesos.items()])
+            for nombre, cantidad in pendientes.items():
+                if cantidad:
+                    self._contar(conexion, nombre, cantidad)
+
+    # Guardar una respuesta y expulsar las menos usadas recientemente si se supera el tamaño máximo
+    def guardar(self, clave, valor):
+        datos = json.dumps(valor, ensure_ascii=False)
+        tamano = len(datos.encode("utf-8"))
+        ahora = time.time()
+        with self._conexion() as conexion:
+            # La transacción se abre antes de leer el tamaño anterior, para que el total no se desajuste entre procesos
+            conexion.execute("BEGIN IMMEDIATE")
+            anterior = conexion.execute("SELECT tamano FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, valor, tamano, creado, accedido) VALUES (?, ?, ?, ?, ?)",
+                (clave, datos, tamano, ahora, ahora)
+            )
+            self._contar(conexion, "bytes", tamano - (anterior[0] if anterior else 0))
+            self._expulsar(conexion)
+
+    def _expulsar(self, conexion):
+        if self.ttl:
+            limite = time.time() - self.ttl
+            caducados = conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas WHERE creado < ?", (limite,)).fetchone()[0]
+            if caducados:
+                conexion.execute("DELETE FROM respuestas WHERE creado < ?", (limite,))
+                self._contar(conexion, "bytes", -caducados)
+        liberar = conexion.execute("SELECT valor FROM contadores WHERE nombre = 'bytes'").fetchone()[0] - self.max_bytes
+        while liberar > 0:
+            filas = conexion.execute("SELECT clave, tamano FROM respuestas ORDER BY accedido LIMIT 100").fetchall()
+            if not filas:
+                break
+            expulsadas = []
+            for clave, tamano in filas:
+                if liberar <= 0:
+                    break
+                expulsadas.append((clave,))
+                liberar -= tamano
+                self._contar(conexion, "bytes", -tamano)
+            conexion.executemany("DELETE FROM respuestas WHERE clave = ?", expulsadas)
+
+    # Contadores de aciertos y fallos de este proceso y acumulados entre todos los procesos
+    def estadisticas(self):
+        self.registrar_accesos()
+        with self._conexion() as conexion:
+            globales = dict(conexion.execute("SELECT nombre, valor FROM contadores").fetchall())
+            entradas = conexion.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "aciertos_totales": globales.get("aciertos", 0),
+            "fallos_totales": globales.get("fallos", 0),
+            "entradas": entradas,
+            "bytes": globales.get("bytes", 0),
+        }
+
+    def limpiar(self):
+        with self._bloqueo:
+            self._accesos, self._pendientes = {}, {"aciertos": 0, "fallos": 0}
+        with self._conexion() as conexion:
+            conexion.execute("DELETE FROM respuestas")
+            conexion.execute("DELETE FROM contadores")
+            conexion.execute("INSERT INTO contadores (nombre, valor) VALUES ('bytes', 0)")
+
+_cache = None
+_bloqueo_cache = threading.Lock()
+
+# Obtener la caché compartida del proceso (None si está desactivada)
+def obtener_cache():
+    global _cache
+    if not CACHE_ACTIVA:
+        return None
+    with _bloqueo_cache:
+        if _cache is None:
+            _cache = CacheLLM()
+    return _cache
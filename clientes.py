@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+
+import httpx
+import openai
+
+# Grupo de conexiones HTTP compartido por todos los clientes del proceso (modificable mediante variables de entorno)
+MAX_CONEXIONES = int(os.getenv("TEXTEADOR_CONEXIONES_MAX", "64"))
+CONEXIONES_VIVAS = int(os.getenv("TEXTEADOR_CONEXIONES_VIVAS", "32"))
+EXPIRACION_CONEXIONES = float(os.getenv("TEXTEADOR_CONEXIONES_EXPIRACION_S", "120"))
+
+# Tiempos de espera por defecto, en segundos: la lectura es larga porque una respuesta puede tardar minutos
+TIMEOUT_CONEXION = float(os.getenv("TEXTEADOR_TIMEOUT_CONEXION_S", "10"))
+TIMEOUT_LECTURA = float(os.getenv("TEXTEADOR_TIMEOUT_LECTURA_S", "300"))
+
+# Abrir una conexión con la API al iniciar la aplicación, para que la primera solicitud no pague el establecimiento
+PRECALENTAR = os.getenv("TEXTEADOR_PRECALENTAR", "0") != "0"
+
+# Configuración por modelo: tiempo de lectura y, opcionalmente, otra URL base o la variable de entorno con su clave.
+# Se puede ampliar con TEXTEADOR_CONFIG_MODELOS (JSON con el mismo formato, en línea o en un archivo).
+CONFIGURACION_MODELOS = {
+    "gpt-4o-mini": {"timeout_lectura": 120},
+    "gpt-4o-2024-08-06": {"timeout_lectura": 600},
+}
+
+def _cargar_configuracion_modelos():
+    configuracion = {modelo: dict(valores) for modelo, valores in CONFIGURACION_MODELOS.items()}
+    adicional = os.getenv("TEXTEADOR_CONFIG_MODELOS")
+    if adicional:
+        if os.path.exists(adicional):
+            with open(adicional, encoding="utf-8") as archivo:
+                adicional = archivo.read()
+        for modelo, valores in json.loads(adicional).items():
+            configuracion.setdefault(modelo, {}).update(valores)
+    return configuracion
+
+# Registro de clientes de la API compartido por todas las sesiones del proceso. Todos los clientes usan el mismo
+# grupo de conexiones persistentes, así que las nuevas ejecuciones de Streamlit reutilizan conexiones ya abiertas.
+# Los clientes no reintentan por su cuenta: de eso se encarga el limitador (ver limitador.py).
+class RegistroClientes:
+    def __init__(self):
+        self.configuracion_modelos = _cargar_configuracion_modelos()
+        self._http = None
+        self._clientes = {}
+        self._bloqueo = threading.Lock()
+
+    def _grupo_http(self):
+        if self._http is None:
+            self._http = openai.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONEXIONES, max_keepalive_connections=CONEXIONES_VIVAS,
+                    keepalive_expiry=EXPIRACION_CONEXIONES
+                ),
+                timeout=httpx.Timeout(TIMEOUT_LECTURA, connect=TIMEOUT_CONEXION),
+            )
+        return self._http
+
+    # Cliente para un modelo (o el cliente general si no se indica); None si no hay clave de API configurada
+    def obtener(self, model=None):
+        configuracion = self.configuracion_modelos.get(model, {})
+        clave_api = os.getenv(configuracion.get("api_key_env", "OPENAI_API_KEY"))
+        if not clave_api:
+            return None
+        identificador = (configuracion.get("base_url"), clave_api, configuracion.get("timeout_lectura", TIMEOUT_LECTURA))
+        with self._bloqueo:
+            cliente = self._clientes.get(identificador)
+            if cliente is None:
+                cliente = self._clientes[identificador] = openai.OpenAI(
+                    api_key=clave_api,
+                    base_url=configuracion.get("base_url"),
+                    timeout=httpx.Timeout(identificador[2], connect=TIMEOUT_CONEXION),
+                    max_retries=0,
+                    http_client=self._grupo_http(),
+                )
+            return cliente
+
+    # Abrir en segundo plano una conexión con cada URL base configurada, que queda en el grupo para la primera solicitud
+    def precalentar(self):
+        clientes = [cliente for cliente in (self.obtener(modelo) for modelo in [None, *self.configuracion_modelos]) if cliente]
+        urls = {str(cliente.base_url) for cliente in clientes}
+
+        def abrir():
+            for url in urls:
+                try:
+                    self._grupo_http().head(url, timeout=TIMEOUT_CONEXION)
+                except Exception:
+                    pass  # el precalentamiento es opcional: la primera solicitud abrirá la conexión
+        threading.Thread(target=abrir, daemon=True).start()
+
+    def cerrar(self):
+        with self._bloqueo:
+            if self._http is not None:
+                self._http.close()
+            self._http = None
+            self._clientes = {}
+
+_registro = None
+_precalentado = False
+_bloqueo_registro = threading.Lock()
+
+# Obtener el registro de clientes del proceso; con TEXTEADOR_PRECALENTAR, la primera vez abre las conexiones
+def obtener_registro():
+    global _registro, _precalentado
+    with _bloqueo_registro:
+        if _registro is None:
+            _registro = RegistroClientes()
+        registro = _registro
+        precalentar = PRECALENTAR and not _precalentado
+        _precalentado = _precalentado or precalentar
+    if precalentar:
+        registro.precalentar()
+    return registro
+
+# Función para obtener el cliente compartido de la API para un modelo (None si no hay clave de API configurada)
+def obtener_cliente(model=None):
+    return obtener_registro().obtener(model)
@@ -0,0 +1,75 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from instrumentacion import contexto_para_tarea
+
+# Número de solicitudes simultáneas por defecto
+MAX_EN_VUELO_POR_DEFECTO = 4
+
+# Función para aplicar una función a cada elemento en paralelo, devolviendo los resultados en el orden original.
+# Los elementos se consumen de forma perezosa: nunca hay más de `max_en_vuelo` tareas pendientes, por lo que
+# `elementos` puede ser un generador que aún se está produciendo.
+# `al_completar(indice, resultado, error, completados)` se invoca en el hilo que llama, a medida que llegan los
+# resultados, por lo que puede usarse para actualizar la interfaz de Streamlit.
+# Devuelve (resultados, errores): `resultados[i]` es None si el elemento i falló y `errores` asocia índice -> excepción.
+# Con `conservar=False`, los resultados solo se entregan a `al_completar` y `resultados` queda con None (p. ej. si
+# se vuelcan a disco a medida que llegan), de modo que la memoria no crece con el número de elementos.
+# Cada tarea se ejecuta en una copia del contexto del hilo que llama, de modo que sus tramos quedan en la traza
+# de la ejecución en curso y registran cuánto esperaron en cola.
+def ejecutar_en_orden(funcion, elementos, max_en_vuelo=MAX_EN_VUELO_POR_DEFECTO, al_completar=None, conservar=True):
+    max_en_vuelo = max(1, int(max_en_vuelo))
+    resultados = []
+    errores = {}
+    completados = 0
+    iterador = enumerate(elementos)
+    agotado = False
+
+    with ThreadPoolExecutor(max_workers=max_en_vuelo) as ejecutor:
+        pendientes = {}
+
+        def llenar():
+            nonlocal agotado
+            while not agotado and len(pendientes) < max_en_vuelo:
+                try:
+                    indice, elemento = next(iterador)
+                except StopIteration:
+                    agotado = True
+                    return
+                resultados.append(None)
+                pendientes[ejecutor.submit(contexto_para_tarea().run, funcion, elemento)] = indice
+
+        llenar()
+        while pendientes:
+            listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                indice = pendientes.pop(futuro)
+                resultado, error = None, futuro.exception()
+                if error is None:
+                    resultado = futuro.result()
+                    if conservar:
+                        resultados[indice] = resultado
+                else:
+                    errores[indice] = error
+                completados += 1
+                if al_completar:
+                    al_completar(indice, resultado, error, completados)
+            llenar()
+
+    return resultados, errores
+
+# Función para aplicar una función a cada elemento con un ejecutor dado (de hilos o de procesos) y entregar los
+# resultados en orden, como generador, a medida que están disponibles. Mantiene como máximo `max_en_vuelo`
+# tareas pendientes, de modo que la memoria no crece con el número de elementos. Los errores se propagan.
+def iterar_en_orden(ejecutor, funcion, elementos, max_en_vuelo=MAX_EN_VUELO_POR_DEFECTO):
+    max_en_vuelo = max(1, int(max_en_vuelo))
+    pendientes = deque()
+    try:
+        for elemento in elementos:
+            pendientes.append(ejecutor.submit(funcion, elemento))
+            if len(pendientes) >= max_en_vuelo:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+    finally:
+        for futuro in pendientes:
+            futuro.cancel()
@@ -0,0 +1,222 @@
+import heapq
+import math
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+from array import array
+
+from cache_llm import DIRECTORIO_CACHE
+from fragmentacion import contar_tokens
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él las consultas se puntúan en Python puro
+    np = None
+
+# Parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Tamaño máximo de un pasaje en bytes; los párrafos más largos se cortan en saltos de línea
+MAX_BYTES_PASAJE = 2000
+
+SEPARADOR_PARRAFOS = re.compile(rb"\n[ \t\r]*\n")
+PALABRA = re.compile(r"\w{3,}")
+
+PALABRAS_VACIAS = frozenset("""
+las los del una uno unos unas por para con sin que como pero sus ese esa esos esas este esta estos estas
+the and for with that this from are was were been have has not but its their they them which
+""".split())
+
+# Función para obtener los términos de un texto tal como se indexan
+def extraer_terminos(texto):
+    return [palabra for palabra in PALABRA.findall(texto.lower()) if palabra not in PALABRAS_VACIAS]
+
+# Antigüedad a partir de la cual se eliminan los textos de corpus que ningún proceso cerró (p. ej. tras un fallo)
+ANTIGUEDAD_ABANDONADOS_S = 24 * 3600
+
+def _limpiar_abandonados(base):
+    limite = time.time() - ANTIGUEDAD_ABANDONADOS_S
+    for nombre in os.listdir(base):
+        ruta = os.path.join(base, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                shutil.rmtree(ruta) if os.path.isdir(ruta) else os.remove(ruta)
+        except OSError:
+            pass  # otro proceso lo eliminó antes
+
+# Corpus de textos fuente en disco, proyectado en memoria (mmap) e indexado con un índice invertido BM25.
+# Solo se guardan desplazamientos de pasajes y listas de apariciones compactas; el texto de un pasaje
+# se decodifica del archivo proyectado cuando se pide, sin copiar el corpus.
+class CorpusFuente:
+    def __init__(self, rutas, nombres=None):
+        self.rutas = [os.fspath(ruta) for ruta in rutas]
+        self.nombres = list(nombres) if nombres else [os.path.basename(ruta) for ruta in self.rutas]
+        # Directorio temporal de los textos de `desde_textos`, que se elimina al cerrar
+        self._temporal = None
+        self._archivos = []
+        self._mapas = []
+        # Pasajes: archivo, inicio y fin (en bytes) y longitud en términos
+        self.pasaje_archivo = array("I")
+        self.pasaje_inicio = array("Q")
+        self.pasaje_fin = array("Q")
+        self.pasaje_longitud = array("I")
+        # Índice invertido: término -> (identificadores de pasaje, frecuencias)
+        self.indice = {}
+        for numero, ruta in enumerate(self.rutas):
+            self._indexar_archivo(numero, ruta)
+        self.longitud_media = (sum(self.pasaje_longitud) / len(self.pasaje_longitud)) if self.pasaje_longitud else 0.0
+
+    def _indexar_archivo(self, numero, ruta):
+        archivo = open(ruta, "rb")
+        self._archivos.append(archivo)
+        if os.fstat(archivo.fileno()).st_size == 0:
+            self._mapas.append(b"")
+            return
+        mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapas.append(mapa)
+        inicio = 0
+        for separador in SEPARADOR_PARRAFOS.finditer(mapa):
+            self._indexar_parrafo(numero, mapa, inicio, separador.start())
+            inicio = separador.end()
+        self._indexar_parrafo(numero, mapa, inicio, len(mapa))
+
+    def _indexar_parrafo(self, numero, mapa, inicio, fin):
+        while fin - inicio > MAX_BYTES_PASAJE:
+            corte = mapa.rfind(b"\n", inicio, inicio + MAX_BYTES_PASAJE)
+            if corte <= inicio:
+                corte = mapa.rfind(b" ", inicio, inicio + MAX_BYTES_PASAJE)
+            if corte <= inicio:
+                corte = inicio + MAX_BYTES_PASAJE
+            self._indexar_pasaje(numero, mapa, inicio, corte)
+            inicio = corte
+        self._indexar_pasaje(numero, mapa, inicio, fin)
+
+    def _indexar_pasaje(self, numero, mapa, inicio, fin):
+        terminos = extraer_terminos(mapa[inicio:fin].decode("utf-8", errors="ignore"))
+        if not terminos:
+            return
+        identificador = len(self.pasaje_inicio)
+        self.pasaje_archivo.append(numero)
+        self.pasaje_inicio.append(inicio)
+        self.pasaje_fin.append(fin)
+        self.pasaje_longitud.append(len(terminos))
+        frecuencias = {}
+        for termino in terminos:
+            frecuencias[termino] = frecuencias.get(termino, 0) + 1
+        for termino, frecuencia in frecuencias.items():
+            apariciones = self.indice.get(termino)
+            if apariciones is None:
+                apariciones = self.indice[termino] = (array("I"), array("I"))
+            apariciones[0].append(identificador)
+            apariciones[1].append(frecuencia)
+
+    # Crear un corpus a partir de textos ya extraídos (pares nombre, texto). Los textos se escriben en un directorio
+    # temporal dentro de la caché, desde donde se proyectan en memoria, y el directorio se elimina al cerrar el corpus.
+    @classmethod
+    def desde_textos(cls, textos, directorio=None):
+        base = directorio or os.path.join(DIRECTORIO_CACHE, "corpus")
+        os.makedirs(base, exist_ok=True)
+        _limpiar_abandonados(base)
+        temporal = tempfile.mkdtemp(prefix="corpus-", dir=base)
+        try:
+            rutas, nombres = [], []
+            for numero, (nombre, texto) in enumerate(textos):
+                ruta = os.path.join(temporal, f"{numero}.txt")
+                with open(ruta, "wb") as archivo:
+                    archivo.write(texto.encode("utf-8"))
+                rutas.append(ruta)
+                nombres.append(nombre)
+            corpus = cls(rutas, nombres)
+        except BaseException:
+            shutil.rmtree(temporal, ignore_errors=True)
+            raise
+        corpus._temporal = temporal
+        return corpus
+
+    def __len__(self):
+        return len(self.pasaje_inicio)
+
+    # Texto de un pasaje, decodificado directamente del archivo proyectado
+    def texto_pasaje(self, identificador):
+        mapa = self._mapas[self.pasaje_archivo[identificador]]
+        return mapa[self.pasaje_inicio[identificador]:self.pasaje_fin[identificador]].decode("utf-8", errors="ignore").strip()
+
+    # Nombre del archivo del que proviene un pasaje
+    def archivo_pasaje(self, identificador):
+        return self.nombres[self.pasaje_archivo[identificador]]
+
+    # Seleccionar el texto relevante para un conjunto de consultas (p. ej. las líneas de una rama de un árbol): se
+    # buscan los mejores `por_consulta` pasajes de cada consulta y se conservan los de mayor puntuación hasta
+    # `max_tokens`. Devuelve su texto en el orden del corpus.
+    def seleccionar(self, consultas, max_tokens, model="gpt-4o-mini", por_consulta=3):
+        mejores = {}
+        for consulta in consultas:
+            for identificador, puntuacion in self.buscar(consulta, k=por_consulta):
+                mejores[identificador] = max(puntuacion, mejores.get(identificador, 0.0))
+        elegidos = []
+        usados = 0
+        for identificador, _ in sorted(mejores.items(), key=lambda elemento: -elemento[1]):
+            tokens = contar_tokens(self.texto_pasaje(identificador), model)
+            if usados + tokens > max_tokens:
+                continue
+            elegidos.append(identificador)
+            usados += tokens
+        return "\n\n".join(self.texto_pasaje(identificador) for identificador in sorted(elegidos))
+
+    # Buscar los `k` pasajes más relevantes para una consulta según BM25; devuelve [(identificador, puntuación)]
+    def buscar(self, consulta, k=5):
+        total = len(self)
+        if not total:
+            return []
+        terminos = set(extraer_terminos(consulta))
+        if np is not None:
+            return self._buscar_numpy(terminos, k, total)
+        puntuaciones = {}
+        for termino in terminos:
+            apariciones = self.indice.get(termino)
+            if apariciones is None:
+                continue
+            identificadores, frecuencias = apariciones
+            idf = math.log(1 + (total - len(identificadores) + 0.5) / (len(identificadores) + 0.5))
+            for identificador, frecuencia in zip(identificadores, frecuencias):
+                norma = BM25_K1 * (1 - BM25_B + BM25_B * self.pasaje_longitud[identificador] / self.longitud_media)
+                puntuaciones[identificador] = puntuaciones.get(identificador, 0.0) + idf * frecuencia * (BM25_K1 + 1) / (frecuencia + norma)
+        return heapq.nlargest(k, puntuaciones.items(), key=lambda item: item[1])
+
+    def _buscar_numpy(self, terminos, k, total):
+        longitudes = np.frombuffer(self.pasaje_longitud, dtype=np.uint32)
+        puntuaciones = np.zeros(total, dtype=np.float64)
+        for termino in terminos:
+            apariciones = self.indice.get(termino)
+            if apariciones is None:
+                continue
+            identificadores = np.frombuffer(apariciones[0], dtype=np.uint32)
+            frecuencias = np.frombuffer(apariciones[1], dtype=np.uint32).astype(np.float64)
+            idf = math.log(1 + (total - len(identificadores) + 0.5) / (len(identificadores) + 0.5))
+            norma = BM25_K1 * (1 - BM25_B + BM25_B * longitudes[identificadores] / self.longitud_media)
+            puntuaciones[identificadores] += idf * frecuencias * (BM25_K1 + 1) / (frecuencias + norma)
+        k = min(k, total)
+        mejores = np.argpartition(-puntuaciones, k - 1)[:k]
+        mejores = mejores[np.argsort(-puntuaciones[mejores])]
+        return [(int(i), float(puntuaciones[i])) for i in mejores if puntuaciones[i] > 0]
+
+    def cerrar(self):
+        for mapa in self._mapas:
+            if isinstance(mapa, mmap.mmap):
+                mapa.close()
+        for archivo in self._archivos:
+            archivo.close()
+        self._mapas, self._archivos = [], []
+        if self._temporal:
+            shutil.rmtree(self._temporal, ignore_errors=True)
+            self._temporal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
@@ -0,0 +1,267 @@
+# Lógica de descomposición jerárquica, sin dependencias de Streamlit: la usan la página Descom y el procesamiento por lotes
+from datetime import datetime
+from llm import completar_chat
+from fragmentacion import contar_tokens, dividir_por_tokens
+from corpus import CorpusFuente
+from arbol import Arbol, injertar_en_esqueleto
+
+def generar_prompt_descomposicion(texto, arbol_referencial=None):
+    if arbol_referencial:
+        prompt = f"""
+## Task: Deepening the Provided Hierarchical Content Tree
+
+### Important Instructions:
+
+1. Start from the Provided Tree:
+   - Use the given reference tree as the foundation.
+   - Do not alter the initial structure of the tree.
+   - Only deepen the hierarchy further by breaking down the content into more granular, atomic units.
+
+2. Deepen Each Branch:
+   - Expand each branch of the provided tree by decomposing the text down to the most detailed level possible.
+   - The goal is to reach the atomic units of information for each segment of the tree.
+
+3. Line-by-Line Analysis:
+   - Perform the analysis on a line-by-line basis, ensuring that each line is fully broken down to the atomic level before moving to the next.
+   - Continue deepening until you reach the maximum level of detail possible.
+
+4. Output in Spanish:
+   - Ensure that all outputs, including titles, subtitles, and atomic units, are written in Spanish.
+
+### Reference Content Tree:
+{arbol_referencial}
+
+### Example of Expected Output:
+
+Given the following tree:
+```
+- Título General
+  - Título Principal 1
+    - Subtítulo 1.1
+```
+
+Expand it as follows:
+```
+- Título General
+  - Título Principal 1
+    - Subtítulo 1.1
+      - Unidad Atómica 1.1.1
+      - Unidad Atómica 1.1.2
+      - Unidad Atómica 1.1.3
+  - Título Principal 2
+    - Subtítulo 2.1
+      - Unidad Atómica 2.1.1
+      - Unidad Atómica 2.1.2
+```
+
+### Text to Decompose:
+<cont>{texto}</cont>
+
+### Execute:
+- Decompose the text provided by deepening the reference tree down to the atomic level for each branch.
+"""
+    else:
+        prompt = f"""
+## Task: Recursive Hierarchical Decomposition of Text
+
+### Steps:
+
+1. Analyze the Text:
+   - Read the text between `<cont>` tags. Ensure complete understanding.
+
+2. Define General Title:
+   - Create a clear, concise title that encapsulates the entire text.
+
+3. Perform Hierarchical Decomposition:
+   - Main Titles: Identify and define the main sections.
+   - Subtitles: Break down each main title into precise subtitles.
+   - Atomic Units: Further decompose each subtitle down to the most granular, atomic level. Ensure every line reaches this level.
+
+4. Structure the Hierarchy:
+   - Use dashes (`-`) to represent each level of the hierarchy.
+   - Indent properly to reflect subordination.
+   - Ensure each level is consistently detailed. Each title and subtitle must be fully broken down to atomic units.
+
+5. Line-by-Line Analysis:
+   - Perform the analysis on a line-by-line basis, ensuring that each line is fully broken down to the atomic level before moving to the next.
+   - Continue deepening until you reach the maximum level of detail possible.
+
+6. Output in Spanish:
+   - Ensure that all outputs, including titles, subtitles, and atomic units, are written in Spanish.
+
+### Guidelines:
+
+- Be Concise: Titles and subtitles must be short, descriptive, and devoid of redundancy.
+- Consistency: Maintain uniform detail across all levels.
+- Classify Unclear Content: Any ambiguous sections go under "Others."
+- Exclude Irrelevant Information: Disregard non-essential elements like metadata or side notes.
+
+### Example of Expected Output:
+```
+- Título General
+  - Título Principal 1
+    - Subtítulo 1.1
+      - Unidad Atómica 1.1.1
+      - Unidad Atómica 1.1.2
+  - Título Principal 2
+    - Subtítulo 2.1
+      - Unidad Atómica 2.1.1
+```
+
+### Text to Decompose:
+<cont>{texto}</cont>
+"""
+    return prompt
+
+# Modelo y salida máxima de la descomposición
+MODELO_DESCOMPOSICION = "gpt-4o-2024-08-06"
+MAX_TOKENS_DESCOMPOSICION = 16000
+
+# Parámetros de la solicitud de descomposición, compartidos por el modo completo y el modo en flujo
+def preparar_solicitud_descomposicion(texto, arbol_referencial=None):
+    prompt = generar_prompt_descomposicion(texto, arbol_referencial)
+    return dict(
+        model=MODELO_DESCOMPOSICION,
+        messages=[
+            {"role": "system", "content": "Eres un asistente de IA para análisis de texto y estructuración de contenido."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0,
+        max_tokens=MAX_TOKENS_DESCOMPOSICION,
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0
+    )
+
+# Tamaño de sección por defecto (en tokens) para la descomposición por secciones de documentos extensos
+TOKENS_POR_SECCION = 8000
+
+# Función para generar el prompt que fusiona el esqueleto de los árboles parciales en una sola jerarquía
+def generar_prompt_fusion(esqueleto):
+    return f"""
+## Task: Merge Partial Content Trees into a Single Hierarchy
+
+The following skeleton lists, in document order, the main sections found in consecutive parts of one text.
+Each line `[n] Title` stands for a fully decomposed branch that will be grafted automatically later.
+
+### Instructions:
+
+1. Write a clear, concise general title for the whole text as the first line: `- Título General`.
+2. Reference every item exactly once, as a line `- [n]` indented under the general title.
+3. Items that continue the same topic across parts may be grouped under a new, short parent title.
+4. Keep the original order unless grouping requires otherwise. Do not invent content.
+5. Use dashes (`-`) and two-space indentation. Output only the tree, in Spanish.
+
+### Skeleton:
+{esqueleto}
+"""
+
+# Función para dividir un texto extenso en secciones según un presupuesto de tokens
+def dividir_en_secciones(texto, tokens_por_seccion=TOKENS_POR_SECCION):
+    return dividir_por_tokens(texto, tokens_por_seccion, model=MODELO_DESCOMPOSICION)
+
+# Función para descomponer una sección del texto (fase de mapeo)
+def descomponer_seccion(client, seccion):
+    return completar_chat(client, **preparar_solicitud_descomposicion(seccion))["contenido"]
+
+# Función para fusionar los árboles parciales: un único paso del modelo ordena el esqueleto (títulos principales)
+# y después se injertan localmente las ramas completas bajo él (fase de reducción)
+def fusionar_arboles(client, arboles_parciales):
+    ramas = []
+    for arbol in arboles_parciales:
+        # Se descarta el título general de cada sección; sus títulos principales pasan a ser ramas
+        ramas.extend(Arbol.desde_texto(arbol).dividir_en_ramas()[1])
+
+    esqueleto = "\n".join(f"[{i + 1}] {rama.textos[0]}" for i, rama in enumerate(ramas))
+    respuesta = completar_chat(
+        client,
+        model=MODELO_DESCOMPOSICION,
+        messages=[
+            {"role": "system", "content": "Eres un asistente de IA para análisis de texto y estructuración de contenido."},
+            {"role": "user", "content": generar_prompt_fusion(esqueleto)}
+        ],
+        temperature=0,
+        max_tokens=4000,
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0
+    )["contenido"]
+
+    return injertar_en_esqueleto(respuesta, ramas).a_texto()
+
+# Presupuesto de texto fuente por rama (en tokens) en la profundización por ramas y pasajes consultados por cada línea
+TOKENS_FUENTE_RAMA = 12000
+PASAJES_POR_LINEA = 3
+
+# Función para generar el prompt que profundiza una sola rama del árbol referencial
+def generar_prompt_profundizacion(rama, ruta, texto):
+    return f"""
+## Task: Deepening One Branch of a Hierarchical Content Tree
+
+The branch below belongs to a larger reference tree, at: {ruta}.
+The other branches are deepened separately, so work only on this branch.
+
+### Important Instructions:
+
+1. Keep the Branch Unchanged:
+   - Keep every line of the branch exactly as written, at the same level and in the same order.
+   - Do not rename, merge or remove lines, and do not add lines at the level of the first line.
+
+2. Deepen Each Line:
+   - Break down the text covered by each line into more granular, atomic units, as new indented lines beneath it.
+   - Continue deepening until you reach the maximum level of detail possible.
+
+3. Use Only the Relevant Text:
+   - The text contains the passages related to this branch; ignore passages about other topics.
+
+4. Output Format:
+   - Use dashes (`-`) and two-space indentation. Output only the deepened branch, in Spanish.
+
+### Branch:
+{rama}
+
+### Text to Decompose:
+<cont>{texto}</cont>
+"""
+
+# Función para obtener el texto fuente de cada rama: el texto completo si cabe en el presupuesto de una rama; si no,
+# los pasajes más relevantes para las líneas de la rama, buscados en un corpus indexado del texto
+def fuentes_de_ramas(texto, ramas, max_tokens=TOKENS_FUENTE_RAMA):
+    if contar_tokens(texto, MODELO_DESCOMPOSICION) <= max_tokens:
+        return [texto] * len(ramas)
+    with CorpusFuente.desde_textos([("texto", texto)]) as corpus:
+        return [corpus.seleccionar(rama.textos, max_tokens, MODELO_DESCOMPOSICION, PASAJES_POR_LINEA) for rama in ramas]
+
+# Función para profundizar una rama del árbol referencial con su texto fuente. Lo que genera el modelo se injerta
+# bajo la rama original: la raíz de la respuesta se identifica con la de la rama y los nodos con el mismo texto que
+# los originales se funden con ellos, de modo que las líneas originales se conservan aunque el modelo las omita.
+# Si la respuesta queda truncada se lanza ValueError, para conservar la rama sin profundizar.
+def profundizar_rama(client, rama, texto, ruta):
+    respuesta = completar_chat(
+        client,
+        model=MODELO_DESCOMPOSICION,
+        messages=[
+            {"role": "system", "content": "Eres un asistente de IA para análisis de texto y estructuración de contenido."},
+            {"role": "user", "content": generar_prompt_profundizacion(rama.a_texto(), ruta, texto)}
+        ],
+        temperature=0,
+        max_tokens=MAX_TOKENS_DESCOMPOSICION,
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0
+    )
+    if respuesta["finish_reason"] == "length":
+        raise ValueError("la respuesta quedó incompleta")
+    profundizada = Arbol.desde_texto(respuesta["contenido"])
+    combinada = Arbol()
+    combinada.injertar(rama)
+    # Si la respuesta tiene varias raíces, el modelo omitió la primera línea: cuelgan de la rama
+    desplazamiento = 0 if len(profundizada.raices()) == 1 else 1
+    for indice, (profundidad, texto_nodo) in enumerate(zip(profundizada.profundidades, profundizada.textos)):
+        combinada.agregar(profundidad + desplazamiento, rama.textos[0] if indice == 0 and not desplazamiento else texto_nodo)
+    return combinada.fusionado(min_nodos=None)[0]
+
+# Función para generar el nombre del archivo del árbol resultante
+def generar_nombre_archivo(nombre_base, modelo=MODELO_DESCOMPOSICION):
+    fecha = datetime.now().strftime("%Y%m%d")
+    return f"{nombre_base}_arbol_{fecha}_{modelo}.txt"
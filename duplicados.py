@@ -0,0 +1,219 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cache_llm import CACHE_ACTIVA, DIRECTORIO_CACHE
+
+# Detección de fragmentos casi idénticos a otros ya traducidos (avisos legales, secciones repetidas, versiones
+# sucesivas de un informe). La caché de respuestas solo acierta si el texto es idéntico; este índice MinHash/LSH
+# encuentra los fragmentos que difieren en espacios, numeración o algunas oraciones, para reutilizar su traducción.
+
+# Configuración del índice (modificable mediante variables de entorno)
+DUPLICADOS_ACTIVOS = os.getenv("TEXTEADOR_DUPLICADOS", "1") != "0"
+MAX_ENTRADAS = int(os.getenv("TEXTEADOR_DUPLICADOS_MAX", "200000"))
+
+# Similitud de Jaccard estimada a partir de la cual dos fragmentos se consideran casi idénticos
+UMBRAL_SIMILITUD = float(os.getenv("TEXTEADOR_DUPLICADOS_UMBRAL", "0.8"))
+
+# Palabras por tejas (shingles) y permutaciones de la firma MinHash, repartidas en BANDAS bandas para el LSH: dos
+# fragmentos son candidatos si coinciden en todas las filas de alguna banda (umbral efectivo de ~0.5)
+PALABRAS_POR_TEJA = 4
+PERMUTACIONES = 64
+BANDAS = 16
+FILAS_POR_BANDA = PERMUTACIONES // BANDAS
+
+_PRIMO = (1 << 61) - 1
+_COEFICIENTES = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % (_PRIMO - 1) + 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _PRIMO)
+    for i in range(PERMUTACIONES)
+]
+
+PATRON_PALABRA = re.compile(r"\w+")
+PATRON_NUMERO = re.compile(r"\d+")
+PATRON_ORACION = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+# Función para normalizar un texto para compararlo: minúsculas, espacios colapsados y números sustituidos por 0,
+# de modo que una renumeración o un cambio de formato no cuenten como cambios
+def normalizar_comparacion(texto):
+    return " ".join(PATRON_NUMERO.sub("0", texto.lower()).split())
+
+def _hash64(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "big")
+
+# Función para calcular la firma MinHash de un texto a partir de sus tejas de palabras normalizadas
+def firma_minhash(texto):
+    palabras = PATRON_PALABRA.findall(normalizar_comparacion(texto))
+    tejas = {" ".join(palabras[i:i + PALABRAS_POR_TEJA]) for i in range(max(1, len(palabras) - PALABRAS_POR_TEJA + 1))}
+    valores = [_hash64(teja) for teja in tejas]
+    return [min((a * valor + b) % _PRIMO for valor in valores) for a, b in _COEFICIENTES]
+
+# Similitud de Jaccard estimada: fracción de permutaciones en las que coinciden las dos firmas
+def similitud_firmas(firma_a, firma_b):
+    return sum(1 for a, b in zip(firma_a, firma_b) if a == b) / PERMUTACIONES
+
+# Claves LSH de una firma: un hash por banda (entero de 63 bits, para SQLite)
+def _bandas(firma):
+    return [
+        _hash64(",".join(map(str, firma[banda * FILAS_POR_BANDA:(banda + 1) * FILAS_POR_BANDA]))) >> 1
+        for banda in range(BANDAS)
+    ]
+
+def dividir_oraciones(texto):
+    return [oracion.strip() for oracion in PATRON_ORACION.split(texto) if oracion.strip()]
+
+# Función para comparar dos versiones de un texto oración a oración (ignorando espacios y números).
+# Devuelve (cambios, fracción de oraciones cambiadas), con cada cambio como (operación, oraciones previas, oraciones
+# nuevas, oración previa anterior al cambio o None), donde la operación es "replace", "delete" o "insert".
+def diferencias_oraciones(previo, nuevo):
+    oraciones_previas, oraciones_nuevas = dividir_oraciones(previo), dividir_oraciones(nuevo)
+    comparador = difflib.SequenceMatcher(
+        None, [normalizar_comparacion(o) for o in oraciones_previas], [normalizar_comparacion(o) for o in oraciones_nuevas],
+        autojunk=False
+    )
+    cambios, cambiadas = [], 0
+    for operacion, i1, i2, j1, j2 in comparador.get_opcodes():
+        if operacion != "equal":
+            contexto = oraciones_previas[i1 - 1] if i1 else None
+            cambios.append((operacion, oraciones_previas[i1:i2], oraciones_nuevas[j1:j2], contexto))
+            cambiadas += max(i2 - i1, j2 - j1)
+    return cambios, cambiadas / max(1, len(oraciones_previas), len(oraciones_nuevas))
+
+# Función para trasladar a una traducción los números que cambiaron entre dos versiones de un texto que solo
+# difieren en números y espacios. Devuelve la traducción corregida, o None si algún cambio no se puede aplicar
+# sin ambigüedad: un número que pasa a valer dos cosas distintas (también si una de sus apariciones no cambia,
+# como en "artículo 5 … 5 días" → "artículo 6 … 5 días") o que no aparece tal cual en la traducción.
+def parchear_numeros(previo, nuevo, traduccion):
+    numeros_previos, numeros_nuevos = PATRON_NUMERO.findall(previo), PATRON_NUMERO.findall(nuevo)
+    if len(numeros_previos) != len(numeros_nuevos):
+        return None
+    correspondencias = {}
+    for anterior, actual in zip(numeros_previos, numeros_nuevos):
+        if correspondencias.setdefault(anterior, actual) != actual:
+            return None
+    sustituciones = {anterior: actual for anterior, actual in correspondencias.items() if anterior != actual}
+    for anterior in sustituciones:
+        if not re.search(rf"(?<!\d){anterior}(?!\d)", traduccion):
+            return None
+    if not sustituciones:
+        return traduccion
+    patron = re.compile(r"(?<!\d)(" + "|".join(map(re.escape, sustituciones)) + r")(?!\d)")
+    return patron.sub(lambda coincidencia: sustituciones[coincidencia.group(1)], traduccion)
+
+# Índice persistente de fragmentos traducidos en SQLite (modo WAL), compartido por todos los procesos que usen el
+# mismo archivo. Cada entrada pertenece a un contexto (modelo, idioma y prompt), de modo que solo se reutilizan
+# traducciones hechas con la misma configuración. Cada hilo abre su propia conexión; al superar `max_entradas`
+# se eliminan las menos usadas recientemente.
+class IndiceDuplicados:
+    def __init__(self, ruta=None, umbral=UMBRAL_SIMILITUD, max_entradas=MAX_ENTRADAS):
+        self.ruta = ruta or os.path.join(DIRECTORIO_CACHE, "duplicados.sqlite3")
+        self.umbral = umbral
+        self.max_entradas = max_entradas
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS fragmentos ("
+                "id INTEGER PRIMARY KEY, contexto TEXT NOT NULL, hash TEXT NOT NULL, texto TEXT NOT NULL, "
+                "traduccion TEXT NOT NULL, firma TEXT NOT NULL, usado REAL NOT NULL, UNIQUE (contexto, hash))"
+            )
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS bandas (contexto TEXT NOT NULL, banda INTEGER NOT NULL, "
+                "valor INTEGER NOT NULL, fragmento INTEGER NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_bandas ON bandas (contexto, banda, valor)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_bandas_fragmento ON bandas (fragmento)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_usado ON fragmentos (usado)")
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    # Buscar el fragmento traducido más parecido a `texto` en el contexto. Devuelve (similitud, texto previo,
+    # traducción previa) si supera el umbral, o None. La entrada del mismo texto tiene prioridad: como los números no
+    # cuentan en la firma, los fragmentos que solo difieren en ellos también tienen similitud 1.
+    def buscar(self, texto, contexto):
+        firma = firma_minhash(texto)
+        condiciones = " OR ".join("(banda = ? AND valor = ?)" for _ in range(BANDAS))
+        parametros = [valor for banda, clave in enumerate(_bandas(firma)) for valor in (banda, clave)]
+        clave = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+        with self._conexion() as conexion:
+            fila = conexion.execute(
+                "SELECT id, texto, traduccion FROM fragmentos WHERE contexto = ? AND hash = ?", (contexto, clave)
+            ).fetchone()
+            if fila is not None:
+                conexion.execute("UPDATE fragmentos SET usado = ? WHERE id = ?", (time.time(), fila[0]))
+                return 1.0, fila[1], fila[2]
+            filas = conexion.execute(
+                "SELECT id, texto, traduccion, firma FROM fragmentos WHERE id IN ("
+                f"SELECT DISTINCT fragmento FROM bandas WHERE contexto = ? AND ({condiciones}))",
+                (contexto, *parametros)
+            ).fetchall()
+            mejor = None
+            for identificador, previo, traduccion, firma_previa in filas:
+                similitud = similitud_firmas(firma, json.loads(firma_previa))
+                if similitud >= self.umbral and (mejor is None or similitud > mejor[0]):
+                    mejor = (similitud, identificador, previo, traduccion)
+            if mejor is None:
+                return None
+            conexion.execute("UPDATE fragmentos SET usado = ? WHERE id = ?", (time.time(), mejor[1]))
+        return mejor[0], mejor[2], mejor[3]
+
+    # Registrar la traducción de un fragmento en el contexto
+    def agregar(self, texto, traduccion, contexto):
+        firma = firma_minhash(texto)
+        clave = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+        with self._conexion() as conexion:
+            fila = conexion.execute("SELECT id FROM fragmentos WHERE contexto = ? AND hash = ?", (contexto, clave)).fetchone()
+            if fila is not None:
+                conexion.execute("UPDATE fragmentos SET traduccion = ?, usado = ? WHERE id = ?", (traduccion, time.time(), fila[0]))
+                return
+            identificador = conexion.execute(
+                "INSERT INTO fragmentos (contexto, hash, texto, traduccion, firma, usado) VALUES (?, ?, ?, ?, ?, ?)",
+                (contexto, clave, texto, traduccion, json.dumps(firma), time.time())
+            ).lastrowid
+            conexion.executemany(
+                "INSERT INTO bandas (contexto, banda, valor, fragmento) VALUES (?, ?, ?, ?)",
+                [(contexto, banda, valor, identificador) for banda, valor in enumerate(_bandas(firma))]
+            )
+            self._expulsar(conexion)
+
+    def _expulsar(self, conexion):
+        sobrantes = conexion.execute("SELECT COUNT(*) FROM fragmentos").fetchone()[0] - self.max_entradas
+        if sobrantes <= 0:
+            return
+        # Se libera un 10 % de margen para no expulsar en cada inserción
+        ids = [fila[0] for fila in conexion.execute(
+            "SELECT id FROM fragmentos ORDER BY usado LIMIT ?", (sobrantes + self.max_entradas // 10,)
+        )]
+        conexion.executemany("DELETE FROM bandas WHERE fragmento = ?", [(i,) for i in ids])
+        conexion.executemany("DELETE FROM fragmentos WHERE id = ?", [(i,) for i in ids])
+
+    def limpiar(self):
+        with self._conexion() as conexion:
+            conexion.execute("DELETE FROM bandas")
+            conexion.execute("DELETE FROM fragmentos")
+
+_indice = None
+_bloqueo_indice = threading.Lock()
+
+# Obtener el índice de duplicados compartido del proceso (None si está desactivado, también cuando lo está la caché
+# de respuestas: reutilizar traducciones previas es otra forma de caché)
+def obtener_indice_duplicados():
+    global _indice
+    if not DUPLICADOS_ACTIVOS or not CACHE_ACTIVA:
+        return None
+    with _bloqueo_indice:
+        if _indice is None:
+            _indice = IndiceDuplicados()
+    return _indice
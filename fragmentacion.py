@@ -0,0 +1,153 @@
+import re
+import threading
+import zlib
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken es opcional: sin él se usa una estimación por caracteres
+    tiktoken = None
+
+# Límites de los modelos usados por las herramientas (ventana de contexto y salida máxima, en tokens)
+LIMITES_MODELOS = {
+    "gpt-4o-mini": {"contexto": 128000, "salida": 16384},
+    "gpt-4o-2024-08-06": {"contexto": 128000, "salida": 16384},
+}
+LIMITES_POR_DEFECTO = {"contexto": 128000, "salida": 16384}
+
+# Caracteres por token usados cuando no hay tokenizador local disponible
+CARACTERES_POR_TOKEN = 4
+
+# Margen de seguridad para el formato de los mensajes y las diferencias de tokenización
+MARGEN_TOKENS = 64
+
+_codificadores = {}
+_bloqueo = threading.Lock()
+
+# Obtener el tokenizador local del modelo (None si tiktoken no está instalado o no puede cargar la codificación)
+def obtener_codificador(model="gpt-4o-mini"):
+    if tiktoken is None:
+        return None
+    with _bloqueo:
+        if model not in _codificadores:
+            try:
+                _codificadores[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                try:
+                    _codificadores[model] = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    _codificadores[model] = None
+            except Exception:
+                _codificadores[model] = None
+        return _codificadores[model]
+
+# Función para contar los tokens de un texto con el tokenizador local (o estimarlos si no está disponible)
+def contar_tokens(texto, model="gpt-4o-mini"):
+    codificador = obtener_codificador(model)
+    if codificador is None:
+        return -(-len(texto) // CARACTERES_POR_TOKEN)
+    return len(codificador.encode(texto, disallowed_special=()))
+
+# Función para calcular cuántos tokens de entrada caben en un fragmento, de modo que la entrada, el prompt
+# y la salida esperada (entrada * ratio_salida) quepan en la ventana de contexto y en `max_tokens_salida`
+def calcular_presupuesto_entrada(model, max_tokens_salida, ratio_salida=1.0, tokens_prompt=0):
+    limites = LIMITES_MODELOS.get(model, LIMITES_POR_DEFECTO)
+    max_tokens_salida = min(max_tokens_salida, limites["salida"])
+    por_contexto = limites["contexto"] - max_tokens_salida - tokens_prompt - MARGEN_TOKENS
+    por_salida = int(max_tokens_salida / ratio_salida) - MARGEN_TOKENS if ratio_salida > 0 else por_contexto
+    return max(1, min(por_contexto, por_salida))
+
+# Niveles de corte, del preferido al último recurso: párrafos, líneas, oraciones y palabras
+_NIVELES = [
+    (re.compile(r"\n[ \t]*\n\s*"), "\n\n"),
+    (re.compile(r"\n"), "\n"),
+    (re.compile(r"(?<=[.!?;:…])\s+"), " "),
+    (re.compile(r"\s+"), " "),
+]
+
+# Dividir un bloque de texto en unidades (texto, tokens, separador) que no superen `max_tokens`,
+# bajando de nivel solo en los bloques que lo necesitan
+def _unidades(texto, max_tokens, model, nivel=0, separador=""):
+    if nivel >= len(_NIVELES):
+        # Último recurso: cortar por caracteres una "palabra" más larga que el presupuesto
+        paso = max(1, max_tokens * CARACTERES_POR_TOKEN // 2)
+        for inicio in range(0, len(texto), paso):
+            parte = texto[inicio:inicio + paso]
+            yield parte, contar_tokens(parte, model), separador if inicio == 0 else ""
+        return
+    patron, separador_nivel = _NIVELES[nivel]
+    for indice, parte in enumerate(patron.split(texto)):
+        parte = parte.strip()
+        if not parte:
+            continue
+        separador_parte = separador if indice == 0 else separador_nivel
+        tokens = contar_tokens(parte, model)
+        if tokens <= max_tokens:
+            yield parte, tokens, separador_parte
+        else:
+            yield from _unidades(parte, max_tokens, model, nivel + 1, separador_parte)
+
+# Función para agrupar bloques de texto (p. ej. páginas o párrafos, que pueden llegar en flujo) en fragmentos
+# de como máximo `max_tokens` tokens, en una sola pasada. Con `solapamiento` > 0, cada fragmento repite
+# al inicio las últimas unidades del anterior hasta ese número de tokens.
+def generar_fragmentos(bloques, max_tokens, model="gpt-4o-mini", solapamiento=0):
+    actual = []
+    tokens_actual = 0
+    for bloque in bloques:
+        for texto, tokens, separador in _unidades(bloque, max_tokens, model, separador="\n\n"):
+            if actual and tokens_actual + tokens > max_tokens:
+                yield _unir(actual)
+                actual, tokens_actual = _solapar(actual, solapamiento, max_tokens - tokens)
+            actual.append((texto, tokens, separador))
+            tokens_actual += tokens
+    if actual:
+        yield _unir(actual)
+
+# Parámetros de los cortes definidos por el contenido: la huella se calcula sobre los últimos caracteres antes
+# de cada salto de párrafo, y se corta cuando es múltiplo de DIVISOR_CORTE (en promedio, cada 4 unidades)
+VENTANA_HUELLA = 64
+DIVISOR_CORTE = 4
+
+# Huella estable (igual entre procesos y ejecuciones) del final de una unidad de texto
+def _huella(texto):
+    return zlib.crc32(texto[-VENTANA_HUELLA:].encode("utf-8"))
+
+# Función para agrupar bloques de texto en fragmentos con cortes definidos por el contenido: solo se corta en
+# saltos de párrafo (o en las unidades menores de un párrafo demasiado largo), y se elige el corte por la huella
+# del texto que lo precede, no por la posición. Así, una edición local solo cambia los fragmentos cercanos y el
+# resto del documento vuelve a dividirse exactamente igual. Los fragmentos tienen entre `min_tokens`
+# (por defecto la mitad de `max_tokens`) y `max_tokens` tokens, salvo el último.
+def generar_fragmentos_por_contenido(bloques, max_tokens, model="gpt-4o-mini", min_tokens=None):
+    min_tokens = max_tokens // 2 if min_tokens is None else min(min_tokens, max_tokens)
+    actual = []
+    tokens_actual = 0
+    for bloque in bloques:
+        for texto, tokens, separador in _unidades(bloque, max_tokens, model, separador="\n\n"):
+            if actual and tokens_actual + tokens > max_tokens:
+                yield _unir(actual)
+                actual, tokens_actual = [], 0
+            actual.append((texto, tokens, separador))
+            tokens_actual += tokens
+            if tokens_actual >= min_tokens and _huella(texto) % DIVISOR_CORTE == 0:
+                yield _unir(actual)
+                actual, tokens_actual = [], 0
+    if actual:
+        yield _unir(actual)
+
+def _unir(unidades):
+    return "".join(separador + texto for texto, _, separador in unidades).strip()
+
+def _solapar(unidades, solapamiento, disponible):
+    limite = min(solapamiento, disponible)
+    conservadas = []
+    tokens = 0
+    for unidad in reversed(unidades):
+        if tokens + unidad[1] > limite:
+            break
+        conservadas.append(unidad)
+        tokens += unidad[1]
+    conservadas.reverse()
+    return conservadas, tokens
+
+# Función para dividir un texto completo en fragmentos según un presupuesto de tokens
+def dividir_por_tokens(texto, max_tokens, model="gpt-4o-mini", solapamiento=0):
+    return list(generar_fragmentos([texto], max_tokens, model=model, solapamiento=solapamiento))
@@ -0,0 +1,290 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+from docx import Document
+
+from concurrencia import iterar_en_orden
+from cache_llm import DIRECTORIO_CACHE
+from instrumentacion import IterableMedido, tramo
+
+# A partir de este número de páginas la extracción de un PDF se reparte entre varios procesos
+UMBRAL_PAGINAS_PARALELO = 64
+
+# Páginas que extrae cada tarea del grupo de procesos
+PAGINAS_POR_TAREA = 16
+
+# Función para extraer el texto de un rango de páginas de un PDF en disco (se ejecuta en un proceso aparte)
+def _extraer_rango_pdf(argumentos):
+    ruta, inicio, fin = argumentos
+    with fitz.open(ruta) as doc:
+        return [doc.load_page(numero).get_text() for numero in range(inicio, fin)]
+
+# Obtener los bytes de un archivo subido, de una ruta o de bytes ya leídos
+def _leer_bytes(origen):
+    if isinstance(origen, (bytes, bytearray)):
+        return bytes(origen)
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, "rb") as archivo:
+            return archivo.read()
+    if hasattr(origen, "getvalue"):
+        return origen.getvalue()
+    return origen.read()
+
+# Generador que entrega el texto de un PDF página a página.
+# Los PDF grandes se extraen en paralelo por rangos de páginas en un grupo de procesos; las páginas se
+# entregan en orden en cuanto están listas, sin esperar a que termine la extracción del documento completo.
+def iterar_paginas_pdf(origen, procesos=None, paginas_por_tarea=PAGINAS_POR_TAREA):
+    procesos = procesos or os.cpu_count() or 1
+    ruta_temporal = None
+    if isinstance(origen, (str, os.PathLike)):
+        ruta = os.fspath(origen)
+        doc = fitz.open(ruta)
+    else:
+        ruta = None
+        doc = fitz.open(stream=_leer_bytes(origen), filetype="pdf")
+
+    try:
+        total = len(doc)
+        if procesos <= 1 or total < UMBRAL_PAGINAS_PARALELO:
+            for numero in range(total):
+                yield doc.load_page(numero).get_text()
+            return
+
+        # Los procesos abren el documento desde disco: así no se copia el PDF completo a cada uno
+        if ruta is None:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temporal:
+                doc.save(temporal.name)
+                ruta = ruta_temporal = temporal.name
+        doc.close()
+
+        rangos = ((ruta, inicio, min(inicio + paginas_por_tarea, total)) for inicio in range(0, total, paginas_por_tarea))
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as ejecutor:
+            for paginas in iterar_en_orden(ejecutor, _extraer_rango_pdf, rangos, max_en_vuelo=procesos * 2):
+                yield from paginas
+    finally:
+        if not doc.is_closed:
+            doc.close()
+        if ruta_temporal:
+            os.remove(ruta_temporal)
+
+# Generador que entrega los párrafos de un documento DOCX
+def iterar_parrafos_docx(origen):
+    if isinstance(origen, (bytes, bytearray)):
+        origen = io.BytesIO(origen)
+    for parrafo in Document(origen).paragraphs:
+        yield parrafo.text + "\n"
+
+# Generador que entrega un archivo de texto por bloques de líneas, sin decodificarlo completo de una vez.
+# Los bloques se cortan en líneas en blanco para no partir párrafos. Un flujo recibido del llamador no se cierra.
+def iterar_bloques_texto(origen, lineas_por_bloque=200):
+    if isinstance(origen, (str, os.PathLike)):
+        flujo = open(origen, "rb")
+    elif isinstance(origen, (bytes, bytearray)):
+        flujo = io.BytesIO(origen)
+    else:
+        flujo = io.BytesIO(origen.getvalue()) if hasattr(origen, "getvalue") else origen
+    texto = io.TextIOWrapper(flujo, encoding="utf-8")
+    try:
+        bloque = []
+        for linea in texto:
+            bloque.append(linea)
+            if len(bloque) >= lineas_por_bloque and not linea.strip():
+                yield "".join(bloque)
+                bloque = []
+        if bloque:
+            yield "".join(bloque)
+    finally:
+        # Solo se cierran los flujos abiertos aquí; el del llamador se separa del envoltorio sin cerrarlo
+        if flujo is origen:
+            texto.detach()
+        else:
+            texto.close()
+
+# Formatos admitidos según el tipo MIME declarado o, en su defecto, la extensión del archivo
+FORMATOS_POR_TIPO = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/markdown": "md",
+    "text/plain": "txt",
+}
+FORMATOS_POR_EXTENSION = {".pdf": "pdf", ".docx": "docx", ".md": "md", ".markdown": "md", ".txt": "txt"}
+
+# Función para detectar el formato de un archivo (None si no está soportado)
+def detectar_formato(nombre=None, tipo=None):
+    formato = FORMATOS_POR_TIPO.get(tipo)
+    if formato is None and nombre:
+        formato = FORMATOS_POR_EXTENSION.get(os.path.splitext(nombre)[1].lower())
+    return formato
+
+# Función para obtener el generador de bloques adecuado al formato
+def iterar_bloques(origen, formato, procesos=None):
+    if formato == "pdf":
+        return iterar_paginas_pdf(origen, procesos=procesos)
+    if formato == "docx":
+        return iterar_parrafos_docx(origen)
+    return iterar_bloques_texto(origen)
+
+# Límites de la caché de documentos extraídos
+MAX_BYTES_MEMORIA_DOCUMENTOS = int(float(os.getenv("TEXTEADOR_DOCUMENTOS_MEMORIA_MB", "256")) * 1024 * 1024)
+MAX_BYTES_DISCO_DOCUMENTOS = int(float(os.getenv("TEXTEADOR_DOCUMENTOS_DISCO_MB", "2048")) * 1024 * 1024)
+
+# Caché de documentos extraídos, indexada por el hash del contenido del archivo.
+# Cada entrada guarda el texto y el desplazamiento de inicio de cada bloque (página o párrafo).
+# Vive en memoria con expulsión LRU; lo expulsado se vuelca a disco, que a su vez se limita por tamaño.
+class CacheDocumentos:
+    def __init__(self, directorio=None, max_bytes_memoria=MAX_BYTES_MEMORIA_DOCUMENTOS, max_bytes_disco=MAX_BYTES_DISCO_DOCUMENTOS):
+        self.directorio = directorio or os.path.join(DIRECTORIO_CACHE, "documentos")
+        self.max_bytes_memoria = max_bytes_memoria
+        self.max_bytes_disco = max_bytes_disco
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._bloqueo = threading.Lock()
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def obtener(self, clave):
+        with self._bloqueo:
+            documento = self._memoria.get(clave)
+            if documento is not None:
+                self._memoria.move_to_end(clave)
+                return documento
+        try:
+            with open(self._ruta(clave), encoding="utf-8") as archivo:
+                documento = json.load(archivo)
+            os.utime(self._ruta(clave))
+        except (OSError, ValueError):
+            return None
+        self.guardar(clave, documento, volcar=False)
+        return documento
+
+    def guardar(self, clave, documento, volcar=True):
+        expulsados = []
+        with self._bloqueo:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                return
+            self._memoria[clave] = documento
+            self._bytes_memoria += _tamano_documento(documento)
+            while self._bytes_memoria > self.max_bytes_memoria and len(self._memoria) > 1:
+                clave_expulsada, expulsado = self._memoria.popitem(last=False)
+                self._bytes_memoria -= _tamano_documento(expulsado)
+                expulsados.append((clave_expulsada, expulsado))
+        if volcar:
+            for clave_expulsada, expulsado in expulsados:
+                self._volcar(clave_expulsada, expulsado)
+
+    def _volcar(self, clave, documento):
+        ruta = self._ruta(clave)
+        if os.path.exists(ruta):
+            return
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(documento, archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+        self._limitar_disco()
+
+    def _limitar_disco(self):
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".json"):
+                estado = os.stat(os.path.join(self.directorio, nombre))
+                archivos.append((estado.st_mtime, estado.st_size, nombre))
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, nombre in sorted(archivos):
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except OSError:
+                pass
+            total -= tamano
+
+def _tamano_documento(documento):
+    return len(documento["texto"]) + 8 * len(documento["bloques"])
+
+_cache_documentos = None
+_bloqueo_documentos = threading.Lock()
+
+# Obtener la caché de documentos compartida del proceso
+def obtener_cache_documentos():
+    global _cache_documentos
+    with _bloqueo_documentos:
+        if _cache_documentos is None:
+            _cache_documentos = CacheDocumentos()
+    return _cache_documentos
+
+# Función para iterar los bloques de un documento ya extraído
+def bloques_documento(documento):
+    texto, inicios = documento["texto"], documento["bloques"]
+    for indice, inicio in enumerate(inicios):
+        fin = inicios[indice + 1] if indice + 1 < len(inicios) else len(texto)
+        yield texto[inicio:fin]
+
+# Función para calcular el hash del contenido de un archivo subido (o ruta), el mismo que usa la caché de documentos
+def hash_contenido(archivo):
+    return hashlib.sha256(_leer_bytes(archivo)).hexdigest()
+
+# Leer un archivo subido (o ruta) y calcular su formato y la clave de su contenido; None si no está soportado
+def _preparar(archivo, nombre=None, tipo=None):
+    if nombre is None:
+        nombre = os.fspath(archivo) if isinstance(archivo, (str, os.PathLike)) else getattr(archivo, "name", None)
+    formato = detectar_formato(nombre, tipo or getattr(archivo, "type", None))
+    if formato is None:
+        return None
+    datos = _leer_bytes(archivo)
+    return datos, formato, hashlib.sha256(datos).hexdigest()
+
+def _iterar_con_cache(datos, formato, clave, atributos=None):
+    cache = obtener_cache_documentos()
+    documento = cache.obtener(clave)
+    if atributos is not None:
+        atributos["desde_cache"] = documento is not None
+    if documento is not None:
+        yield from bloques_documento(documento)
+        return
+    partes, inicios, posicion = [], [], 0
+    for bloque in iterar_bloques(datos, formato):
+        inicios.append(posicion)
+        partes.append(bloque)
+        posicion += len(bloque)
+        yield bloque
+    cache.guardar(clave, {"texto": "".join(partes), "bloques": inicios, "formato": formato, "hash": clave})
+
+# Función para iterar los bloques de un archivo subido (o ruta) pasando por la caché de documentos.
+# Si el archivo ya se extrajo se entregan los bloques guardados; si no, se extrae en flujo y se guarda al terminar.
+# Devuelve None si el formato no está soportado.
+def iterar_documento(archivo, nombre=None, tipo=None):
+    preparado = _preparar(archivo, nombre, tipo)
+    if preparado is None:
+        return None
+    atributos = {"formato": preparado[1]}
+    return IterableMedido("ingesta", _iterar_con_cache(*preparado, atributos), atributos=atributos)
+
+# Función para extraer un documento completo a través de la caché: diccionario con el texto, los desplazamientos
+# de inicio de cada bloque, el formato y el hash del contenido. Devuelve None si el formato no está soportado.
+def extraer_documento(archivo, nombre=None, tipo=None):
+    preparado = _preparar(archivo, nombre, tipo)
+    if preparado is None:
+        return None
+    datos, formato, clave = preparado
+    with tramo("ingesta", formato=formato) as atributos:
+        cache = obtener_cache_documentos()
+        documento = cache.obtener(clave)
+        atributos["desde_cache"] = documento is not None
+        if documento is None:
+            for _ in _iterar_con_cache(datos, formato, clave):
+                pass
+            documento = cache.obtener(clave)
+        atributos["caracteres"] = len(documento["texto"])
+    return documento
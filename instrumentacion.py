@@ -0,0 +1,307 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache_llm import DIRECTORIO_CACHE
+
+# Exportación de las trazas: archivo JSONL (un tramo por línea) y archivo de métricas en formato de texto de Prometheus.
+# TEXTEADOR_TRAZAS=0 desactiva la escritura en disco; TEXTEADOR_METRICAS_PUERTO publica las métricas por HTTP.
+TRAZAS_ACTIVAS = os.getenv("TEXTEADOR_TRAZAS", "1") != "0"
+ARCHIVO_TRAZAS = os.getenv("TEXTEADOR_TRAZAS_ARCHIVO", os.path.join(DIRECTORIO_CACHE, "trazas.jsonl"))
+ARCHIVO_METRICAS = os.getenv("TEXTEADOR_METRICAS_ARCHIVO", os.path.join(DIRECTORIO_CACHE, "metricas.prom"))
+PUERTO_METRICAS = os.getenv("TEXTEADOR_METRICAS_PUERTO")
+# Dirección en la que escucha el endpoint de métricas: solo local por defecto (0.0.0.0 para exponerlo)
+HOST_METRICAS = os.getenv("TEXTEADOR_METRICAS_HOST", "127.0.0.1")
+
+# Tamaño a partir del cual el archivo de trazas se rota (se conserva una copia anterior)
+MAX_BYTES_TRAZAS = 50 * 1024 * 1024
+
+# Límites (en segundos) de los intervalos del histograma de duración de los tramos
+LIMITES_HISTOGRAMA = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Ejecución en curso y momento en que se encoló la tarea actual; se propagan a los hilos de trabajo
+# copiando el contexto al enviar cada tarea (ver concurrencia.ejecutar_en_orden)
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+_encolado = contextvars.ContextVar("encolado", default=None)
+
+# Un tramo de una ejecución: una etapa (ingesta, fragmentacion, api, ensamblado...) con su duración, la espera en
+# cola antes de empezar y atributos como el modelo, los tokens usados, los reintentos o si provino de la caché
+class Tramo:
+    __slots__ = ("etapa", "inicio", "duracion", "espera", "atributos", "error")
+
+    def __init__(self, etapa, inicio, duracion=0.0, espera=0.0, atributos=None, error=None):
+        self.etapa = etapa
+        self.inicio = inicio
+        self.duracion = duracion
+        self.espera = espera
+        self.atributos = atributos or {}
+        self.error = error
+
+    def a_dict(self):
+        return {
+            "etapa": self.etapa, "inicio": round(self.inicio, 6), "duracion_s": round(self.duracion, 6),
+            "espera_s": round(self.espera, 6), "error": self.error, **self.atributos,
+        }
+
+# Traza de una ejecución de una herramienta: todos sus tramos, registrados desde cualquier hilo
+class Traza:
+    def __init__(self, herramienta, **atributos):
+        self.id = uuid.uuid4().hex[:16]
+        self.herramienta = herramienta
+        self.atributos = atributos
+        self.inicio = time.time()
+        self.duracion = None
+        self.tramos = []
+        self._bloqueo = threading.Lock()
+
+    def registrar(self, tramo):
+        with self._bloqueo:
+            self.tramos.append(tramo)
+        _metricas.registrar(self.herramienta, tramo)
+
+    # Resumen por etapa: número de tramos, tiempo total y p95, espera en cola, tokens, aciertos de caché y reintentos
+    def resumen(self):
+        with self._bloqueo:
+            tramos = list(self.tramos)
+        etapas = {}
+        for tramo in tramos:
+            etapa = etapas.setdefault(tramo.etapa, {
+                "etapa": tramo.etapa, "tramos": 0, "duraciones": [], "espera_s": 0.0, "tokens_prompt": 0,
+                "tokens_completion": 0, "aciertos_cache": 0, "reintentos": 0, "errores": 0,
+            })
+            etapa["tramos"] += 1
+            etapa["duraciones"].append(tramo.duracion)
+            etapa["espera_s"] += tramo.espera
+            etapa["tokens_prompt"] += tramo.atributos.get("tokens_prompt", 0)
+            etapa["tokens_completion"] += tramo.atributos.get("tokens_completion", 0)
+            etapa["aciertos_cache"] += 1 if tramo.atributos.get("desde_cache") else 0
+            etapa["reintentos"] += tramo.atributos.get("reintentos", 0)
+            etapa["errores"] += 1 if tramo.error else 0
+        for etapa in etapas.values():
+            duraciones = sorted(etapa.pop("duraciones"))
+            etapa["total_s"] = round(sum(duraciones), 3)
+            etapa["p95_s"] = round(duraciones[min(len(duraciones) - 1, int(0.95 * len(duraciones)))], 3)
+            etapa["espera_s"] = round(etapa["espera_s"], 3)
+        return list(etapas.values())
+
+    def lineas_jsonl(self):
+        base = {"ejecucion": self.id, "herramienta": self.herramienta, "fecha": self.inicio, **self.atributos}
+        with self._bloqueo:
+            return [json.dumps({**base, **tramo.a_dict()}, ensure_ascii=False) for tramo in self.tramos]
+
+# Función para escapar el valor de una etiqueta como exige el formato de texto de Prometheus: barras invertidas,
+# comillas y saltos de línea (p. ej. en las rutas de los documentos)
+def _escapar_etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Métricas acumuladas del proceso, en formato de texto de Prometheus
+class _Metricas:
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self.histogramas = {}  # (herramienta, etapa) -> [conteos por intervalo, suma, cantidad]
+        self.contadores = {}  # (nombre, etiquetas) -> valor
+
+    def _sumar(self, nombre, etiquetas, valor=1):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def registrar(self, herramienta, tramo):
+        with self._bloqueo:
+            histograma = self.histogramas.setdefault((herramienta, tramo.etapa), [[0] * len(LIMITES_HISTOGRAMA), 0.0, 0])
+            for posicion, limite in enumerate(LIMITES_HISTOGRAMA):
+                if tramo.duracion <= limite:
+                    histograma[0][posicion] += 1
+            histograma[1] += tramo.duracion
+            histograma[2] += 1
+            etiquetas = {"herramienta": herramienta, "etapa": tramo.etapa}
+            self._sumar("texteador_tramo_espera_segundos_total", etiquetas, tramo.espera)
+            if tramo.error:
+                self._sumar("texteador_tramo_errores_total", etiquetas)
+            modelo = tramo.atributos.get("modelo")
+            if modelo:
+                etiquetas = {"herramienta": herramienta, "modelo": modelo}
+                self._sumar("texteador_tokens_total", dict(etiquetas, tipo="prompt"), tramo.atributos.get("tokens_prompt", 0))
+                self._sumar("texteador_tokens_total", dict(etiquetas, tipo="completion"), tramo.atributos.get("tokens_completion", 0))
+                self._sumar("texteador_reintentos_total", etiquetas, tramo.atributos.get("reintentos", 0))
+                if tramo.atributos.get("desde_cache"):
+                    self._sumar("texteador_aciertos_cache_total", etiquetas)
+
+    def contar_ejecucion(self, herramienta):
+        with self._bloqueo:
+            self._sumar("texteador_ejecuciones_total", {"herramienta": herramienta})
+
+    def texto(self):
+        lineas = [
+            "# HELP texteador_tramo_duracion_segundos Duración de los tramos por herramienta y etapa.",
+            "# TYPE texteador_tramo_duracion_segundos histogram",
+        ]
+        with self._bloqueo:
+            for (herramienta, etapa), (conteos, suma, cantidad) in sorted(self.histogramas.items()):
+                etiquetas = f'herramienta="{_escapar_etiqueta(herramienta)}",etapa="{_escapar_etiqueta(etapa)}"'
+                for limite, conteo in zip(LIMITES_HISTOGRAMA, conteos):
+                    lineas.append(f'texteador_tramo_duracion_segundos_bucket{{{etiquetas},le="{limite}"}} {conteo}')
+                lineas.append(f'texteador_tramo_duracion_segundos_bucket{{{etiquetas},le="+Inf"}} {cantidad}')
+                lineas.append(f"texteador_tramo_duracion_segundos_sum{{{etiquetas}}} {suma:.6f}")
+                lineas.append(f"texteador_tramo_duracion_segundos_count{{{etiquetas}}} {cantidad}")
+            nombres_vistos = set()
+            for (nombre, etiquetas), valor in sorted(self.contadores.items()):
+                if nombre not in nombres_vistos:
+                    lineas.append(f"# TYPE {nombre} counter")
+                    nombres_vistos.add(nombre)
+                texto_etiquetas = ",".join(f'{clave}="{_escapar_etiqueta(valor_etiqueta)}"' for clave, valor_etiqueta in etiquetas)
+                lineas.append(f"{nombre}{{{texto_etiquetas}}} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+_metricas = _Metricas()
+_historial = deque(maxlen=50)
+
+# Métricas acumuladas del proceso en formato de texto de Prometheus
+def metricas_prometheus():
+    return _metricas.texto()
+
+# Ejecuciones recientes del proceso (la más reciente al final)
+def ejecuciones_recientes():
+    return list(_historial)
+
+# Traza de la ejecución en curso (None fuera de una ejecución)
+def traza_actual():
+    return _traza_actual.get()
+
+# Contexto de una ejecución de una herramienta: los tramos registrados dentro (también desde hilos de trabajo lanzados
+# con concurrencia.ejecutar_en_orden) quedan en su traza, que al terminar se exporta a disco
+@contextmanager
+def ejecucion(herramienta, **atributos):
+    traza = Traza(herramienta, **atributos)
+    token = _traza_actual.set(traza)
+    inicio = time.perf_counter()
+    try:
+        yield traza
+    finally:
+        traza.duracion = time.perf_counter() - inicio
+        _traza_actual.reset(token)
+        if traza.tramos:
+            _historial.append(traza)
+            _metricas.contar_ejecucion(herramienta)
+            exportar(traza)
+
+# Contexto de un tramo de la ejecución en curso. Entrega el diccionario de atributos para que el código medido
+# añada datos (tokens, caché...). La espera en cola se toma del momento en que se encoló la tarea actual.
+@contextmanager
+def tramo(etapa, **atributos):
+    traza = _traza_actual.get()
+    encolado = _encolado.get()
+    inicio_reloj = time.time()
+    inicio = time.perf_counter()
+    espera = 0.0
+    if encolado is not None:
+        espera = max(0.0, inicio - encolado)
+        _encolado.set(None)
+    error = None
+    try:
+        yield atributos
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        if traza is not None:
+            traza.registrar(Tramo(etapa, inicio_reloj, time.perf_counter() - inicio, espera, atributos, error))
+
+# Iterable que mide el tiempo dedicado a producir sus elementos (p. ej. páginas extraídas o fragmentos formados,
+# que llegan intercalados con otro trabajo) y lo registra como un solo tramo al agotarse.
+# `atributos` puede completarse mientras se itera (p. ej. si los datos venían de una caché).
+# Con `interno`, se descuenta el tiempo de otro iterable medido que este consume (p. ej. la ingesta dentro de la fragmentación).
+class IterableMedido:
+    def __init__(self, etapa, iterable, interno=None, atributos=None):
+        self.etapa = etapa
+        self.iterable = iterable
+        self.interno = interno
+        self.atributos = {} if atributos is None else atributos
+        self.activo = 0.0
+        self.elementos = 0
+        self._traza = _traza_actual.get()
+
+    def __iter__(self):
+        iterador = iter(self.iterable)
+        inicio_tramo = time.time()
+        error = None
+        try:
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    elemento = next(iterador)
+                except StopIteration:
+                    break
+                finally:
+                    self.activo += time.perf_counter() - inicio
+                self.elementos += 1
+                yield elemento
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if self._traza is not None:
+                duracion = self.activo - (self.interno.activo if isinstance(self.interno, IterableMedido) else 0.0)
+                atributos = dict(self.atributos, elementos=self.elementos)
+                self._traza.registrar(Tramo(self.etapa, inicio_tramo, max(0.0, duracion), 0.0, atributos, error))
+
+# Función para copiar el contexto actual (con la ejecución en curso) marcando el momento en que se encola una tarea
+def contexto_para_tarea():
+    contexto = contextvars.copy_context()
+    contexto.run(_encolado.set, time.perf_counter())
+    return contexto
+
+_bloqueo_exportacion = threading.Lock()
+
+# Función para exportar una traza: añade sus tramos al archivo JSONL y reescribe el archivo de métricas
+def exportar(traza):
+    if not TRAZAS_ACTIVAS:
+        return
+    try:
+        with _bloqueo_exportacion:
+            os.makedirs(os.path.dirname(ARCHIVO_TRAZAS) or ".", exist_ok=True)
+            if os.path.exists(ARCHIVO_TRAZAS) and os.path.getsize(ARCHIVO_TRAZAS) > MAX_BYTES_TRAZAS:
+                os.replace(ARCHIVO_TRAZAS, ARCHIVO_TRAZAS + ".1")
+            with open(ARCHIVO_TRAZAS, "a", encoding="utf-8") as archivo:
+                archivo.write("".join(linea + "\n" for linea in traza.lineas_jsonl()))
+            temporal = f"{ARCHIVO_METRICAS}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                archivo.write(metricas_prometheus())
+            os.replace(temporal, ARCHIVO_METRICAS)
+    except OSError:
+        pass  # la instrumentación nunca debe interrumpir una herramienta
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        cuerpo = metricas_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *argumentos):
+        pass
+
+_servidor_metricas = None
+_bloqueo_servidor = threading.Lock()
+
+# Iniciar (una sola vez por proceso) el endpoint HTTP de métricas si TEXTEADOR_METRICAS_PUERTO está definido
+def iniciar_servidor_metricas(puerto=PUERTO_METRICAS, host=HOST_METRICAS):
+    global _servidor_metricas
+    if not puerto:
+        return None
+    with _bloqueo_servidor:
+        if _servidor_metricas is None:
+            try:
+                _servidor_metricas = ThreadingHTTPServer((host, int(puerto)), _ManejadorMetricas)
+            except OSError:
+                return None
+            _servidor_metricas.daemon_threads = True
+            threading.Thread(target=_servidor_metricas.serve_forever, daemon=True).start()
+    return _servidor_metricas
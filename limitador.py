@@ -0,0 +1,225 @@
+import os
+import random
+import threading
+import time
+
+import openai
+
+# Cuotas de la API por modelo (solicitudes y tokens por minuto). Se pueden ajustar con TEXTEADOR_RPM y TEXTEADOR_TPM,
+# que se aplican a todos los modelos.
+CUOTAS_MODELOS = {
+    "gpt-4o-mini": {"rpm": 5000, "tpm": 2_000_000},
+    "gpt-4o-2024-08-06": {"rpm": 5000, "tpm": 800_000},
+}
+CUOTA_POR_DEFECTO = {"rpm": 500, "tpm": 200_000}
+RPM_ENTORNO = os.getenv("TEXTEADOR_RPM")
+TPM_ENTORNO = os.getenv("TEXTEADOR_TPM")
+
+# Reintentos ante errores transitorios (429, 5xx, conexión) y límites de la espera exponencial, en segundos
+MAX_REINTENTOS = int(os.getenv("TEXTEADOR_MAX_REINTENTOS", "6"))
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 60.0
+
+# Concurrencia adaptativa (AIMD): empieza en CONCURRENCIA_INICIAL, sube de a poco con cada éxito
+# y se reduce a la mitad ante un 429, como máximo una vez por INTERVALO_REDUCCION segundos
+CONCURRENCIA_INICIAL = 8
+CONCURRENCIA_MAXIMA = int(os.getenv("TEXTEADOR_CONCURRENCIA_MAXIMA", "64"))
+INTERVALO_REDUCCION = 2.0
+
+# Balde de fichas que se rellena de forma continua hasta su capacidad (la cuota de un minuto).
+# Las reservas pueden dejar el saldo en negativo: quien reserva espera lo que falte, de modo que las
+# solicitudes se atienden en orden de llegada aunque sean más grandes que el saldo disponible.
+class Balde:
+    def __init__(self, capacidad, por_segundo):
+        self.capacidad = capacidad
+        self.por_segundo = por_segundo
+        self.saldo = capacidad
+        self.actualizado = time.monotonic()
+        self._bloqueo = threading.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self.saldo = min(self.capacidad, self.saldo + (ahora - self.actualizado) * self.por_segundo)
+        self.actualizado = ahora
+
+    # Reservar `cantidad` fichas; devuelve los segundos que hay que esperar antes de usarlas
+    def reservar(self, cantidad):
+        cantidad = min(cantidad, self.capacidad)
+        with self._bloqueo:
+            self._rellenar()
+            self.saldo -= cantidad
+            return 0.0 if self.saldo >= 0 else -self.saldo / self.por_segundo
+
+    # Devolver (o cobrar, si es negativo) la diferencia entre lo reservado y lo usado realmente
+    def corregir(self, cantidad):
+        with self._bloqueo:
+            self._rellenar()
+            self.saldo = min(self.capacidad, self.saldo + cantidad)
+
+# Límite de solicitudes simultáneas con aumento aditivo y reducción multiplicativa (AIMD)
+class ConcurrenciaAdaptativa:
+    def __init__(self, inicial=CONCURRENCIA_INICIAL, maxima=CONCURRENCIA_MAXIMA):
+        self.limite = float(min(inicial, maxima))
+        self.maxima = maxima
+        self.en_vuelo = 0
+        self._ultima_reduccion = 0.0
+        self._condicion = threading.Condition()
+
+    def adquirir(self):
+        with self._condicion:
+            while self.en_vuelo >= int(self.limite):
+                self._condicion.wait()
+            self.en_vuelo += 1
+
+    def liberar(self):
+        with self._condicion:
+            self.en_vuelo -= 1
+            self._condicion.notify()
+
+    # Aumento aditivo: en torno a una solicitud más por cada ventana completa de éxitos
+    def exito(self):
+        with self._condicion:
+            anterior = int(self.limite)
+            self.limite = min(self.maxima, self.limite + 1 / self.limite)
+            if int(self.limite) > anterior:
+                self._condicion.notify()
+
+    # Reducción multiplicativa ante limitación de uso; las ráfagas de 429 cuentan como una sola señal
+    def reducir(self):
+        with self._condicion:
+            ahora = time.monotonic()
+            if ahora - self._ultima_reduccion >= INTERVALO_REDUCCION:
+                self.limite = max(1.0, self.limite / 2)
+                self._ultima_reduccion = ahora
+
+# Función para decidir si un error de la API es transitorio y merece reintentarse
+def es_transitorio(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    estado = getattr(error, "status_code", None)
+    return estado in (408, 409, 429) or (estado is not None and estado >= 500)
+
+# Función para obtener la espera indicada por el servidor (cabeceras retry-after-ms o retry-after), en segundos
+def espera_indicada(error):
+    respuesta = getattr(error, "response", None)
+    cabeceras = getattr(respuesta, "headers", None) or {}
+    try:
+        if cabeceras.get("retry-after-ms"):
+            return float(cabeceras["retry-after-ms"]) / 1000
+        if cabeceras.get("retry-after"):
+            return float(cabeceras["retry-after"])
+    except (TypeError, ValueError):
+        pass  # retry-after también puede ser una fecha HTTP: se usa la espera exponencial
+    return None
+
+# Limitador de un modelo, compartido por todas las llamadas del proceso: cuotas por minuto de solicitudes y de
+# tokens, concurrencia adaptativa y reintentos con espera exponencial con fluctuación aleatoria.
+# Un 429 pausa a todas las llamadas del modelo durante la espera indicada, para no encadenar rechazos.
+class Limitador:
+    def __init__(self, rpm, tpm, max_reintentos=MAX_REINTENTOS):
+        self.solicitudes = Balde(rpm, rpm / 60)
+        self.tokens = Balde(tpm, tpm / 60)
+        self.concurrencia = ConcurrenciaAdaptativa()
+        self.max_reintentos = max_reintentos
+        self.pausa_hasta = 0.0
+        self.rechazos = 0
+        self._bloqueo = threading.Lock()
+
+    def _esperar_turno(self, tokens_estimados):
+        with self._bloqueo:
+            pausa = self.pausa_hasta - time.monotonic()
+        espera = max(self.solicitudes.reservar(1), self.tokens.reservar(tokens_estimados), pausa)
+        if espera > 0:
+            time.sleep(espera)
+        return max(0.0, espera)
+
+    def _registrar_rechazo(self, indicada):
+        with self._bloqueo:
+            self.rechazos += 1
+            if indicada:
+                self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + indicada)
+        self.concurrencia.reducir()
+
+    # Ejecutar `funcion` (que hace una llamada a la API) respetando las cuotas y reintentando los errores transitorios.
+    # Devuelve (resultado, reintentos, espera total en segundos, liberar). Con `mantener`, el espacio de concurrencia
+    # sigue ocupado hasta que se invoque `liberar` (p. ej. al terminar de leer una respuesta en flujo).
+    # Los tokens se reservan una sola vez: los reintentos solo esperan a que la cuota vuelva a tener saldo.
+    def ejecutar(self, funcion, tokens_estimados, mantener=False):
+        espera_total = 0.0
+        for intento in range(self.max_reintentos + 1):
+            inicio = time.monotonic()
+            self.concurrencia.adquirir()
+            espera_total += time.monotonic() - inicio
+            mantenido = False
+            try:
+                espera_total += self._esperar_turno(tokens_estimados if intento == 0 else 0)
+                resultado = funcion()
+                self.concurrencia.exito()
+                if mantener:
+                    mantenido = True
+                    return resultado, intento, espera_total, _liberacion_unica(self.concurrencia.liberar)
+                return resultado, intento, espera_total, _sin_efecto
+            except Exception as error:
+                if not es_transitorio(error) or intento == self.max_reintentos:
+                    raise
+                indicada = espera_indicada(error)
+                if getattr(error, "status_code", None) == 429:
+                    self._registrar_rechazo(indicada)
+            finally:
+                # El espacio se libera también ante una interrupción (KeyboardInterrupt, trabajo cancelado...)
+                if not mantenido:
+                    self.concurrencia.liberar()
+            espera = random.uniform(0, min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** intento))
+            espera = max(espera, indicada or 0.0)
+            time.sleep(espera)
+            espera_total += espera
+
+    # Corregir la cuota de tokens con el uso real de la respuesta
+    def registrar_uso(self, tokens_estimados, tokens_reales):
+        if tokens_reales:
+            self.tokens.corregir(tokens_estimados - tokens_reales)
+
+    def estado(self):
+        return {
+            "concurrencia": int(self.concurrencia.limite), "en_vuelo": self.concurrencia.en_vuelo,
+            "rechazos_429": self.rechazos, "tokens_disponibles": int(self.tokens.saldo),
+        }
+
+def _sin_efecto():
+    pass
+
+def _liberacion_unica(liberar):
+    liberado = threading.Event()
+
+    def liberar_una_vez():
+        if not liberado.is_set():
+            liberado.set()
+            liberar()
+    return liberar_una_vez
+
+_limitadores = {}
+_bloqueo = threading.Lock()
+_fraccion_cuota = 1.0
+
+# Fijar la fracción de la cuota que usa este proceso (p. ej. 1/N cuando N procesos comparten la misma clave)
+def configurar_fraccion(fraccion):
+    global _fraccion_cuota
+    with _bloqueo:
+        _fraccion_cuota = max(0.01, min(1.0, fraccion))
+        _limitadores.clear()
+
+# Obtener el limitador compartido del proceso para un modelo
+def obtener_limitador(model):
+    with _bloqueo:
+        limitador = _limitadores.get(model)
+        if limitador is None:
+            cuota = CUOTAS_MODELOS.get(model, CUOTA_POR_DEFECTO)
+            rpm = float(RPM_ENTORNO or cuota["rpm"]) * _fraccion_cuota
+            tpm = float(TPM_ENTORNO or cuota["tpm"]) * _fraccion_cuota
+            limitador = _limitadores[model] = Limitador(rpm, tpm)
+        return limitador
+
+# Estado de los limitadores del proceso por modelo
+def estado_limitadores():
+    with _bloqueo:
+        return {modelo: limitador.estado() for modelo, limitador in _limitadores.items()}
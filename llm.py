@@ -0,0 +1,129 @@
+import time
+
+from cache_llm import calcular_clave, obtener_cache
+from instrumentacion import tramo
+from fragmentacion import contar_tokens
+from limitador import obtener_limitador
+
+# Tokens de salida supuestos al estimar el costo de una solicitud sin max_tokens
+TOKENS_SALIDA_ESTIMADOS = 1024
+
+# Función para estimar los tokens que una solicitud descuenta de la cuota: el prompt más la salida máxima
+def estimar_tokens(model, messages, parametros):
+    prompt = sum(contar_tokens(str(mensaje.get("content") or ""), model) for mensaje in messages)
+    return prompt + (parametros.get("max_tokens") or TOKENS_SALIDA_ESTIMADOS)
+
+# Función para crear la respuesta de la API a través del limitador compartido del modelo, que controla las cuotas
+# y los reintentos (el cliente se usa sin reintentos propios para no duplicarlos).
+# Devuelve (respuesta, reintentos, espera en el limitador, liberar, tokens estimados).
+def _crear(client, mantener=False, **parametros):
+    if hasattr(client, "with_options"):
+        client = client.with_options(max_retries=0)
+    estimados = estimar_tokens(parametros["model"], parametros["messages"], parametros)
+    limitador = obtener_limitador(parametros["model"])
+    respuesta, reintentos, espera, liberar = limitador.ejecutar(
+        lambda: client.chat.completions.create(**parametros), estimados, mantener=mantener
+    )
+    return respuesta, reintentos, espera, liberar, estimados
+
+# Función para llamar a la API de chat a través de la caché persistente.
+# Devuelve un diccionario con el contenido, el motivo de finalización, el uso de tokens y si provino de la caché.
+def completar_chat(client, model, messages, usar_cache=True, **parametros):
+    with tramo("api", modelo=model, flujo=False) as atributos:
+        resultado = _completar_chat(client, model, messages, usar_cache, parametros)
+        atributos.update(
+            desde_cache=resultado["desde_cache"], reintentos=resultado.get("reintentos", 0),
+            espera_limitador_s=resultado.get("espera_limitador_s", 0.0),
+            tokens_prompt=resultado["uso"]["prompt_tokens"], tokens_completion=resultado["uso"]["completion_tokens"],
+            finish_reason=resultado["finish_reason"],
+        )
+        return resultado
+
+# Función para comprobar si la respuesta a una solicitud ya está en la caché persistente (sin llamar a la API)
+def respuesta_en_cache(model, messages, **parametros):
+    cache = obtener_cache()
+    return bool(cache) and cache.contiene(calcular_clave(model, messages, parametros))
+
+def _completar_chat(client, model, messages, usar_cache, parametros):
+    cache = obtener_cache() if usar_cache else None
+    clave = calcular_clave(model, messages, parametros) if cache else None
+    if cache:
+        guardado = cache.obtener(clave)
+        if guardado is not None:
+            return dict(guardado, desde_cache=True)
+
+    response, reintentos, espera, _, estimados = _crear(client, model=model, messages=messages, **parametros)
+    choice = response.choices[0]
+    usage = getattr(response, "usage", None)
+    obtener_limitador(model).registrar_uso(estimados, getattr(usage, "total_tokens", 0))
+    resultado = {
+        "contenido": choice.message.content or "",
+        "finish_reason": choice.finish_reason,
+        "uso": {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+            "completion_tokens": getattr(usage, "completion_tokens", 0),
+        },
+        "modelo": getattr(response, "model", model),
+    }
+    if cache:
+        cache.guardar(clave, resultado)
+    return dict(resultado, desde_cache=False, reintentos=reintentos, espera_limitador_s=round(espera, 4))
+
+# Función para transmitir la respuesta de la API fragmento a fragmento a medida que se genera.
+# Es un generador de texto (compatible con st.write_stream); si la respuesta ya está en la caché se entrega de una vez.
+# Solo se guarda en la caché cuando la transmisión termina; si el consumidor la interrumpe, se cierra la conexión.
+def transmitir_chat(client, model, messages, usar_cache=True, **parametros):
+    with tramo("api", modelo=model, flujo=True) as atributos:
+        yield from _transmitir_chat(client, model, messages, usar_cache, parametros, atributos)
+
+def _transmitir_chat(client, model, messages, usar_cache, parametros, atributos):
+    cache = obtener_cache() if usar_cache else None
+    clave = calcular_clave(model, messages, parametros) if cache else None
+    if cache:
+        guardado = cache.obtener(clave)
+        if guardado is not None:
+            atributos.update(
+                desde_cache=True, tokens_prompt=guardado["uso"]["prompt_tokens"],
+                tokens_completion=guardado["uso"]["completion_tokens"], finish_reason=guardado["finish_reason"],
+            )
+            yield guardado["contenido"]
+            return
+
+    inicio = time.perf_counter()
+    response, reintentos, espera, liberar, estimados = _crear(
+        client, mantener=True, model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **parametros
+    )
+    partes = []
+    finish_reason = None
+    uso = {"prompt_tokens": 0, "completion_tokens": 0}
+    atributos.update(desde_cache=False, reintentos=reintentos, espera_limitador_s=round(espera, 4))
+    try:
+        for evento in response:
+            usage = getattr(evento, "usage", None)
+            if usage:
+                uso = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+            if not evento.choices:
+                continue
+            choice = evento.choices[0]
+            if choice.delta and choice.delta.content:
+                if not partes:
+                    atributos["primer_token_s"] = round(time.perf_counter() - inicio, 4)
+                partes.append(choice.delta.content)
+                yield choice.delta.content
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+    finally:
+        atributos.update(tokens_prompt=uso["prompt_tokens"], tokens_completion=uso["completion_tokens"], finish_reason=finish_reason)
+        cerrar = getattr(response, "close", None)
+        if cerrar:
+            cerrar()
+        liberar()
+        obtener_limitador(model).registrar_uso(estimados, uso["prompt_tokens"] + uso["completion_tokens"])
+
+    if cache:
+        cache.guardar(clave, {
+            "contenido": "".join(partes),
+            "finish_reason": finish_reason,
+            "uso": uso,
+            "modelo": model,
+        })
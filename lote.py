@@ -0,0 +1,417 @@
+# Procesamiento por lotes sin interfaz: traducción concisa (Concis) y descomposición (Descom) de directorios completos.
+# Uso:
+#   python lote.py concis documentos/ --idioma es --modelo cascada --tamano 5000
+#   python lote.py descom "informes/**/*.pdf" --procesos 4 --max-en-vuelo 8
+#   python lote.py concis corpus/ --api-lotes --sondeo 60
+# Cada resultado se escribe junto a su documento. El progreso por fragmento se guarda en un archivo oculto
+# `.<documento>.<herramienta>-<config>.progreso.jsonl`, de modo que un lote interrumpido se reanuda sin repetir trabajo.
+# Con --api-lotes, las traducciones se envían a la Batch API de OpenAI en lugar de llamar al chat una a una
+# (ver api_lotes.py): no consumen la cuota interactiva, cuestan la mitad y pueden tardar hasta 24 h.
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from api_lotes import INTERVALO_SONDEO, identificador_solicitud, resolver_solicitudes
+from clientes import obtener_cliente
+from concurrencia import ejecutar_en_orden
+from ingesta import detectar_formato, iterar_bloques
+from instrumentacion import ejecucion
+from limitador import configurar_fraccion
+from normalizacion import normalizar_bloques
+from traduccion import (
+    iter_text_chunks, translator_for, generate_filename, build_concise_request, format_concise, prompt_language,
+    check_translation, translate_chunk_to_concise, models_for, CASCADE, reuse_translation, remember_translation
+)
+from descomposicion import (
+    MODELO_DESCOMPOSICION, TOKENS_POR_SECCION, dividir_en_secciones, descomponer_seccion, fusionar_arboles,
+    generar_nombre_archivo
+)
+
+IDIOMAS = {"es": "Español Conciso", "en": "Inglés Conciso"}
+
+# Nombres de los archivos generados por las herramientas, que no deben volver a procesarse como entradas
+PATRON_SALIDAS = re.compile(r"_(es_conciso|en_conciso|arbol)_\d{8}_")
+
+# Estado de cada proceso del grupo: cliente de la API y semáforo compartido de llamadas en vuelo
+_cliente = None
+
+# Cliente que limita el número total de llamadas simultáneas a la API entre todos los procesos del lote
+class _CompletionsLimitadas:
+    def __init__(self, completions, semaforo):
+        self._completions = completions
+        self._semaforo = semaforo
+
+    def create(self, **parametros):
+        with self._semaforo:
+            return self._completions.create(**parametros)
+
+class _ClienteLimitado:
+    def __init__(self, cliente, semaforo):
+        self._cliente = cliente
+        self._semaforo = semaforo
+        self.chat = argparse.Namespace(completions=_CompletionsLimitadas(cliente.chat.completions, semaforo))
+
+    def with_options(self, **opciones):
+        return _ClienteLimitado(self._cliente.with_options(**opciones), self._semaforo)
+
+def _inicializar_proceso(semaforo, procesos):
+    global _cliente
+    _cliente = _ClienteLimitado(obtener_cliente(), semaforo)
+    # Los procesos del lote comparten la cuota de la API: cada uno limita su ritmo a su parte
+    configurar_fraccion(1 / procesos)
+
+# Registro de progreso de un documento: una línea JSON por fragmento terminado y una línea final al completarse,
+# con el archivo de salida y el hash del documento de entrada que lo produjo
+class Progreso:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.hechos = {}
+        self.completado = None
+        self.entrada_completada = None
+        # Hash del documento de entrada actual (lo asigna _abrir_progreso)
+        self.entrada = None
+        self._bloqueo = threading.Lock()
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as archivo:
+                for linea in archivo:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        continue  # línea incompleta de una ejecución interrumpida
+                    if "completado" in registro:
+                        self.completado = registro["completado"]
+                        self.entrada_completada = registro.get("entrada")
+                    else:
+                        self.hechos[registro["indice"]] = (registro["hash"], registro["resultado"])
+
+    # Resultado guardado de un fragmento, si el fragmento no ha cambiado. Si el documento se editó, el fragmento
+    # puede haber cambiado de posición: se busca también por su hash.
+    def obtener(self, indice, hash_fragmento):
+        previo = self.hechos.get(indice)
+        if previo and previo[0] == hash_fragmento:
+            return previo[1]
+        for hash_previo, resultado in self.hechos.values():
+            if hash_previo == hash_fragmento:
+                return resultado
+        return None
+
+    def registrar(self, indice, hash_fragmento, resultado):
+        with self._bloqueo:
+            self.hechos[indice] = (hash_fragmento, resultado)
+            with open(self.ruta, "a", encoding="utf-8") as archivo:
+                archivo.write(json.dumps({"indice": indice, "hash": hash_fragmento, "resultado": resultado}, ensure_ascii=False) + "\n")
+
+    # Marcar el documento como terminado. El registro se reescribe con los fragmentos de sus `total` posiciones (que
+    # se reutilizan si el documento se edita o se fuerza) y la referencia al archivo de salida y al hash de la entrada.
+    def completar(self, salida, total):
+        with self._bloqueo:
+            temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                for indice, (hash_fragmento, resultado) in sorted(self.hechos.items()):
+                    if indice < total:
+                        archivo.write(json.dumps({"indice": indice, "hash": hash_fragmento, "resultado": resultado}, ensure_ascii=False) + "\n")
+                archivo.write(json.dumps({"completado": salida, "entrada": self.entrada}, ensure_ascii=False) + "\n")
+            os.replace(temporal, self.ruta)
+            self.completado, self.entrada_completada = salida, self.entrada
+
+def _hash(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def _hash_archivo(ruta):
+    resumen = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+def _ruta_progreso(ruta, herramienta, configuracion):
+    clave = _hash(json.dumps(configuracion, sort_keys=True))[:12]
+    directorio, nombre = os.path.split(ruta)
+    return os.path.join(directorio, f".{nombre}.{herramienta}-{clave}.progreso.jsonl")
+
+# Función para aplicar `funcion` a cada fragmento reutilizando los resultados ya registrados en el progreso.
+# `funcion` devuelve (resultado, si se registra): las traducciones que no superan las comprobaciones no se registran,
+# para repetirlas en la siguiente ejecución.
+def _procesar_fragmentos(funcion, fragmentos, progreso, hilos):
+    reutilizados = 0
+    bloqueo = threading.Lock()
+
+    def procesar(par):
+        nonlocal reutilizados
+        indice, fragmento = par
+        hash_fragmento = _hash(fragmento)
+        previo = progreso.obtener(indice, hash_fragmento)
+        if previo is not None:
+            with bloqueo:
+                reutilizados += 1
+            return previo
+        resultado, guardar = funcion(fragmento)
+        if guardar:
+            progreso.registrar(indice, hash_fragmento, resultado)
+        return resultado
+
+    resultados, errores = ejecutar_en_orden(procesar, enumerate(fragmentos), max_en_vuelo=hilos)
+    return resultados, errores, reutilizados
+
+# Función para obtener los fragmentos normalizados de un documento que se va a traducir
+def _fragmentos_traduccion(ruta, formato, opciones, procesos=1):
+    bloques = normalizar_bloques(iterar_bloques(ruta, formato, procesos=procesos), formato, opciones["modelo"])
+    return iter_text_chunks(bloques, max_chars=opciones["tamano"], model=opciones["modelo"])
+
+def _ruta_traduccion(ruta, opciones):
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    return os.path.join(os.path.dirname(ruta), generate_filename(base, opciones["modelo"], opciones["tamano"], IDIOMAS[opciones["idioma"]]))
+
+# Función para traducir un documento (se ejecuta en un proceso del grupo)
+def traducir_documento(ruta, formato, opciones, progreso):
+    traducir = translator_for(IDIOMAS[opciones["idioma"]])
+    resultados, errores, reutilizados = _procesar_fragmentos(
+        lambda fragmento: traducir(_cliente, fragmento, opciones["modelo"]),
+        _fragmentos_traduccion(ruta, formato, opciones), progreso, opciones["hilos"]
+    )
+    contenido = "".join(resultado + "\n\n" for resultado in resultados) if not errores else None
+    return _ruta_traduccion(ruta, opciones), contenido, len(resultados), reutilizados, errores
+
+# Función para descomponer un documento (se ejecuta en un proceso del grupo)
+def descomponer_documento(ruta, formato, opciones, progreso):
+    texto = "".join(normalizar_bloques(iterar_bloques(ruta, formato, procesos=1), formato, MODELO_DESCOMPOSICION))
+    secciones = dividir_en_secciones(texto, opciones["tokens_por_seccion"])
+    resultados, errores, reutilizados = _procesar_fragmentos(
+        lambda seccion: (descomponer_seccion(_cliente, seccion), True), secciones, progreso, opciones["hilos"]
+    )
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    salida = os.path.join(os.path.dirname(ruta), generar_nombre_archivo(base, MODELO_DESCOMPOSICION))
+    contenido = None
+    if not errores:
+        contenido = resultados[0] if len(resultados) == 1 else fusionar_arboles(_cliente, resultados)
+    return salida, contenido, len(resultados), reutilizados, errores
+
+HERRAMIENTAS = {"concis": traducir_documento, "descom": descomponer_documento}
+
+# Función para abrir el progreso de un documento. Devuelve (progreso, resumen), con el resumen de un documento
+# omitido si ya se completó antes con la misma entrada y su salida existe (y no se pidió forzar). Los documentos
+# editados o forzados se vuelven a procesar reutilizando los fragmentos que no cambiaron.
+def _abrir_progreso(herramienta, ruta, opciones):
+    configuracion = {clave: valor for clave, valor in opciones.items() if clave not in ("hilos", "forzar")}
+    progreso = Progreso(_ruta_progreso(ruta, herramienta, configuracion))
+    progreso.entrada = _hash_archivo(ruta)
+    if (progreso.completado and os.path.exists(progreso.completado) and progreso.entrada_completada == progreso.entrada
+            and not opciones["forzar"]):
+        return progreso, {"ruta": ruta, "estado": "omitido", "salida": progreso.completado}
+    return progreso, None
+
+def _tokens_ahorrados(traza):
+    return sum(tramo.atributos.get("tokens_ahorrados", 0) for tramo in traza.tramos if tramo.etapa == "normalizacion")
+
+# Llamadas a la API evitadas al reutilizar la traducción de fragmentos casi idénticos (ver duplicados.py)
+def _llamadas_evitadas(traza):
+    return sum(tramo.atributos.get("llamadas_evitadas", 0) for tramo in traza.tramos if tramo.etapa == "duplicados")
+
+# Función para procesar un documento completo con la herramienta indicada y devolver un resumen
+def procesar_documento(herramienta, ruta, opciones):
+    formato = detectar_formato(ruta)
+    progreso, omitido = _abrir_progreso(herramienta, ruta, opciones)
+    if omitido:
+        return omitido
+    with ejecucion(herramienta, documento=ruta) as traza:
+        salida, contenido, total, reutilizados, errores = HERRAMIENTAS[herramienta](ruta, formato, opciones, progreso)
+    tiempos = {etapa["etapa"]: etapa["total_s"] for etapa in traza.resumen()}
+    tokens = sum(etapa["tokens_prompt"] + etapa["tokens_completion"] for etapa in traza.resumen())
+    ahorrados = _tokens_ahorrados(traza)
+    evitadas = _llamadas_evitadas(traza)
+    if errores:
+        return {
+            "ruta": ruta, "estado": "incompleto", "fragmentos": total, "reutilizados": reutilizados,
+            "tiempos_s": tiempos, "tokens": tokens, "tokens_ahorrados": ahorrados, "llamadas_evitadas": evitadas,
+            "errores": {indice: str(error) for indice, error in errores.items()},
+        }
+    with open(salida, "w", encoding="utf-8") as archivo:
+        archivo.write(contenido)
+    progreso.completar(salida, total)
+    return {
+        "ruta": ruta, "estado": "completado", "salida": salida, "fragmentos": total, "reutilizados": reutilizados,
+        "tiempos_s": tiempos, "tokens": tokens, "tokens_ahorrados": ahorrados, "llamadas_evitadas": evitadas,
+    }
+
+# Función para traducir un corpus con la Batch API (modo diferido). Se fragmentan todos los documentos, los
+# fragmentos sin traducción registrada se envían en lotes con un identificador estable (documento, posición y
+# contenido) y, cuando los lotes terminan, cada documento se ensambla en el orden de sus fragmentos.
+# Los lotes usan el primer modelo de la cascada; las traducciones que no superan las comprobaciones de calidad se
+# repiten con la política de ejecución interactiva (continuación, división o escalado al modelo grande).
+# Los fragmentos casi idénticos a otros ya traducidos que solo difieren en espacios o números no se envían.
+# Devuelve los resúmenes por documento, con el mismo formato que procesar_documento.
+def traducir_con_api_lotes(rutas, opciones, intervalo=INTERVALO_SONDEO):
+    language = prompt_language(IDIOMAS[opciones["idioma"]])
+    modelo = models_for(opciones["modelo"])[0]
+    resumenes, documentos, solicitudes, fragmentos = [], [], {}, {}
+    for ruta in rutas:
+        progreso, omitido = _abrir_progreso("concis", ruta, opciones)
+        if omitido:
+            resumenes.append(omitido)
+            continue
+        with ejecucion("concis", documento=ruta, modo="api_lotes") as traza:
+            hashes, pendientes, evitadas = [], {}, {}
+            for indice, fragmento in enumerate(_fragmentos_traduccion(ruta, detectar_formato(ruta), opciones, procesos=None)):
+                hash_fragmento = _hash(fragmento)
+                hashes.append(hash_fragmento)
+                if progreso.obtener(indice, hash_fragmento) is None:
+                    reutilizada = reuse_translation(None, fragmento, opciones["modelo"], language, allow_patch=False)
+                    if reutilizada:
+                        evitadas[indice] = format_concise(reutilizada[0])
+                        progreso.registrar(indice, hash_fragmento, evitadas[indice])
+                        continue
+                    identificador = identificador_solicitud("concis", os.path.abspath(ruta), indice, hash_fragmento)
+                    solicitudes[identificador] = build_concise_request(fragmento, modelo, language)
+                    fragmentos[identificador] = fragmento
+                    pendientes[identificador] = indice
+        documentos.append((ruta, progreso, hashes, pendientes, evitadas, traza))
+
+    def informar(lotes):
+        completadas = sum(lote.get("completadas", 0) for lote in lotes)
+        total = sum(len(lote["solicitudes"]) for lote in lotes)
+        estados = ", ".join(sorted({lote["estado"] for lote in lotes}))
+        print(f"Lotes de la API: {estados} ({completadas}/{total} solicitudes)", file=sys.stderr, flush=True)
+
+    cliente = obtener_cliente(models_for(opciones["modelo"])[-1])
+    respuestas, errores, estadisticas = resolver_solicitudes(
+        cliente, solicitudes, "concis", intervalo=intervalo, al_avanzar=informar
+    )
+    print(json.dumps({"api_lotes": estadisticas}, ensure_ascii=False), file=sys.stderr, flush=True)
+
+    for ruta, progreso, hashes, pendientes, evitadas, traza in documentos:
+        nuevos, fallidos, tokens, repetir, evitadas_repeticiones = dict(evitadas), {}, 0, [], 0
+        for identificador, indice in pendientes.items():
+            if identificador not in respuestas:
+                fallidos[indice] = errores.get(identificador, "sin resultado")
+                continue
+            respuesta = respuestas[identificador]
+            if not respuesta["desde_cache"]:
+                tokens += respuesta["uso"]["prompt_tokens"] + respuesta["uso"]["completion_tokens"]
+            if check_translation(fragmentos[identificador], respuesta["contenido"], respuesta["finish_reason"]):
+                repetir.append((indice, identificador))
+                continue
+            nuevos[indice] = format_concise(respuesta["contenido"])
+            remember_translation(fragmentos[identificador], respuesta["contenido"], opciones["modelo"], language)
+            progreso.registrar(indice, hashes[indice], nuevos[indice])
+
+        # Las traducciones que no superan las comprobaciones se repiten en paralelo, en una traza propia de la que
+        # se toman sus tokens y tiempos
+        tiempos = {etapa["etapa"]: etapa["total_s"] for etapa in traza.resumen()}
+        if repetir:
+            def repetir_traduccion(par):
+                indice, identificador = par
+                resultado, superada = translate_chunk_to_concise(cliente, fragmentos[identificador], opciones["modelo"], language)
+                if superada:
+                    progreso.registrar(indice, hashes[indice], resultado)
+                return resultado
+
+            with ejecucion("concis", documento=ruta, modo="api_lotes_repeticiones") as traza_repeticiones:
+                repetidas, fallos = ejecutar_en_orden(repetir_traduccion, repetir, max_en_vuelo=opciones["hilos"])
+            for posicion, (indice, _) in enumerate(repetir):
+                if posicion in fallos:
+                    fallidos[indice] = str(fallos[posicion])
+                else:
+                    nuevos[indice] = repetidas[posicion]
+            for etapa in traza_repeticiones.resumen():
+                tokens += etapa["tokens_prompt"] + etapa["tokens_completion"]
+                tiempos[etapa["etapa"]] = round(tiempos.get(etapa["etapa"], 0) + etapa["total_s"], 3)
+            evitadas_repeticiones = _llamadas_evitadas(traza_repeticiones)
+        resumen = {
+            "ruta": ruta, "fragmentos": len(hashes), "reutilizados": len(hashes) - len(pendientes) - len(evitadas),
+            "modo": "api_lotes", "tiempos_s": tiempos, "tokens": tokens,
+            "tokens_ahorrados": _tokens_ahorrados(traza),
+            "llamadas_evitadas": len(evitadas) + evitadas_repeticiones,
+        }
+        if fallidos:
+            resumenes.append(dict(resumen, estado="incompleto", errores=fallidos))
+            continue
+        resultados = [nuevos[indice] if indice in nuevos else progreso.obtener(indice, hash_fragmento) for indice, hash_fragmento in enumerate(hashes)]
+        salida = _ruta_traduccion(ruta, opciones)
+        with open(salida, "w", encoding="utf-8") as archivo:
+            archivo.write("".join(resultado + "\n\n" for resultado in resultados))
+        progreso.completar(salida, len(hashes))
+        resumenes.append(dict(resumen, estado="completado", salida=salida))
+    return resumenes
+
+# Función para expandir directorios y patrones glob en la lista de documentos admitidos
+def buscar_documentos(entradas):
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = glob.glob(os.path.join(entrada, "**", "*"), recursive=True)
+        else:
+            candidatos = glob.glob(entrada, recursive=True)
+        for ruta in sorted(candidatos):
+            nombre = os.path.basename(ruta)
+            if os.path.isfile(ruta) and detectar_formato(ruta) and not nombre.startswith(".") and not PATRON_SALIDAS.search(nombre):
+                rutas.append(ruta)
+    return list(dict.fromkeys(rutas))
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Procesamiento por lotes de documentos con Concis o Descom")
+    parser.add_argument("herramienta", choices=sorted(HERRAMIENTAS))
+    parser.add_argument("entradas", nargs="+", help="Directorios o patrones glob de documentos")
+    parser.add_argument("--idioma", choices=sorted(IDIOMAS), default="es", help="Idioma de la traducción concisa")
+    parser.add_argument("--modelo", default=CASCADE, help="Modelo para la traducción concisa (o cascada: rápido y, si falla, grande)")
+    parser.add_argument("--tamano", type=int, default=5000, help="Tamaño orientativo de los fragmentos, en caracteres")
+    parser.add_argument("--tokens-por-seccion", type=int, default=TOKENS_POR_SECCION, help="Tamaño de sección de la descomposición")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Documentos procesados en paralelo")
+    parser.add_argument("--max-en-vuelo", type=int, default=8, help="Llamadas simultáneas a la API en todo el lote")
+    parser.add_argument("--forzar", action="store_true", help="Volver a procesar documentos ya completados (los fragmentos sin cambios se reutilizan)")
+    parser.add_argument("--api-lotes", action="store_true", help="Traducir con la Batch API de OpenAI (solo concis)")
+    parser.add_argument("--sondeo", type=float, default=INTERVALO_SONDEO, help="Segundos entre consultas de los lotes de la API")
+    argumentos = parser.parse_args(argumentos)
+    if argumentos.api_lotes and argumentos.herramienta != "concis":
+        parser.error("--api-lotes solo está disponible para concis")
+
+    rutas = buscar_documentos(argumentos.entradas)
+    if not rutas:
+        print("No se encontraron documentos admitidos.", file=sys.stderr)
+        return 1
+
+    opciones = {
+        "idioma": argumentos.idioma,
+        "modelo": argumentos.modelo if argumentos.herramienta == "concis" else MODELO_DESCOMPOSICION,
+        "tamano": argumentos.tamano,
+        "tokens_por_seccion": argumentos.tokens_por_seccion,
+        "hilos": argumentos.max_en_vuelo,
+        "forzar": argumentos.forzar,
+    }
+    # Los procesos del grupo crean su cliente al iniciarse: la clave se comprueba una sola vez, antes de lanzarlos
+    if obtener_cliente(models_for(opciones["modelo"])[-1]) is None:
+        print("Falta la clave de la API (OPENAI_API_KEY).", file=sys.stderr)
+        return 1
+    if argumentos.api_lotes:
+        resumenes = traducir_con_api_lotes(rutas, opciones, argumentos.sondeo)
+        for resumen in resumenes:
+            print(json.dumps(resumen, ensure_ascii=False), flush=True)
+        return 1 if any(resumen["estado"] == "incompleto" for resumen in resumenes) else 0
+
+    contexto = multiprocessing.get_context("spawn")
+    semaforo = contexto.BoundedSemaphore(argumentos.max_en_vuelo)
+    fallidos = 0
+    procesos = min(argumentos.procesos, len(rutas))
+    with ProcessPoolExecutor(
+        max_workers=procesos, mp_context=contexto, initializer=_inicializar_proceso, initargs=(semaforo, procesos)
+    ) as ejecutor:
+        futuros = {ejecutor.submit(procesar_documento, argumentos.herramienta, ruta, opciones): ruta for ruta in rutas}
+        for futuro in as_completed(futuros):
+            try:
+                resumen = futuro.result()
+            except Exception as e:
+                resumen = {"ruta": futuros[futuro], "estado": "error", "error": str(e)}
+            if resumen["estado"] in ("incompleto", "error"):
+                fallidos += 1
+            print(json.dumps(resumen, ensure_ascii=False), flush=True)
+    return 1 if fallidos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from fragmentacion import contar_tokens
+from instrumentacion import IterableMedido
+
+# Normalización del texto extraído antes de enviarlo al modelo: elimina los encabezados, pies y números de página
+# que se repiten en cada página, une las palabras cortadas con guion y las líneas partidas por el ancho de la
+# página, colapsa los espacios y quita el marcado (markdown/HTML) en lugar de añadirlo. Todo ello son tokens de
+# entrada que se pagan en cada llamada sin aportar contenido.
+
+# Líneas del principio y del final de cada página en las que se buscan encabezados y pies repetidos
+LINEAS_BORDE = 3
+# Una línea de borde es repetitiva si aparece en al menos esta fracción de las páginas (y en MIN_PAGINAS_REPETIDAS)
+FRACCION_REPETICION = 0.5
+MIN_PAGINAS_REPETIDAS = 3
+# Páginas que se examinan antes de empezar a entregar texto; las siguientes siguen actualizando la detección
+PAGINAS_APRENDIZAJE = 8
+# Las líneas más largas no se consideran encabezados ni pies
+MAX_LONGITUD_BORDE = 120
+# Una línea de menos de esta fracción de la longitud habitual cierra su párrafo (títulos, últimas líneas)
+FRACCION_LINEA_CORTA = 0.6
+
+# Número de página: "12", "- 12 -", "Página 3 de 40", "p. 7", "12/40" o romanos en minúscula ("iv"). Los que llevan
+# un indicador de página (prefijo, guiones o total) se reconocen siempre; los números sueltos y los romanos, que
+# también pueden ser un año, una cifra de una tabla o una palabra ("mi", "vi"), solo si siguen el orden de las
+# páginas (ver DetectorRepeticiones)
+PATRON_NUMERO_PAGINA = re.compile(
+    r"^(?P<antes>[\s\-–—|·•]*(?:(?i:p[áa]g(?:ina)?|page|p)\.?\s*)?)"
+    r"(?:(?P<arabigo>\d{1,4})|(?P<romano>(?=[ivxlcdm]+\s*$)m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})))"
+    r"(?P<despues>(?:\s*(?:/|(?i:de|of))\s*\d{1,4})?[\s\-–—|·•]*)$"
+)
+PATRON_NUMERO = re.compile(r"\d+")
+VALORES_ROMANOS = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+# Inicio de línea que abre un bloque propio y no continúa la línea anterior: listas, títulos, citas y tablas
+PATRON_INICIO_BLOQUE = re.compile(r"^(?:[-*+•▪◦‣]\s|\d{1,3}[.)]\s|[a-zA-Z][.)]\s|#{1,6}\s|>|\|)")
+PATRON_FIN_ORACION = re.compile(r"[.!?:;…»”\"')\]]$")
+LIGADURAS = str.maketrans({"ﬀ": "ff", "ﬁ": "fi", "ﬂ": "fl", "ﬃ": "ffi", "ﬄ": "ffl", "ﬅ": "st", "ﬆ": "st"})
+
+# Clave de comparación de una línea de borde: sin mayúsculas ni espacios extra
+def _clave_linea(linea):
+    return re.sub(r"\s+", " ", linea.strip().lower())
+
+def _valor_romano(romano):
+    valor = 0
+    for cifra, siguiente in zip(romano, romano[1:] + " "):
+        cifra = VALORES_ROMANOS[cifra]
+        valor += -cifra if VALORES_ROMANOS.get(siguiente, 0) > cifra else cifra
+    return valor
+
+# Función para reconocer una línea de número de página. Devuelve (valor, indicado) o None, donde `indicado` señala
+# que lleva un indicador de página; los romanos nunca cuentan como indicados.
+def numero_pagina(linea):
+    coincidencia = PATRON_NUMERO_PAGINA.match(linea.strip())
+    if not linea.strip() or coincidencia is None:
+        return None
+    if coincidencia["romano"]:
+        return _valor_romano(coincidencia["romano"]), False
+    return int(coincidencia["arabigo"]), bool(coincidencia["antes"].strip() or coincidencia["despues"].strip())
+
+# Claves de una línea de borde de la página `pagina` que la reconocen aunque su número cambie en cada página: para
+# cada número de la línea, el resto de la línea con ese número enmascarado y la diferencia entre el número y la
+# página. Un pie "Informe 2024 · 12" en páginas sucesivas repite sus claves; los títulos "Artículo 5" o
+# "Capítulo 2", cuyo número no avanza al ritmo de las páginas, no.
+def _claves_numeradas(linea, pagina):
+    clave = _clave_linea(linea)
+    claves = [(clave[:numero.start()] + "#" + clave[numero.end():], int(numero.group()) - pagina) for numero in PATRON_NUMERO.finditer(clave)]
+    coincidencia = PATRON_NUMERO_PAGINA.match(linea.strip())
+    if coincidencia is not None and coincidencia["romano"]:
+        claves.append(("romano", _valor_romano(coincidencia["romano"]) - pagina))
+    return claves
+
+# Detector de encabezados, pies y números de página: cuenta en cuántas páginas aparece cada línea de borde, tal
+# cual o con un número que avanza con las páginas
+class DetectorRepeticiones:
+    def __init__(self):
+        self.apariciones = Counter()
+        self.paginas = 0
+
+    # Observar las líneas de la página siguiente y devolver su número de orden (desde 1)
+    def observar(self, lineas):
+        self.paginas += 1
+        claves = set()
+        for linea in _lineas_borde(lineas):
+            claves.add(_clave_linea(linea))
+            claves.update(_claves_numeradas(linea, self.paginas))
+        self.apariciones.update(claves)
+        return self.paginas
+
+    # Una línea de la página `pagina` es repetitiva si aparece tal cual en suficientes páginas o si su número
+    # sigue el orden de las páginas en ellas. Los romanos de las páginas preliminares, que son pocas, bastan con
+    # aparecer en MIN_PAGINAS_REPETIDAS.
+    def es_repetida(self, linea, pagina):
+        if self.paginas < MIN_PAGINAS_REPETIDAS:
+            return False
+        minimo = max(MIN_PAGINAS_REPETIDAS, FRACCION_REPETICION * self.paginas)
+        if self.apariciones[_clave_linea(linea)] >= minimo:
+            return True
+        return any(
+            self.apariciones[clave] >= (MIN_PAGINAS_REPETIDAS if clave[0] == "romano" else minimo)
+            for clave in _claves_numeradas(linea, pagina)
+        )
+
+    def es_numero_pagina(self, linea, pagina):
+        numero = numero_pagina(linea)
+        return numero is not None and (numero[1] or self.es_repetida(linea, pagina))
+
+def _lineas_borde(lineas):
+    contenido = [linea for linea in lineas if linea.strip() and len(linea.strip()) <= MAX_LONGITUD_BORDE]
+    return contenido[:LINEAS_BORDE] + contenido[-LINEAS_BORDE:]
+
+# Función para quitar de la página número `pagina` los encabezados, pies y números de página de sus líneas de borde.
+# Devuelve (líneas restantes, líneas eliminadas).
+def limpiar_pagina(texto, detector, pagina):
+    lineas = texto.split("\n")
+    no_vacias = [indice for indice, linea in enumerate(lineas) if linea.strip()]
+    borde = set(no_vacias[:LINEAS_BORDE] + no_vacias[-LINEAS_BORDE:])
+    eliminadas = {
+        indice for indice in borde
+        if len(lineas[indice].strip()) <= MAX_LONGITUD_BORDE
+        and (detector.es_numero_pagina(lineas[indice], pagina) or detector.es_repetida(lineas[indice], pagina))
+    }
+    return [linea for indice, linea in enumerate(lineas) if indice not in eliminadas], len(eliminadas)
+
+# Función para unir las palabras cortadas con guion al final de línea y las líneas partidas por el ancho de la
+# página. Una línea continúa la anterior salvo que esta cierre una oración y la siguiente empiece en mayúscula,
+# que la anterior sea mucho más corta que las habituales (títulos, final de párrafo) o que la siguiente abra un
+# bloque propio (listas, títulos, citas, tablas). No se toca el interior de los bloques de código.
+def unir_lineas(texto):
+    lineas = texto.split("\n")
+    longitudes = sorted(len(linea.strip()) for linea in lineas if linea.strip())
+    habitual = longitudes[len(longitudes) // 2] if longitudes else 0
+    salida = []
+    en_codigo = False
+    puede_continuar = False
+    for linea in lineas:
+        limpia = linea.strip()
+        if limpia.startswith("```"):
+            en_codigo = not en_codigo
+            salida.append(linea)
+            puede_continuar = False
+            continue
+        if en_codigo:
+            salida.append(linea)
+            continue
+        if puede_continuar and limpia and not PATRON_INICIO_BLOQUE.match(limpia):
+            previa = salida[-1]
+            if previa.endswith("-") and len(previa) > 1 and previa[-2].isalpha() and limpia[0].islower():
+                salida[-1] = previa[:-1] + limpia
+                continue
+            if not PATRON_FIN_ORACION.search(previa) or limpia[0].islower():
+                salida[-1] = previa + " " + limpia
+                continue
+        salida.append(linea.rstrip())
+        puede_continuar = (
+            bool(limpia) and not limpia.startswith(("#", "|")) and len(limpia) >= FRACCION_LINEA_CORTA * habitual
+        )
+    return "\n".join(salida)
+
+# Función para colapsar los espacios: espacios y tabulaciones repetidos, espacios al final de línea y más de una
+# línea en blanco seguida. Con `conservar_sangria` se mantiene la sangría inicial (listas anidadas) y no se toca el
+# interior de los bloques de código.
+def colapsar_espacios(texto, conservar_sangria=False):
+    texto = texto.translate(LIGADURAS).replace("\u00ad", "").replace("\r\n", "\n").replace("\r", "\n")
+    lineas = []
+    en_codigo = False
+    for linea in texto.split("\n"):
+        if conservar_sangria and linea.strip().startswith("```"):
+            en_codigo = not en_codigo
+        elif en_codigo:
+            lineas.append(linea.rstrip())
+            continue
+        sangria = linea[:len(linea) - len(linea.lstrip(" \t"))] if conservar_sangria else ""
+        lineas.append(sangria + re.sub(r"[ \t\u00a0\u2000-\u200b\u3000]+", " ", linea).strip())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lineas))
+
+# Función para quitar el marcado markdown y HTML que no aporta contenido: etiquetas y comentarios HTML, énfasis,
+# enlaces e imágenes (se conserva su texto), definiciones de referencias y líneas separadoras. Se conservan los
+# títulos, las listas y las tablas, que dan estructura al texto, y el interior de los bloques de código.
+def quitar_marcado(texto):
+    partes = re.split(r"(^```.*?^```[^\n]*$)", texto, flags=re.MULTILINE | re.DOTALL)
+    for indice in range(0, len(partes), 2):
+        parte = partes[indice]
+        parte = re.sub(r"<!--.*?-->", "", parte, flags=re.DOTALL)
+        parte = re.sub(r"<(https?://[^>\s]+)>", r"\1", parte)
+        parte = re.sub(r"</?[a-zA-Z][^>\n]*>", "", parte)
+        parte = re.sub(r"!\[([^\]]*)\]\([^)]*\)", r"\1", parte)
+        parte = re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", parte)
+        parte = re.sub(r"\[([^\]]+)\]\[[^\]]*\]", r"\1", parte)
+        parte = re.sub(r"^[ \t]{0,3}\[[^\]]+\]:[ \t]+\S+.*$", "", parte, flags=re.MULTILINE)
+        parte = re.sub(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1", r"\2", parte)
+        parte = re.sub(r"(?<![\w*])\*(?=\S)(.+?)(?<=\S)\*(?!\w)", r"\1", parte)
+        parte = re.sub(r"(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)", r"\1", parte)
+        parte = re.sub(r"~~(.+?)~~", r"\1", parte)
+        parte = re.sub(r"`([^`\n]+)`", r"\1", parte)
+        parte = re.sub(r"^[ \t]{0,3}([-*_=])(?:[ \t]*\1){2,}[ \t]*$", "", parte, flags=re.MULTILINE)
+        partes[indice] = parte
+    return "".join(partes)
+
+# Función para normalizar un bloque de texto (una página, un bloque de líneas o un párrafo) según su formato.
+# Las líneas solo se unen en los formatos que parten el texto por el ancho de la página (PDF, texto plano y
+# markdown): en el texto escrito directamente (sin formato) y en los párrafos de DOCX cada salto de línea es del autor.
+def normalizar_bloque(texto, formato=None):
+    if formato == "md":
+        return colapsar_espacios(unir_lineas(quitar_marcado(texto)), conservar_sangria=True)
+    if formato in (None, "docx"):
+        return colapsar_espacios(texto)
+    return colapsar_espacios(unir_lineas(colapsar_espacios(texto)))
+
+# Función que normaliza los bloques de un documento a medida que llegan, llevando la cuenta de los tokens antes y
+# después en `estadisticas`. En los PDF se examinan las primeras páginas para detectar encabezados y pies antes de
+# entregar la primera; a partir de ahí cada página se entrega en cuanto se limpia.
+def _normalizar_en_flujo(bloques, formato, model, estadisticas):
+    def contar(original, normalizado):
+        estadisticas["tokens_antes"] += contar_tokens(original, model)
+        estadisticas["tokens_despues"] += contar_tokens(normalizado, model)
+        estadisticas["tokens_ahorrados"] = estadisticas["tokens_antes"] - estadisticas["tokens_despues"]
+        return normalizado
+
+    if formato != "pdf":
+        for bloque in bloques:
+            yield contar(bloque, normalizar_bloque(bloque, formato))
+        return
+
+    detector = DetectorRepeticiones()
+    pendientes = []
+
+    def limpiar(indice, pagina):
+        lineas, eliminadas = limpiar_pagina(pagina, detector, indice)
+        estadisticas["lineas_eliminadas"] += eliminadas
+        texto = normalizar_bloque("\n".join(lineas), formato).strip("\n")
+        return contar(pagina, texto + "\n\n" if texto else "")
+
+    for pagina in bloques:
+        indice = detector.observar(pagina.split("\n"))
+        if len(pendientes) < PAGINAS_APRENDIZAJE:
+            pendientes.append((indice, pagina))
+            if len(pendientes) < PAGINAS_APRENDIZAJE:
+                continue
+            for pendiente in pendientes:
+                yield limpiar(*pendiente)
+            continue
+        yield limpiar(indice, pagina)
+    if len(pendientes) < PAGINAS_APRENDIZAJE:
+        for pendiente in pendientes:
+            yield limpiar(*pendiente)
+
+# Función para normalizar un flujo de bloques de un documento (p. ej. las páginas que entrega la ingesta).
+# Devuelve un iterable medido (etapa "normalizacion") cuyos `atributos` acumulan los tokens antes y después,
+# los tokens ahorrados y las líneas de encabezado, pie o número de página eliminadas.
+def normalizar_bloques(bloques, formato=None, model="gpt-4o-mini"):
+    estadisticas = {"formato": formato, "tokens_antes": 0, "tokens_despues": 0, "tokens_ahorrados": 0, "lineas_eliminadas": 0}
+    return IterableMedido("normalizacion", _normalizar_en_flujo(bloques, formato, model, estadisticas), interno=bloques, atributos=estadisticas)
+
+# Resumen legible del ahorro de una normalización
+def resumen_normalizacion(estadisticas):
+    antes = estadisticas["tokens_antes"]
+    porcentaje = 100 * estadisticas["tokens_ahorrados"] / antes if antes else 0
+    return f"Normalización del texto: {antes} → {estadisticas['tokens_despues']} tokens ({estadisticas['tokens_ahorrados']} ahorrados, {porcentaje:.1f} %)"
+
+# Normalizaciones recientes de textos completos, para no repetirlas en cada ejecución de la página
+MAX_NORMALIZACIONES_RECORDADAS = 16
+_normalizaciones = OrderedDict()
+_bloqueo = threading.Lock()
+
+# Función para normalizar un texto completo (o un documento extraído, con sus páginas) y devolver
+# (texto normalizado, estadísticas). Los resultados recientes se recuerdan por el hash del texto.
+def normalizar_texto(texto, formato=None, model="gpt-4o-mini", bloques=None):
+    clave = hashlib.sha256(f"{formato}\0{model}\0{texto}".encode("utf-8")).hexdigest()
+    with _bloqueo:
+        if clave in _normalizaciones:
+            _normalizaciones.move_to_end(clave)
+            return _normalizaciones[clave]
+    normalizados = normalizar_bloques(bloques if bloques is not None else [texto], formato, model)
+    resultado = "".join(normalizados).strip() + "\n", dict(normalizados.atributos)
+    with _bloqueo:
+        _normalizaciones[clave] = resultado
+        while len(_normalizaciones) > MAX_NORMALIZACIONES_RECORDADAS:
+            _normalizaciones.popitem(last=False)
+    return resultado
+
+# Función para normalizar un documento extraído por la ingesta (ver ingesta.extraer_documento)
+def normalizar_documento(documento, model="gpt-4o-mini"):
+    texto, inicios = documento["texto"], documento["bloques"]
+    bloques = [texto[inicio:fin] for inicio, fin in zip(inicios, inicios[1:] + [len(texto)])]
+    return normalizar_texto(texto, documento["formato"], model, bloques=bloques)
@@ -0,0 +1,79 @@
+import importlib
+import os
+import threading
+import time
+
+# Páginas de la aplicación: etiqueta de la barra lateral -> (módulo que la implementa, nombre de la herramienta en
+# las trazas y métricas). Los módulos se importan al elegir la página por primera vez, de modo que el arranque no
+# carga PyMuPDF, python-docx, markdown ni el SDK de OpenAI hasta que una página los necesita.
+PAGINAS = {
+    "Concisión": ("Concis", "concis"),  # Página 1: Traductor a Español Conciso
+    "Descomposición": ("Descom", "descom"),  # Página 2: Descomposición de Contenidos
+    "Reconstrucción": ("Recon", "recon"),  # Página 3: Reconstrucción de Texto
+    "Refactorización": ("Refac", "refac"),  # Página 4: Refactorización de Árboles de Contenido
+}
+
+# Importar en segundo plano las demás páginas tras mostrar la primera, para que cambiar de página sea inmediato
+PRECARGAR = os.getenv("TEXTEADOR_PRECARGAR_PAGINAS", "0") != "0"
+
+# Crear los clientes de la API y abrir sus conexiones en segundo plano al iniciar (ver clientes.py)
+PRECALENTAR_CLIENTES = os.getenv("TEXTEADOR_PRECALENTAR", "0") != "0"
+
+_modulos = {}
+_tiempos_importacion = {}
+_bloqueo = threading.Lock()
+_precargadas = False
+_clientes_precalentados = False
+
+# Función para obtener el módulo de una página, importándolo (una sola vez por proceso) si aún no se cargó.
+# Devuelve (módulo, segundos de importación), con None como tiempo si el módulo ya estaba cargado.
+def cargar_pagina(etiqueta):
+    nombre_modulo = PAGINAS[etiqueta][0]
+    modulo = _modulos.get(nombre_modulo)
+    if modulo is not None:
+        return modulo, None
+    # El bloqueo de importación de Python evita importar dos veces un módulo que otro hilo está precargando
+    inicio = time.perf_counter()
+    modulo = importlib.import_module(nombre_modulo)
+    segundos = time.perf_counter() - inicio
+    with _bloqueo:
+        _modulos[nombre_modulo] = modulo
+        _tiempos_importacion.setdefault(nombre_modulo, segundos)
+    return modulo, segundos
+
+def nombre_herramienta(etiqueta):
+    return PAGINAS[etiqueta][1]
+
+# Tiempo que tardó en importarse cada página cargada en este proceso, en segundos
+def tiempos_importacion():
+    with _bloqueo:
+        return dict(_tiempos_importacion)
+
+# Función para importar en segundo plano las páginas que aún no se cargaron (una sola vez por proceso)
+def precargar_paginas():
+    global _precargadas
+    with _bloqueo:
+        if _precargadas:
+            return
+        _precargadas = True
+
+    def precargar():
+        for etiqueta in PAGINAS:
+            try:
+                cargar_pagina(etiqueta)
+            except Exception:
+                pass  # la página mostrará el error de importación cuando se elija
+    threading.Thread(target=precargar, daemon=True).start()
+
+# Función para crear en segundo plano el registro de clientes de la API, que abre las conexiones con la API sin
+# retrasar la primera página (importar el SDK de OpenAI lleva casi un segundo)
+def precalentar_clientes():
+    global _clientes_precalentados
+    with _bloqueo:
+        if _clientes_precalentados:
+            return
+        _clientes_precalentados = True
+
+    def precalentar():
+        importlib.import_module("clientes").obtener_registro()
+    threading.Thread(target=precalentar, daemon=True).start()
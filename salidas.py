@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+
+import streamlit as st
+
+# Tamaño orientativo de cada página del visor de salidas, en caracteres
+CARACTERES_POR_PAGINA = int(os.getenv("TEXTEADOR_VISOR_CARACTERES", "20000"))
+
+# El índice de los fragmentos de una salida se guarda junto a su texto
+def _ruta_indice(ruta):
+    return f"{ruta}.indice.json"
+
+# Escritura en disco de una salida larga (p. ej. la traducción de un documento de mil páginas) fragmento a fragmento.
+# Los fragmentos pueden llegar desordenados: se retienen solo los que se adelantan (como mucho los que están en vuelo)
+# y se escriben en orden en cuanto llega el que falta, de modo que el texto completo nunca está en memoria.
+# Cada fragmento se escribe seguido de `separador`; el índice guarda su posición y longitud en bytes y su longitud
+# en caracteres.
+class VolcadoSalida:
+    def __init__(self, ruta, separador=""):
+        self.ruta = ruta
+        self.separador = separador
+        self.fragmentos = []
+        self.bytes = 0
+        self._pendientes = {}
+        self._bloqueo = threading.Lock()
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        self._archivo = open(f"{ruta}.parcial", "wb")
+
+    def escribir(self, indice, texto):
+        with self._bloqueo:
+            self._pendientes[indice] = texto
+            while len(self.fragmentos) in self._pendientes:
+                texto = self._pendientes.pop(len(self.fragmentos))
+                datos = texto.encode("utf-8")
+                self._archivo.write(datos + self.separador.encode("utf-8"))
+                self.fragmentos.append([self.bytes, len(datos), len(texto)])
+                self.bytes += len(datos) + len(self.separador.encode("utf-8"))
+
+    # Terminar la salida: el texto y su índice solo aparecen con su nombre definitivo cuando están completos
+    def cerrar(self):
+        with self._bloqueo:
+            if self._pendientes:
+                raise ValueError(f"Faltan fragmentos anteriores a {min(self._pendientes)} en la salida")
+            self._archivo.close()
+            os.replace(f"{self.ruta}.parcial", self.ruta)
+            with open(_ruta_indice(self.ruta), "w", encoding="utf-8") as archivo:
+                json.dump({"separador": self.separador, "fragmentos": self.fragmentos}, archivo)
+        return self.ruta
+
+    def descartar(self):
+        self._archivo.close()
+        if os.path.exists(f"{self.ruta}.parcial"):
+            os.remove(f"{self.ruta}.parcial")
+
+# Lectura de una salida en disco por fragmentos o por páginas de fragmentos consecutivos, sin cargarla completa
+class SalidaEnDisco:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(_ruta_indice(ruta), encoding="utf-8") as archivo:
+            indice = json.load(archivo)
+        self.separador = indice["separador"]
+        self.fragmentos = indice["fragmentos"]
+        self.bytes = os.path.getsize(ruta)
+
+    # Fragmentos en orden, sin el separador, leídos uno a uno
+    def iterar_fragmentos(self):
+        with open(self.ruta, "rb") as archivo:
+            for inicio, longitud, *_ in self.fragmentos:
+                archivo.seek(inicio)
+                yield archivo.read(longitud).decode("utf-8")
+
+    # Páginas del visor: rangos [primero, último) de fragmentos que suman unos `caracteres` (al menos un fragmento).
+    # Los índices anteriores no guardan los caracteres y se mide con los bytes.
+    def paginas(self, caracteres=CARACTERES_POR_PAGINA):
+        rangos, primero, acumulado = [], 0, 0
+        for i, fragmento in enumerate(self.fragmentos):
+            acumulado += fragmento[2] if len(fragmento) > 2 else fragmento[1]
+            if acumulado >= caracteres:
+                rangos.append((primero, i + 1))
+                primero, acumulado = i + 1, 0
+        if primero < len(self.fragmentos) or not rangos:
+            rangos.append((primero, len(self.fragmentos)))
+        return rangos
+
+    # Texto de los fragmentos [primero, último), con sus separadores, leído de una vez del disco
+    def leer(self, primero, ultimo):
+        if primero >= ultimo:
+            return ""
+        inicio = self.fragmentos[primero][0]
+        fin = self.fragmentos[ultimo - 1][0] + self.fragmentos[ultimo - 1][1] + len(self.separador.encode("utf-8"))
+        with open(self.ruta, "rb") as archivo:
+            archivo.seek(inicio)
+            return archivo.read(fin - inicio).decode("utf-8")
+
+    # Contenido completo para la descarga (Streamlit lo pide al pulsar el botón)
+    def leer_bytes(self):
+        with open(self.ruta, "rb") as archivo:
+            return archivo.read()
+
+# Función para eliminar de un directorio las salidas de los trabajos que ya no existen (el almacén de trabajos la
+# llama al eliminar los trabajos antiguos). Los volcados a medio escribir también se eliminan, salvo los de los
+# trabajos que siguen activos (p. ej. en otro proceso).
+def limpiar_salidas(directorio, ids_vigentes, ids_activos=()):
+    if not os.path.isdir(directorio):
+        return
+    for nombre in os.listdir(directorio):
+        id_trabajo = nombre.split(".")[0]
+        if id_trabajo not in ids_vigentes or (nombre.endswith(".parcial") and id_trabajo not in ids_activos):
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except OSError:
+                pass  # otro proceso la eliminó antes
+
+# Función para mostrar una salida en disco con un visor paginado y un botón de descarga que lee el archivo al
+# pulsarlo. Solo la página visible se lee y se envía al navegador; la sesión guarda únicamente el número de página.
+def mostrar_salida(ruta, etiqueta, nombre_archivo, etiqueta_descarga="Descargar"):
+    try:
+        salida = SalidaEnDisco(ruta)
+    except (OSError, ValueError):
+        st.warning("La salida de este trabajo ya no está disponible; vuelve a enviarlo para generarla de nuevo.")
+        return
+    paginas = salida.paginas()
+    clave = f"pagina_{os.path.basename(ruta)}"
+    if len(paginas) > 1:
+        pagina = st.number_input(f"Página (de {len(paginas)})", min_value=1, max_value=len(paginas), value=1, key=clave)
+    else:
+        pagina = 1
+    primero, ultimo = paginas[pagina - 1]
+    st.text_area(etiqueta, salida.leer(primero, ultimo), height=300)
+    st.caption(
+        f"Fragmentos {primero + 1}–{ultimo} de {len(salida.fragmentos)} · {salida.bytes / 1024 / 1024:.2f} MB en total"
+    )
+    st.download_button(etiqueta_descarga, salida.leer_bytes, nombre_archivo, mime="text/plain", on_click="ignore")
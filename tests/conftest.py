@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Los módulos viven en la raíz del repositorio; la caché en disco se dirige a un directorio temporal
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TEXTEADOR_CACHE_DIR", tempfile.mkdtemp(prefix="texteador-tests-"))
@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+import openai
+import pytest
+from openai.resources.batches import Batches
+
+from api_lotes import EstadoLotes, identificador_solicitud, resolver_solicitudes
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from servidor_simulado import iniciar_servidor
+
+@pytest.fixture
+def servidor():
+    servidor = iniciar_servidor(latencia=0, tokens_por_segundo=0, latencia_lote=0)
+    yield servidor
+    servidor.shutdown()
+
+def _solicitudes(prefijo, cantidad):
+    return {
+        identificador_solicitud(prefijo, indice): {
+            "model": "gpt-4o-mini", "messages": [{"role": "user", "content": f"Traduce {prefijo} número {indice} ahora"}],
+        }
+        for indice in range(cantidad)
+    }
+
+def test_resultados_en_archivo_por_lote(servidor, tmp_path):
+    cliente = openai.OpenAI(base_url=servidor.url, api_key="simulada")
+    vistos = []
+
+    # Mientras se consulta, el estado solo guarda identificadores; los resultados van al archivo de cada lote
+    def al_avanzar(lotes):
+        for ruta in tmp_path.glob("*.json"):
+            vistos.append(json.loads(ruta.read_text(encoding="utf-8")))
+
+    respuestas, errores, estadisticas = resolver_solicitudes(
+        cliente, _solicitudes("resultados", 3), "prueba", directorio=str(tmp_path), intervalo=0.05, al_avanzar=al_avanzar
+    )
+    assert len(respuestas) == 3 and not errores and estadisticas["lotes"] == 1
+    assert vistos and all("respuesta" not in json.dumps(estado) for estado in vistos)
+    assert os.listdir(tmp_path) == []
+
+def test_no_se_duplica_un_lote_ya_creado(servidor, tmp_path, monkeypatch):
+    cliente = openai.OpenAI(base_url=servidor.url, api_key="simulada")
+    solicitudes = _solicitudes("retomado", 2)
+
+    # Interrumpir la ejecución justo después de crear el lote, antes de guardar su identificador
+    original = Batches.create
+    def crear_e_interrumpir(*argumentos, **opciones):
+        original(*argumentos, **opciones)
+        raise KeyboardInterrupt()
+    monkeypatch.setattr(Batches, "create", crear_e_interrumpir)
+    with pytest.raises(KeyboardInterrupt):
+        resolver_solicitudes(cliente, solicitudes, "prueba", directorio=str(tmp_path), intervalo=0.05)
+    (ruta_estado,) = tmp_path.glob("*.json")
+    assert EstadoLotes(str(ruta_estado)).lotes[0]["id_archivo"] is not None
+
+    monkeypatch.setattr(Batches, "create", original)
+    respuestas, errores, _ = resolver_solicitudes(cliente, solicitudes, "prueba", directorio=str(tmp_path), intervalo=0.05)
+    assert len(respuestas) == 2 and not errores
+    assert servidor.estadisticas["lotes"] == 1
@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+from servidor_simulado import iniciar_servidor
+
+@pytest.fixture
+def servidor(monkeypatch):
+    servidor = iniciar_servidor(latencia=0, tokens_por_segundo=0)
+    monkeypatch.setenv("OPENAI_BASE_URL", servidor.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "simulada")
+    yield servidor
+    servidor.shutdown()
+
+def test_el_panel_muestra_las_etapas_del_trabajo(servidor):
+    app = AppTest.from_file(os.path.join(RAIZ, "app.py"), default_timeout=30).run()
+    app.text_area[0].input("El informe trimestral resume las ventas de la región norte y las metas del próximo año.")
+    app.button[0].click().run()
+
+    # Volver a ejecutar la página hasta que el trabajo termine, como hace el fragmento que sigue su avance
+    limite = time.monotonic() + 30
+    while not app.sidebar.dataframe or "ensamblado" not in list(app.sidebar.dataframe[0].value["Etapa"]):
+        assert time.monotonic() < limite
+        time.sleep(0.1)
+        app.run()
+    etapas = list(app.sidebar.dataframe[0].value["Etapa"])
+    assert "api" in etapas and "fragmentacion" in etapas
@@ -0,0 +1,34 @@
+from arbol import Arbol, injertar_en_esqueleto
+
+def _texto(lineas):
+    return "\n".join(lineas)
+
+def test_fusionado_une_hermanos_con_el_mismo_texto():
+    arbol = Arbol.desde_texto(_texto([
+        "- Finanzas", "  - Presupuesto", "- finanzas.", "  - Impuestos", "- Marketing",
+    ]))
+    fusionado, repetidos = arbol.fusionado()
+    assert fusionado.a_texto() == _texto(["- Finanzas", "  - Presupuesto", "  - Impuestos", "- Marketing"])
+    assert repetidos == 0
+
+def test_fusionado_deja_una_referencia_de_los_subarboles_repetidos():
+    subarbol = ["  - Riesgos", "    - Legales", "    - Técnicos"]
+    arbol = Arbol.desde_texto(_texto(["- Fase uno", *subarbol, "- Fase dos", *subarbol, "  - Calendario"]))
+    fusionado, repetidos = arbol.fusionado(min_nodos=3)
+    # El padre del subárbol repetido conserva su nodo raíz como referencia
+    assert fusionado.a_texto() == _texto(["- Fase uno", *subarbol, "- Fase dos", "  - Riesgos", "  - Calendario"])
+    assert repetidos == 1
+
+def test_fusionado_sin_minimo_conserva_los_subarboles():
+    subarbol = ["  - Riesgos", "    - Legales", "    - Técnicos"]
+    arbol = Arbol.desde_texto(_texto(["- Fase uno", *subarbol, "- Fase dos", *subarbol]))
+    fusionado, repetidos = arbol.fusionado(min_nodos=None)
+    assert fusionado.a_texto() == arbol.a_texto()
+    assert repetidos == 0
+
+def test_injertar_en_esqueleto():
+    ramas = [Arbol.desde_texto("- Uno\n  - Hijo"), Arbol.desde_texto("- Dos"), Arbol.desde_texto("- Tres")]
+    resultado = injertar_en_esqueleto("- Bloque\n  - [2]\n  - [1]\n  - [9]", ramas)
+    # Las referencias inválidas se ignoran y las ramas omitidas se añaden al final
+    assert resultado.a_texto().startswith(_texto(["- Bloque", "  - Dos", "  - Uno", "    - Hijo"]))
+    assert "- Tres" in resultado.a_texto()
@@ -0,0 +1,40 @@
+import os
+
+from cache_llm import CacheLLM, MAX_ACCESOS_PENDIENTES
+
+def _bytes_reales(cache):
+    return cache._conexion().execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()[0]
+
+def test_guardar_y_obtener(tmp_path):
+    cache = CacheLLM(os.path.join(tmp_path, "c.sqlite3"))
+    cache.guardar("a", {"contenido": "hola"})
+    assert cache.obtener("a") == {"contenido": "hola"}
+    assert cache.obtener("b") is None
+    estadisticas = cache.estadisticas()
+    assert (estadisticas["aciertos_totales"], estadisticas["fallos_totales"]) == (1, 1)
+
+def test_lecturas_no_escriben_hasta_registrar(tmp_path):
+    cache = CacheLLM(os.path.join(tmp_path, "c.sqlite3"))
+    cache.guardar("a", {"contenido": "hola"})
+    cambios = cache._conexion().total_changes
+    for _ in range(MAX_ACCESOS_PENDIENTES - 1):
+        cache.obtener("a")
+    assert cache._conexion().total_changes == cambios
+    cache.obtener("a")
+    assert cache._conexion().total_changes > cambios
+
+def test_tamano_total_y_expulsion(tmp_path):
+    cache = CacheLLM(os.path.join(tmp_path, "c.sqlite3"), max_bytes=2000)
+    for i in range(100):
+        cache.guardar(f"k{i}", {"contenido": "x" * 50})
+    cache.guardar("k99", {"contenido": "y"})
+    assert cache.estadisticas()["bytes"] == _bytes_reales(cache) <= 2000
+    assert cache.obtener("k0") is None
+    assert cache.obtener("k99") == {"contenido": "y"}
+
+def test_caducidad(tmp_path):
+    cache = CacheLLM(os.path.join(tmp_path, "c.sqlite3"), ttl=1e-9)
+    cache.guardar("a", {"contenido": "hola"})
+    assert cache.obtener("a") is None
+    cache.guardar("b", {"contenido": "adiós"})
+    assert cache.estadisticas()["bytes"] == _bytes_reales(cache)
@@ -0,0 +1,23 @@
+import os
+
+from corpus import CorpusFuente
+
+TEXTOS = [
+    ("a", "El presupuesto anual fija los costes de personal.\n\nLa campaña de marketing usa redes sociales."),
+    ("b", "Los impuestos se declaran cada trimestre."),
+]
+
+def test_buscar_y_seleccionar(tmp_path):
+    with CorpusFuente.desde_textos(TEXTOS, directorio=str(tmp_path)) as corpus:
+        assert len(corpus) == 3
+        mejor = corpus.buscar("campaña marketing", k=1)[0][0]
+        assert "marketing" in corpus.texto_pasaje(mejor)
+        assert corpus.archivo_pasaje(mejor) == "a"
+        seleccion = corpus.seleccionar(["impuestos trimestre"], max_tokens=1000)
+        assert seleccion == "Los impuestos se declaran cada trimestre."
+
+def test_cerrar_elimina_los_textos(tmp_path):
+    corpus = CorpusFuente.desde_textos(TEXTOS, directorio=str(tmp_path))
+    assert os.listdir(tmp_path)
+    corpus.cerrar()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import openai
+import pytest
+
+import cache_llm
+from arbol import Arbol
+from descomposicion import profundizar_rama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from servidor_simulado import iniciar_servidor
+
+RAMA = Arbol.desde_texto("- Finanzas\n  - Presupuesto anual")
+TEXTO = "El presupuesto anual fija los costes de personal y las inversiones previstas para cada departamento. " * 20
+
+def _profundizar(monkeypatch, **configuracion):
+    monkeypatch.setattr(cache_llm, "CACHE_ACTIVA", False)
+    servidor = iniciar_servidor(latencia=0, tokens_por_segundo=0, **configuracion)
+    try:
+        return profundizar_rama(openai.OpenAI(base_url=servidor.url, api_key="simulada", max_retries=0), RAMA, TEXTO, "Finanzas")
+    finally:
+        servidor.shutdown()
+
+def test_profundizar_rama_conserva_las_lineas_originales(monkeypatch):
+    profundizada = _profundizar(monkeypatch)
+    assert profundizada.textos[0] == "Finanzas"
+    assert "Presupuesto anual" in profundizada.textos
+    assert len(profundizada) > len(RAMA)
+
+def test_profundizar_rama_truncada_falla(monkeypatch):
+    with pytest.raises(ValueError):
+        _profundizar(monkeypatch, max_tokens_respuesta=10)
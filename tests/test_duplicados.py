@@ -0,0 +1,69 @@
+import os
+import sys
+
+import openai
+
+from duplicados import IndiceDuplicados, diferencias_oraciones, firma_minhash, parchear_numeros, similitud_firmas
+from traduccion import translate_chunk_to_concise
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from servidor_simulado import iniciar_servidor
+
+TEXTO = (
+    "El contrato entra en vigor el 1 de marzo. Las partes revisarán las tarifas cada año. "
+    "El proveedor entregará los informes mensuales antes del día 10. Cualquier cambio requiere un acuerdo por escrito."
+)
+
+def test_firma_minhash_ignora_numeros_y_espacios():
+    renumerado = TEXTO.replace("1 de marzo", "15 de marzo").replace("  ", " ").replace(". ", ".\n")
+    assert similitud_firmas(firma_minhash(TEXTO), firma_minhash(renumerado)) == 1.0
+    distinto = "La campaña de marketing usa redes sociales y boletines para llegar a nuevos clientes cada semana."
+    assert similitud_firmas(firma_minhash(TEXTO), firma_minhash(distinto)) < 0.2
+
+def test_diferencias_oraciones():
+    assert diferencias_oraciones(TEXTO, TEXTO.replace("día 10", "día 12")) == ([], 0.0)
+    nuevo = TEXTO.replace("Las partes revisarán las tarifas cada año.", "Las tarifas son fijas.")
+    cambios, fraccion = diferencias_oraciones(TEXTO, nuevo)
+    assert cambios == [("replace", ["Las partes revisarán las tarifas cada año."], ["Las tarifas son fijas."], "El contrato entra en vigor el 1 de marzo.")]
+    assert fraccion == 0.25
+
+def test_parchear_numeros():
+    assert parchear_numeros("artículo 5, plazo de 10 días", "artículo 6, plazo de 10 días", "Article 5, 10-day term") == "Article 6, 10-day term"
+    # Dos números que se intercambian se sustituyen a la vez
+    assert parchear_numeros("de 5 a 6", "de 6 a 7", "from 5 to 6") == "from 6 to 7"
+
+def test_parchear_numeros_ambiguos():
+    # El mismo número cambia en una aparición y se conserva en otra
+    assert parchear_numeros("artículo 5, plazo de 5 días", "artículo 6, plazo de 5 días", "Article 5, 5-day term") is None
+    assert parchear_numeros("artículo 5", "artículo 6", "Article five") is None
+    assert parchear_numeros("de 5 a 6", "de 5", "from 5 to 6") is None
+
+def test_indice_encuentra_casi_identicos(tmp_path):
+    indice = IndiceDuplicados(str(tmp_path / "duplicados.sqlite3"))
+    indice.agregar(TEXTO, "traducción", "contexto")
+    similitud, previo, traduccion = indice.buscar(TEXTO.replace("día 10", "día 12"), "contexto")
+    assert similitud == 1.0 and previo == TEXTO and traduccion == "traducción"
+    assert indice.buscar(TEXTO, "otro contexto") is None
+
+def test_indice_prefiere_la_entrada_del_mismo_texto(tmp_path):
+    indice = IndiceDuplicados(str(tmp_path / "duplicados.sqlite3"))
+    hermano = TEXTO.replace("día 10", "día 12")
+    indice.agregar(hermano, "traducción del hermano", "contexto")
+    indice.agregar(TEXTO, "traducción propia", "contexto")
+    assert indice.buscar(TEXTO, "contexto") == (1.0, TEXTO, "traducción propia")
+    assert indice.buscar(hermano, "contexto") == (1.0, hermano, "traducción del hermano")
+
+def test_repetir_un_texto_identico_no_llama_a_la_api():
+    servidor = iniciar_servidor(latencia=0, tokens_por_segundo=0)
+    try:
+        cliente = openai.OpenAI(base_url=servidor.url, api_key="simulada")
+        # Fragmentos hermanos que solo difieren en los números
+        fragmentos = [f"La cláusula {numero} del anexo fija un plazo de {numero * 7} días para la entrega." for numero in range(3, 7)]
+        for fragmento in fragmentos:
+            translate_chunk_to_concise(cliente, fragmento, "gpt-4o-mini", "Spanish")
+        solicitudes = servidor.estadisticas["solicitudes"]
+        for fragmento in fragmentos:
+            translate_chunk_to_concise(cliente, fragmento, "gpt-4o-mini", "Spanish")
+        assert servidor.estadisticas["solicitudes"] == solicitudes
+    finally:
+        servidor.shutdown()
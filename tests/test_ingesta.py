@@ -0,0 +1,13 @@
+import io
+
+from ingesta import iterar_bloques_texto
+
+def test_bloques_de_texto_cortados_en_lineas_en_blanco():
+    texto = "uno\ndos\n\ntres\n"
+    assert list(iterar_bloques_texto(texto.encode("utf-8"), lineas_por_bloque=2)) == ["uno\ndos\n\n", "tres\n"]
+
+def test_el_flujo_del_llamador_no_se_cierra():
+    # Un flujo sin getvalue se lee directamente, sin copiarlo
+    flujo = io.BufferedReader(io.BytesIO("párrafo\n".encode("utf-8")))
+    assert list(iterar_bloques_texto(flujo)) == ["párrafo\n"]
+    assert not flujo.closed
@@ -0,0 +1,10 @@
+import instrumentacion
+from instrumentacion import Traza, Tramo
+
+def test_las_etiquetas_de_las_metricas_se_escapan(monkeypatch):
+    monkeypatch.setattr(instrumentacion, "_metricas", instrumentacion._Metricas())
+    Traza('lote "a"\\b\nc').registrar(Tramo("api", 0.0, 0.2, atributos={"modelo": "gpt-4o-mini", "tokens_prompt": 3}))
+    texto = instrumentacion.metricas_prometheus()
+    assert 'herramienta="lote \\"a\\"\\\\b\\nc"' in texto
+    # Cada muestra ocupa una sola línea
+    assert all(linea.startswith(("#", "texteador_")) for linea in texto.splitlines())
@@ -0,0 +1,107 @@
+import httpx
+import openai
+import pytest
+
+import limitador
+from limitador import Balde, ConcurrenciaAdaptativa, Limitador, es_transitorio, espera_indicada
+
+def _error(clase, estado, cabeceras=None):
+    respuesta = httpx.Response(estado, headers=cabeceras or {}, request=httpx.Request("POST", "http://simulado/v1/chat/completions"))
+    return clase("error simulado", response=respuesta, body=None)
+
+@pytest.fixture
+def esperas(monkeypatch):
+    esperas = []
+    monkeypatch.setattr(limitador.time, "sleep", esperas.append)
+    monkeypatch.setattr(limitador.random, "uniform", lambda minimo, maximo: maximo)
+    return esperas
+
+def test_balde_hace_esperar_lo_que_falta():
+    balde = Balde(60, 1)
+    assert balde.reservar(50) == 0.0
+    # El saldo queda en negativo y quien reserva espera a que se rellene
+    assert balde.reservar(20) == pytest.approx(10, abs=0.1)
+    balde.corregir(30)
+    assert balde.saldo == pytest.approx(20, abs=0.1)
+
+def test_concurrencia_aumenta_y_se_reduce_a_la_mitad():
+    concurrencia = ConcurrenciaAdaptativa(inicial=4, maxima=5)
+    # Cada éxito suma 1/límite: hacen falta unos cuatro o cinco para subir una solicitud
+    for _ in range(5):
+        concurrencia.exito()
+    assert concurrencia.limite == 5
+    concurrencia.reducir()
+    assert concurrencia.limite == 2.5
+    # Una ráfaga de rechazos cuenta como una sola señal
+    concurrencia.reducir()
+    assert concurrencia.limite == 2.5
+
+def test_errores_transitorios_y_espera_indicada():
+    assert es_transitorio(_error(openai.RateLimitError, 429))
+    assert es_transitorio(_error(openai.InternalServerError, 503))
+    assert not es_transitorio(_error(openai.BadRequestError, 400))
+    assert espera_indicada(_error(openai.RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+    assert espera_indicada(_error(openai.RateLimitError, 429, {"retry-after": "3"})) == 3.0
+    assert espera_indicada(_error(openai.RateLimitError, 429, {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})) is None
+
+def test_ejecutar_reintenta_los_rechazos(esperas):
+    errores = [_error(openai.RateLimitError, 429, {"retry-after": "5"}), _error(openai.InternalServerError, 500)]
+
+    def llamada():
+        if errores:
+            raise errores.pop(0)
+        return "respuesta"
+
+    limite = Limitador(6000, 1_000_000)
+    resultado, reintentos, espera_total, liberar = limite.ejecutar(llamada, 100)
+    assert (resultado, reintentos) == ("respuesta", 2)
+    # Tras el 429 se espera lo indicado y la pausa frena la siguiente llamada; el 500 usa la espera exponencial
+    assert esperas[0] == 5.0 and esperas[1] == pytest.approx(5.0, abs=0.5) and esperas[2] == 2.0
+    assert limite.rechazos == 1 and limite.concurrencia.en_vuelo == 0
+
+def test_ejecutar_no_reintenta_errores_permanentes(esperas):
+    llamadas = []
+
+    def llamada():
+        llamadas.append(1)
+        raise _error(openai.BadRequestError, 400)
+
+    limite = Limitador(6000, 1_000_000)
+    with pytest.raises(openai.BadRequestError):
+        limite.ejecutar(llamada, 100)
+    assert len(llamadas) == 1 and limite.concurrencia.en_vuelo == 0
+
+def test_mantener_ocupa_la_concurrencia_hasta_liberar(esperas):
+    limite = Limitador(6000, 1_000_000)
+    _, _, _, liberar = limite.ejecutar(lambda: "flujo", 100, mantener=True)
+    assert limite.concurrencia.en_vuelo == 1
+    liberar()
+    liberar()
+    assert limite.concurrencia.en_vuelo == 0
+
+def test_registrar_uso_corrige_la_cuota_de_tokens():
+    limite = Limitador(6000, 6000)
+    limite.tokens.reservar(1000)
+    limite.registrar_uso(1000, 400)
+    assert limite.estado()["tokens_disponibles"] == pytest.approx(5600, abs=5)
+
+def test_los_reintentos_no_vuelven_a_reservar_tokens(esperas):
+    errores = [_error(openai.InternalServerError, 500), _error(openai.InternalServerError, 503)]
+
+    def llamada():
+        if errores:
+            raise errores.pop(0)
+        return "respuesta"
+
+    limite = Limitador(6000, 6000)
+    limite.ejecutar(llamada, 1000)
+    assert limite.tokens.saldo == pytest.approx(5000, abs=5)
+
+def test_una_interrupcion_libera_la_concurrencia(esperas):
+    def llamada():
+        raise KeyboardInterrupt()
+
+    limite = Limitador(6000, 1_000_000)
+    with pytest.raises(KeyboardInterrupt):
+        limite.ejecutar(llamada, 100)
+    assert limite.concurrencia.en_vuelo == 0
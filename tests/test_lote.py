@@ -0,0 +1,84 @@
+import os
+import sys
+
+import cache_llm
+import lote
+
+OPCIONES = {"idioma": "es", "modelo": "gpt-4o-mini", "tamano": 1000, "tokens_por_seccion": 8000, "hilos": 2, "forzar": False}
+
+def _completar(ruta_documento, resultados):
+    progreso, omitido = lote._abrir_progreso("concis", ruta_documento, OPCIONES)
+    assert omitido is None
+    for indice, resultado in enumerate(resultados):
+        progreso.registrar(indice, lote._hash(f"fragmento {indice}"), resultado)
+    salida = f"{ruta_documento}.salida"
+    open(salida, "w").write("".join(resultados))
+    progreso.completar(salida, len(resultados))
+    return salida
+
+def test_documento_completado_se_omite(tmp_path):
+    documento = tmp_path / "doc.txt"
+    documento.write_text("texto original")
+    salida = _completar(str(documento), ["uno", "dos"])
+    progreso, omitido = lote._abrir_progreso("concis", str(documento), OPCIONES)
+    assert omitido == {"ruta": str(documento), "estado": "omitido", "salida": salida}
+
+def test_documento_editado_se_reprocesa_conservando_fragmentos(tmp_path):
+    documento = tmp_path / "doc.txt"
+    documento.write_text("texto original")
+    _completar(str(documento), ["uno", "dos"])
+    documento.write_text("texto editado")
+    progreso, omitido = lote._abrir_progreso("concis", str(documento), OPCIONES)
+    assert omitido is None
+    # Un fragmento que cambió de posición se encuentra por su hash
+    assert progreso.obtener(0, lote._hash("fragmento 1")) == "dos"
+
+def test_forzar_reutiliza_fragmentos(tmp_path):
+    documento = tmp_path / "doc.txt"
+    documento.write_text("texto original")
+    _completar(str(documento), ["uno", "dos"])
+    progreso, omitido = lote._abrir_progreso("concis", str(documento), dict(OPCIONES, forzar=True))
+    assert omitido is None
+    assert progreso.obtener(0, lote._hash("fragmento 0")) == "uno"
+
+def test_completar_descarta_posiciones_sobrantes(tmp_path):
+    documento = tmp_path / "doc.txt"
+    documento.write_text("texto original")
+    _completar(str(documento), ["uno", "dos", "tres"])
+    documento.write_text("texto más corto")
+    _completar(str(documento), ["uno"])
+    progreso = lote.Progreso(lote._abrir_progreso("concis", str(documento), OPCIONES)[0].ruta)
+    assert sorted(progreso.hechos) == [0]
+
+def test_api_lotes_repite_en_paralelo_y_cuenta_sus_tokens(tmp_path, monkeypatch):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    from servidor_simulado import iniciar_servidor
+    servidor = iniciar_servidor(latencia=0, tokens_por_segundo=0, latencia_lote=0)
+    monkeypatch.setenv("OPENAI_BASE_URL", servidor.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "simulada")
+    # Sin caché, las repeticiones no pueden servirse con la respuesta del lote
+    monkeypatch.setattr(cache_llm, "CACHE_ACTIVA", False)
+
+    # Las dos primeras traducciones del lote no superan las comprobaciones y se repiten por el chat
+    marcadas = []
+    def comprobar(fragmento, contenido, finish_reason):
+        if len(marcadas) < 2:
+            marcadas.append(fragmento)
+            return ["forzada"]
+        return []
+    monkeypatch.setattr(lote, "check_translation", comprobar)
+
+    documento = tmp_path / "reensamblado.txt"
+    documento.write_text("\n\n".join((
+        "El presupuesto anual fija los costes de personal y las inversiones previstas para cada departamento. " * 6,
+        "La campaña de marketing se apoya en redes sociales, boletines y acuerdos con medios locales. " * 6,
+        "Los impuestos se declaran cada trimestre mediante el formulario que publica la agencia tributaria. " * 6,
+        "El equipo de soporte atiende incidencias por teléfono y correo durante el horario laboral. " * 6,
+    )))
+    try:
+        (resumen,) = lote.traducir_con_api_lotes([str(documento)], OPCIONES, intervalo=0.05)
+    finally:
+        servidor.shutdown()
+    assert resumen["estado"] == "completado"
+    assert len(marcadas) == 2 and servidor.estadisticas["solicitudes"] >= 2
+    assert resumen["tokens"] == servidor.estadisticas["tokens_entrada"] + servidor.estadisticas["tokens_salida"]
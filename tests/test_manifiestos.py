@@ -0,0 +1,30 @@
+import os
+import time
+
+import Concis
+import traduccion
+
+def test_manifiesto_ida_y_vuelta(tmp_path, monkeypatch):
+    monkeypatch.setattr(traduccion, "MANIFEST_DIR", str(tmp_path))
+    traduccion.save_chunk_manifest("doc", [("h1", "uno"), ("h2", "dos")])
+    assert traduccion.load_chunk_manifest("doc") == {"h1": "uno", "h2": "dos"}
+    assert traduccion.load_chunk_manifest("otro") == {}
+
+def test_expulsion_de_manifiestos_menos_usados(tmp_path, monkeypatch):
+    monkeypatch.setattr(traduccion, "MANIFEST_DIR", str(tmp_path))
+    monkeypatch.setattr(traduccion, "MAX_MANIFEST_BYTES", 10 ** 9)
+    for nombre in ("a", "b", "c"):
+        traduccion.save_chunk_manifest(nombre, [("h", "x" * 100)])
+        os.utime(tmp_path / f"{nombre}.json", (time.time() - 100, time.time() - 100))
+    traduccion.load_chunk_manifest("a")
+    tamano = os.path.getsize(tmp_path / "a.json")
+    traduccion.evict_manifests(max_bytes=2 * tamano)
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
+
+def test_las_traducciones_fallidas_no_se_guardan(tmp_path, monkeypatch):
+    monkeypatch.setattr(traduccion, "MANIFEST_DIR", str(tmp_path))
+    monkeypatch.setattr(Concis, "translator_for", lambda language: lambda client, chunk, model: (f"<©>{chunk}</©>", "falla" not in chunk))
+    parrafos = ["Primer párrafo que se traduce bien.", "Segundo párrafo que falla la comprobación.", "Tercer párrafo correcto."]
+    Concis.process_text(None, "\n\n".join(parrafos), "gpt-4o-mini", 50, "Español Conciso", doc_id="doc")
+    guardados = traduccion.load_chunk_manifest("doc").values()
+    assert len(guardados) == 2 and not any("falla" in guardado for guardado in guardados)
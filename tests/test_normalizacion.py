@@ -0,0 +1,57 @@
+from normalizacion import normalizar_bloque, normalizar_bloques, numero_pagina
+
+TEMAS = ["alfa", "beta", "gamma", "delta", "épsilon", "zeta", "eta", "theta", "iota", "kappa"]
+
+# Páginas de un PDF con encabezado fijo, pie numerado y, opcionalmente, otra línea de borde por página
+def _paginas(total, pie=lambda numero: f"Informe anual 2024 · {numero}", extra=lambda numero: None):
+    paginas = []
+    for numero in range(1, total + 1):
+        lineas = ["Texteador — Informe técnico"]
+        if extra(numero):
+            lineas.append(extra(numero))
+        lineas += [f"El apartado {TEMAS[numero - 1]} continúa con varias oraciones de contenido.", "Y termina aquí.", pie(numero)]
+        paginas.append("\n".join(lineas))
+    return paginas
+
+def _normalizar_pdf(paginas):
+    return "".join(normalizar_bloques(paginas, "pdf"))
+
+def test_se_quitan_encabezados_y_pies_numerados():
+    texto = _normalizar_pdf(_paginas(10))
+    assert "Informe técnico" not in texto
+    assert "Informe anual" not in texto
+    assert "El apartado kappa" in texto
+
+def test_se_conservan_los_titulos_numerados():
+    capitulos = {2: "Capítulo 1", 5: "Capítulo 2", 9: "Capítulo 3"}
+    articulos = lambda numero: capitulos.get(numero) or f"Artículo {numero * 3}."
+    texto = _normalizar_pdf(_paginas(10, extra=articulos))
+    for titulo in ("Capítulo 1", "Capítulo 2", "Capítulo 3", "Artículo 3.", "Artículo 30."):
+        assert titulo in texto
+
+def test_numeros_sueltos_solo_en_orden_de_paginas():
+    texto = _normalizar_pdf(_paginas(10, pie=lambda numero: str(numero + 4), extra=lambda numero: "2024" if numero == 3 else None))
+    assert "\n5\n" not in texto and not texto.rstrip().endswith("14")
+    assert "2024" in texto
+
+def test_romanos_solo_en_orden_de_paginas():
+    romanos = ["i", "ii", "iii", "iv", "v", "vi"]
+    texto = _normalizar_pdf(_paginas(6, pie=lambda numero: romanos[numero - 1], extra=lambda numero: "mi" if numero == 2 else None))
+    assert not any(linea in romanos for linea in texto.split("\n"))
+    assert "mi" in texto.split("\n")
+
+def test_numero_pagina():
+    assert numero_pagina("Página 3 de 40") == (3, True)
+    assert numero_pagina("- 12 -") == (12, True)
+    assert numero_pagina("2024") == (2024, False)
+    assert numero_pagina("xiv") == (14, False)
+    assert numero_pagina("Capítulo 3") is None
+
+def test_texto_escrito_y_docx_conservan_las_lineas():
+    lista = "Tareas pendientes\nrevisar el contrato\nenviar la factura"
+    assert normalizar_bloque(lista) == lista
+    assert normalizar_bloque(lista, "docx") == lista
+    assert normalizar_bloque(lista, "pdf") == "Tareas pendientes revisar el contrato enviar la factura"
+
+def test_pdf_une_palabras_cortadas():
+    assert normalizar_bloque("una pala-\nbra partida", "pdf") == "una palabra partida"
@@ -0,0 +1,23 @@
+import Refac
+from arbol import Arbol
+
+def test_los_titulos_repartidos_entre_grupos_se_fusionan(monkeypatch):
+    # Cada grupo devuelve sus ramas bajo el mismo título de primer nivel
+    def refactorizar_grupo(cliente, grupo, finalidad, especificaciones, numero, total):
+        rama = Arbol.desde_texto("- Resumen\n" + "\n".join(f"  - {grupo.textos[raiz]}" for raiz in grupo.raices()))
+        return [rama], None
+
+    def ordenar(cliente, ramas, finalidad, especificaciones):
+        arbol = Arbol()
+        for rama in ramas:
+            arbol.injertar(rama)
+        return arbol
+
+    monkeypatch.setattr(Refac, "refactor_group", refactorizar_grupo)
+    monkeypatch.setattr(Refac, "order_branches", ordenar)
+    temas = ["Finanzas", "Marketing", "Logística", "Personal"]
+    entrada = "\n".join(f"- {tema}\n" + "\n".join(f"  - {tema} detalle {i} con varias palabras" for i in range(20)) for tema in temas)
+    resultado = Refac.refactor_by_groups(None, entrada, "finalidad", "", tokens_por_grupo=200, max_concurrencia=2)
+    assert resultado.count("- Resumen") == 1
+    for tema in temas:
+        assert f"  - {tema}" in resultado
@@ -0,0 +1,15 @@
+from salidas import SalidaEnDisco, VolcadoSalida
+
+def test_paginas_por_caracteres(tmp_path):
+    ruta = str(tmp_path / "salida.txt")
+    volcado = VolcadoSalida(ruta, separador="\n\n")
+    # Fragmentos de 10 caracteres con tildes, de más bytes que caracteres; llegan desordenados
+    for indice in (1, 0, 3, 2):
+        volcado.escribir(indice, f"canción {indice}ñ")
+    volcado.cerrar()
+
+    salida = SalidaEnDisco(ruta)
+    assert list(salida.iterar_fragmentos()) == [f"canción {indice}ñ" for indice in range(4)]
+    assert salida.paginas(caracteres=20) == [(0, 2), (2, 4)]
+    assert salida.leer(2, 4) == "canción 2ñ\n\ncanción 3ñ\n\n"
+    assert salida.leer_bytes().decode("utf-8").count("canción") == 4
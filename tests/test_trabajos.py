@@ -0,0 +1,58 @@
+import os
+import time
+
+import trabajos
+from trabajos import AlmacenTrabajos
+
+# Simular un trabajo activo de otro proceso con su último latido hace `antiguedad` segundos
+def _trabajo_ajeno(almacen, antiguedad):
+    id_trabajo = almacen.crear("concis", "clave")
+    with almacen._conexion() as conexion:
+        conexion.execute(
+            "UPDATE trabajos SET estado = 'en_curso', proceso = 'otro', latido = ? WHERE id = ?",
+            (time.time() - antiguedad, id_trabajo)
+        )
+    os.makedirs(almacen.directorio_salidas, exist_ok=True)
+    with open(f"{almacen.ruta_salida(id_trabajo)}.parcial", "w") as archivo:
+        archivo.write("en curso")
+    return id_trabajo
+
+def test_solo_se_reclaman_los_latidos_caducados(tmp_path):
+    ruta = str(tmp_path / "trabajos.sqlite3")
+    almacen = AlmacenTrabajos(ruta)
+    vivo = _trabajo_ajeno(almacen, 1)
+    caducado = _trabajo_ajeno(almacen, trabajos.CADUCIDAD_LATIDO + 1)
+
+    almacen = AlmacenTrabajos(ruta)
+    assert almacen.obtener(vivo)["estado"] == "en_curso"
+    assert os.path.exists(f"{almacen.ruta_salida(vivo)}.parcial")
+    assert almacen.obtener(caducado)["estado"] == "interrumpido"
+    assert not os.path.exists(f"{almacen.ruta_salida(caducado)}.parcial")
+
+def test_un_trabajo_caducado_no_se_reutiliza(tmp_path):
+    almacen = AlmacenTrabajos(str(tmp_path / "trabajos.sqlite3"))
+    caducado = _trabajo_ajeno(almacen, trabajos.CADUCIDAD_LATIDO + 1)
+    assert almacen.buscar("concis", "clave", trabajos.ACTIVOS) is None
+    assert almacen.obtener(caducado)["estado"] == "interrumpido"
+
+def test_un_trabajo_sin_salida_se_repite(tmp_path):
+    ejecutor = trabajos.EjecutorTrabajos(AlmacenTrabajos(str(tmp_path / "trabajos.sqlite3")))
+
+    def escribir_salida(informe):
+        os.makedirs(os.path.dirname(informe.ruta_salida()), exist_ok=True)
+        with open(informe.ruta_salida(), "w") as archivo:
+            archivo.write("traducción")
+        return informe.ruta_salida()
+
+    def esperar(id_trabajo):
+        while ejecutor.almacen.obtener(id_trabajo)["estado"] in trabajos.ACTIVOS:
+            time.sleep(0.01)
+        assert ejecutor.almacen.obtener(id_trabajo)["estado"] == "completado"
+
+    primero = ejecutor.enviar("concis", "clave", escribir_salida, reutilizar_completado=True)
+    esperar(primero)
+    assert ejecutor.enviar("concis", "clave", escribir_salida, reutilizar_completado=True) == primero
+    os.remove(ejecutor.almacen.ruta_salida(primero))
+    segundo = ejecutor.enviar("concis", "clave", escribir_salida, reutilizar_completado=True)
+    assert segundo != primero
+    esperar(segundo)
@@ -0,0 +1,353 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from cache_llm import DIRECTORIO_CACHE
+from instrumentacion import ejecucion, ejecuciones_recientes
+from salidas import limpiar_salidas
+
+# Configuración de los trabajos en segundo plano (modificable mediante variables de entorno)
+MAX_TRABAJOS = int(os.getenv("TEXTEADOR_TRABAJOS_MAX", "4"))
+INTERVALO_SONDEO = float(os.getenv("TEXTEADOR_TRABAJOS_SONDEO_S", "1"))
+RETENCION = float(os.getenv("TEXTEADOR_TRABAJOS_RETENCION_DIAS", "7")) * 24 * 3600
+
+# Cada proceso renueva periódicamente el latido de los trabajos que ejecuta; un trabajo activo cuyo latido caducó
+# pertenece a un proceso que terminó y se marca como interrumpido
+INTERVALO_LATIDO = float(os.getenv("TEXTEADOR_TRABAJOS_LATIDO_S", "10"))
+CADUCIDAD_LATIDO = 6 * INTERVALO_LATIDO
+
+# Intervalo mínimo entre dos escrituras del resultado parcial de un trabajo en flujo, en segundos
+INTERVALO_PARCIAL = 0.5
+
+# Estados de un trabajo: en_cola -> en_curso -> completado | error | cancelado. Los trabajos que seguían activos
+# cuando terminó el proceso que los ejecutaba quedan como "interrumpido".
+ACTIVOS = ("en_cola", "en_curso")
+
+# Identificador de este proceso, para reconocer los trabajos que ejecutaba un proceso anterior
+PROCESO = uuid.uuid4().hex
+
+class TrabajoCancelado(Exception):
+    pass
+
+# Función para calcular la clave de un trabajo a partir de sus parámetros y entradas: dos envíos con la misma
+# clave corresponden al mismo trabajo
+def clave_trabajo(*partes):
+    contenido = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+# Almacén persistente de los trabajos en SQLite (modo WAL): estado, progreso, mensajes, resultado parcial y final.
+# Los resultados largos se guardan como archivos en el directorio de salidas, junto a la base de datos (ver salidas.py).
+# Cada hilo abre su propia conexión. Al crearse, marca como interrumpidos los trabajos activos cuyo latido caducó
+# (los de procesos que ya terminaron) y elimina los que llevan más de `retencion` segundos sin actualizarse, con sus
+# salidas. Los trabajos que otro proceso sigue ejecutando conservan su estado y su salida a medio escribir.
+class AlmacenTrabajos:
+    def __init__(self, ruta=None, retencion=RETENCION):
+        self.ruta = ruta or os.path.join(DIRECTORIO_CACHE, "trabajos.sqlite3")
+        self.directorio_salidas = os.path.join(os.path.dirname(self.ruta) or ".", "salidas")
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS trabajos ("
+                "id TEXT PRIMARY KEY, herramienta TEXT NOT NULL, clave TEXT NOT NULL, estado TEXT NOT NULL, "
+                "progreso REAL NOT NULL DEFAULT 0, mensaje TEXT, mensajes TEXT NOT NULL DEFAULT '[]', parcial TEXT, "
+                "resultado TEXT, error TEXT, proceso TEXT NOT NULL, creado REAL NOT NULL, actualizado REAL NOT NULL, latido REAL)"
+            )
+            # Las bases de datos anteriores al latido no tienen la columna
+            if "latido" not in {fila[1] for fila in conexion.execute("PRAGMA table_info(trabajos)")}:
+                conexion.execute("ALTER TABLE trabajos ADD COLUMN latido REAL")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_clave ON trabajos (herramienta, clave)")
+        self.reclamar_caducados()
+        with self._conexion() as conexion:
+            if retencion:
+                conexion.execute("DELETE FROM trabajos WHERE actualizado < ?", (time.time() - retencion,))
+            vigentes = {fila[0] for fila in conexion.execute("SELECT id FROM trabajos")}
+            activos = {fila[0] for fila in conexion.execute("SELECT id FROM trabajos WHERE estado IN (?, ?)", ACTIVOS)}
+        limpiar_salidas(self.directorio_salidas, vigentes, activos)
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    # Marcar como interrumpidos los trabajos activos de otros procesos cuyo latido caducó
+    def reclamar_caducados(self):
+        ahora = time.time()
+        with self._conexion() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'interrumpido', actualizado = ? "
+                "WHERE estado IN (?, ?) AND proceso != ? AND COALESCE(latido, actualizado) < ?",
+                (ahora, *ACTIVOS, PROCESO, ahora - CADUCIDAD_LATIDO)
+            )
+
+    # Renovar el latido de los trabajos que ejecuta este proceso
+    def latir(self, ids_trabajos):
+        if not ids_trabajos:
+            return
+        marcadores = ", ".join("?" for _ in ids_trabajos)
+        with self._conexion() as conexion:
+            conexion.execute(f"UPDATE trabajos SET latido = ? WHERE id IN ({marcadores})", (time.time(), *ids_trabajos))
+
+    # Ruta del archivo de salida en disco de un trabajo
+    def ruta_salida(self, id_trabajo):
+        return os.path.join(self.directorio_salidas, f"{id_trabajo}.txt")
+
+    def crear(self, herramienta, clave):
+        id_trabajo = uuid.uuid4().hex
+        ahora = time.time()
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT INTO trabajos (id, herramienta, clave, estado, proceso, creado, actualizado, latido) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (id_trabajo, herramienta, clave, "en_cola", PROCESO, ahora, ahora, ahora)
+            )
+        return id_trabajo
+
+    # Obtener un trabajo como diccionario, o None si no existe. Un trabajo activo de otro proceso cuyo latido
+    # caducó se devuelve ya marcado como interrumpido.
+    def obtener(self, id_trabajo):
+        fila = self._conexion().execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+        if fila is None:
+            return None
+        latido = fila["latido"] or fila["actualizado"]
+        if fila["estado"] in ACTIVOS and fila["proceso"] != PROCESO and latido < time.time() - CADUCIDAD_LATIDO:
+            self.reclamar_caducados()
+            fila = self._conexion().execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+        trabajo = dict(fila)
+        trabajo["mensajes"] = json.loads(trabajo["mensajes"])
+        return trabajo
+
+    # Buscar el trabajo más reciente de una herramienta con la clave y alguno de los estados indicados. Los trabajos
+    # de procesos que terminaron no cuentan como activos.
+    def buscar(self, herramienta, clave, estados):
+        self.reclamar_caducados()
+        marcadores = ", ".join("?" for _ in estados)
+        fila = self._conexion().execute(
+            f"SELECT id FROM trabajos WHERE herramienta = ? AND clave = ? AND estado IN ({marcadores}) "
+            "ORDER BY creado DESC LIMIT 1",
+            (herramienta, clave, *estados)
+        ).fetchone()
+        return fila[0] if fila else None
+
+    # Un trabajo completado cuya salida en disco ya no existe no puede reutilizarse: hay que repetirlo
+    def salida_perdida(self, id_trabajo):
+        trabajo = self.obtener(id_trabajo)
+        return (
+            trabajo["estado"] == "completado" and trabajo["resultado"] == self.ruta_salida(id_trabajo)
+            and not os.path.exists(trabajo["resultado"])
+        )
+
+    def actualizar(self, id_trabajo, **campos):
+        asignaciones = ", ".join(f"{campo} = ?" for campo in campos)
+        with self._conexion() as conexion:
+            conexion.execute(
+                f"UPDATE trabajos SET {asignaciones}, actualizado = ? WHERE id = ?",
+                (*campos.values(), time.time(), id_trabajo)
+            )
+
+# Canal por el que un trabajo informa de su avance: progreso, mensajes para el usuario (notas y avisos) y resultado
+# parcial (p. ej. el texto de una respuesta en flujo). Sin almacén no guarda nada, de modo que las mismas funciones
+# sirven fuera de un trabajo. Si el trabajo se cancela, la siguiente notificación lanza TrabajoCancelado.
+class Informe:
+    def __init__(self, almacen=None, id_trabajo=None, cancelado=None):
+        self.almacen = almacen
+        self.id_trabajo = id_trabajo
+        self.mensajes = []
+        self._cancelado = cancelado
+        self._ultimo_parcial = 0.0
+        self._bloqueo = threading.Lock()
+
+    def _guardar(self, **campos):
+        if self._cancelado is not None and self._cancelado.is_set():
+            raise TrabajoCancelado()
+        if self.almacen is not None:
+            self.almacen.actualizar(self.id_trabajo, **campos)
+
+    def progreso(self, fraccion, mensaje=None):
+        self._guardar(progreso=max(0.0, min(1.0, fraccion)), mensaje=mensaje)
+
+    def _mensaje(self, nivel, texto):
+        with self._bloqueo:
+            self.mensajes.append([nivel, texto])
+            mensajes = json.dumps(self.mensajes, ensure_ascii=False)
+        self._guardar(mensajes=mensajes)
+
+    # Ruta donde el trabajo puede volcar una salida larga (None fuera de un trabajo)
+    def ruta_salida(self):
+        return self.almacen.ruta_salida(self.id_trabajo) if self.almacen is not None else None
+
+    def nota(self, texto):
+        self._mensaje("nota", texto)
+
+    def aviso(self, texto):
+        self._mensaje("aviso", texto)
+
+    # Guardar el resultado parcial (texto o lista de partes), como máximo una vez cada INTERVALO_PARCIAL segundos
+    # salvo que sea el último; las partes solo se unen cuando se guardan
+    def parcial(self, partes, final=False):
+        ahora = time.monotonic()
+        if final or ahora - self._ultimo_parcial >= INTERVALO_PARCIAL:
+            self._ultimo_parcial = ahora
+            self._guardar(parcial=partes if isinstance(partes, str) else "".join(partes))
+
+# Función para consumir una respuesta en flujo dentro de un trabajo, publicando el texto acumulado como parcial
+def consumir_flujo(flujo, informe):
+    partes = []
+    for parte in flujo:
+        partes.append(parte)
+        informe.parcial(partes)
+    texto = "".join(partes)
+    informe.parcial(texto, final=True)
+    return texto
+
+# Ejecutor de trabajos en segundo plano, compartido por todas las sesiones del proceso. Los trabajos se ejecutan
+# en un grupo de hilos fuera del hilo del script de Streamlit, por lo que sobreviven a las nuevas ejecuciones,
+# reconexiones y recargas de la página; su estado y resultado quedan en el almacén.
+# `funcion(informe, *argumentos)` debe devolver el resultado como texto. Un hilo aparte renueva cada
+# INTERVALO_LATIDO segundos el latido de los trabajos en cola o en curso del proceso.
+class EjecutorTrabajos:
+    def __init__(self, almacen=None, max_trabajos=MAX_TRABAJOS, intervalo_latido=INTERVALO_LATIDO):
+        self.almacen = almacen or AlmacenTrabajos()
+        self._grupo = ThreadPoolExecutor(max_workers=max_trabajos, thread_name_prefix="trabajo")
+        self._cancelaciones = {}
+        self._bloqueo = threading.Lock()
+        self._intervalo_latido = intervalo_latido
+        threading.Thread(target=self._latir, name="latido-trabajos", daemon=True).start()
+
+    def _latir(self):
+        while True:
+            time.sleep(self._intervalo_latido)
+            with self._bloqueo:
+                ids_trabajos = list(self._cancelaciones)
+            try:
+                self.almacen.latir(ids_trabajos)
+            except sqlite3.Error:
+                pass  # se reintenta en el siguiente latido
+
+    # Enviar un trabajo y devolver su identificador. Si ya hay uno activo con la misma clave, se devuelve ese en
+    # lugar de repetir el trabajo; con `reutilizar_completado`, también uno que ya terminó con éxito y conserva su
+    # salida.
+    def enviar(self, herramienta, clave, funcion, *argumentos, reutilizar_completado=False):
+        estados = ACTIVOS + (("completado",) if reutilizar_completado else ())
+        with self._bloqueo:
+            existente = self.almacen.buscar(herramienta, clave, estados)
+            if existente and not self.almacen.salida_perdida(existente):
+                return existente
+            id_trabajo = self.almacen.crear(herramienta, clave)
+            cancelado = self._cancelaciones[id_trabajo] = threading.Event()
+        self._grupo.submit(self._ejecutar, id_trabajo, herramienta, cancelado, funcion, argumentos)
+        return id_trabajo
+
+    def _ejecutar(self, id_trabajo, herramienta, cancelado, funcion, argumentos):
+        informe = Informe(self.almacen, id_trabajo, cancelado)
+        try:
+            if cancelado.is_set():
+                raise TrabajoCancelado()
+            self.almacen.actualizar(id_trabajo, estado="en_curso")
+            with ejecucion(herramienta, trabajo=id_trabajo):
+                resultado = funcion(informe, *argumentos)
+        except TrabajoCancelado:
+            self.almacen.actualizar(id_trabajo, estado="cancelado")
+        except Exception as error:
+            self.almacen.actualizar(id_trabajo, estado="error", error=str(error) or type(error).__name__)
+        else:
+            self.almacen.actualizar(id_trabajo, estado="completado", progreso=1.0, resultado=resultado, parcial=None)
+        finally:
+            with self._bloqueo:
+                self._cancelaciones.pop(id_trabajo, None)
+
+    # Pedir la cancelación de un trabajo: se detiene en su siguiente notificación de avance
+    def cancelar(self, id_trabajo):
+        with self._bloqueo:
+            cancelado = self._cancelaciones.get(id_trabajo)
+        if cancelado is not None:
+            cancelado.set()
+
+_ejecutor = None
+_bloqueo_ejecutor = threading.Lock()
+
+# Obtener el ejecutor de trabajos compartido del proceso
+def obtener_ejecutor():
+    global _ejecutor
+    with _bloqueo_ejecutor:
+        if _ejecutor is None:
+            _ejecutor = EjecutorTrabajos()
+        return _ejecutor
+
+def obtener_trabajo(id_trabajo):
+    return obtener_ejecutor().almacen.obtener(id_trabajo)
+
+# Función para enviar el trabajo de una herramienta y asociarlo a la sesión mediante un parámetro de la URL,
+# de modo que una recarga de la página vuelve a mostrar el mismo trabajo. El trabajo al que sustituye en la sesión
+# se cancela si sigue activo.
+def enviar_trabajo(herramienta, clave, funcion, *argumentos, reutilizar_completado=False):
+    anterior = trabajo_de_sesion(herramienta)
+    id_trabajo = obtener_ejecutor().enviar(herramienta, clave, funcion, *argumentos, reutilizar_completado=reutilizar_completado)
+    if anterior and anterior != id_trabajo:
+        obtener_ejecutor().cancelar(anterior)
+    st.query_params[f"trabajo_{herramienta}"] = id_trabajo
+    return id_trabajo
+
+# Identificador del trabajo de una herramienta asociado a la sesión (None si no hay)
+def trabajo_de_sesion(herramienta):
+    return st.query_params.get(f"trabajo_{herramienta}")
+
+# Traza de la ejecución de un trabajo que ya terminó en este proceso (None si no hay o si sigue en curso)
+def traza_de_trabajo(id_trabajo):
+    if not id_trabajo:
+        return None
+    for traza in reversed(ejecuciones_recientes()):
+        if traza.atributos.get("trabajo") == id_trabajo:
+            return traza
+    return None
+
+# Función para mostrar el estado de un trabajo. Mientras está activo, un fragmento consulta su avance cada
+# INTERVALO_SONDEO segundos sin volver a ejecutar la página, y la vuelve a ejecutar cuando termina.
+# Devuelve el trabajo cuando terminó con éxito y None mientras sigue activo o si falló.
+def mostrar_trabajo(id_trabajo):
+    trabajo = obtener_trabajo(id_trabajo) if id_trabajo else None
+    if trabajo is None:
+        return None
+    if trabajo["estado"] in ACTIVOS:
+        _seguir_trabajo(id_trabajo)
+        return None
+    _mostrar_mensajes(trabajo)
+    if trabajo["estado"] == "error":
+        st.error(f"El trabajo terminó con un error: {trabajo['error']}")
+    elif trabajo["estado"] == "cancelado":
+        st.info("El trabajo se canceló.")
+    elif trabajo["estado"] == "interrumpido":
+        st.warning("El trabajo se interrumpió al terminar el proceso del servidor que lo ejecutaba; vuelve a enviarlo para repetirlo.")
+    return trabajo if trabajo["estado"] == "completado" else None
+
+def _mostrar_mensajes(trabajo):
+    for nivel, texto in trabajo["mensajes"]:
+        if nivel == "aviso":
+            st.warning(texto)
+        else:
+            st.write(texto)
+
+@st.fragment(run_every=INTERVALO_SONDEO)
+def _seguir_trabajo(id_trabajo):
+    trabajo = obtener_trabajo(id_trabajo)
+    if trabajo is None or trabajo["estado"] not in ACTIVOS:
+        st.rerun()
+    texto = trabajo["mensaje"] or ("En cola..." if trabajo["estado"] == "en_cola" else "Procesando...")
+    st.progress(trabajo["progreso"], text=texto)
+    _mostrar_mensajes(trabajo)
+    if st.button("Cancelar", key=f"cancelar_{id_trabajo}"):
+        obtener_ejecutor().cancelar(id_trabajo)
+    if trabajo["parcial"]:
+        st.markdown(trabajo["parcial"])
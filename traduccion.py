@@ -0,0 +1,328 @@
+# Lógica de traducción concisa, sin dependencias de Streamlit: la usan la página Concis y el procesamiento por lotes
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from llm import completar_chat, respuesta_en_cache
+from instrumentacion import tramo
+from duplicados import obtener_indice_duplicados, diferencias_oraciones, dividir_oraciones, parchear_numeros
+from cache_llm import DIRECTORIO_CACHE
+from fragmentacion import (
+    contar_tokens, calcular_presupuesto_entrada, generar_fragmentos, generar_fragmentos_por_contenido, CARACTERES_POR_TOKEN
+)
+
+# Tokens máximos de salida por fragmento traducido
+MAX_OUTPUT_TOKENS = 4095
+
+# Tokens de salida esperados por token de entrada (la traducción concisa no debería ser más larga que el original)
+OUTPUT_INPUT_RATIO = 1.0
+
+# Cascada de modelos: cada fragmento se traduce primero con el modelo rápido y solo los fragmentos cuya traducción
+# no supera las comprobaciones de calidad se repiten con el modelo grande
+CASCADE = "cascada"
+CASCADE_MODELS = ("gpt-4o-mini", "gpt-4o-2024-08-06")
+
+# Comprobaciones de calidad de cada traducción: proporción de caracteres traducción/original admitida (solo para
+# fragmentos de al menos MIN_CHECK_CHARS caracteres) y fracción mínima de los elementos de lista que deben conservarse
+MIN_LENGTH_RATIO = 0.15
+MAX_LENGTH_RATIO = 1.5
+MIN_CHECK_CHARS = 400
+MIN_LIST_RATIO = 0.7
+
+# Solicitudes de continuación de una traducción truncada antes de dividir el fragmento
+MAX_CONTINUATIONS = 2
+
+# Elementos de lista: viñetas o numeración al inicio de la línea
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*+•]|\d{1,3}[.)])\s+\S", re.MULTILINE)
+
+# Función para obtener los modelos que se prueban en orden para un modelo elegido (la cascada o uno solo)
+def models_for(model):
+    return CASCADE_MODELS if model == CASCADE else (model,)
+
+# Función para calcular el tamaño máximo de fragmento en tokens.
+# `max_chars` es el tamaño orientativo elegido por el usuario; el fragmento nunca supera lo que cabe
+# en la salida del modelo, de modo que la traducción no se trunque.
+def chunk_token_budget(max_chars=5000, model="gpt-4o-mini"):
+    model = models_for(model)[0]
+    prompt_tokens = contar_tokens(CONCISE_PROMPT.format(language="Spanish", chunk=""), model)
+    budget = calcular_presupuesto_entrada(model, MAX_OUTPUT_TOKENS, OUTPUT_INPUT_RATIO, prompt_tokens)
+    return min(budget, max(1, max_chars // CARACTERES_POR_TOKEN))
+
+# Función para dividir un flujo de bloques de texto (páginas, párrafos) en fragmentos a medida que llegan.
+# Sin solapamiento, los cortes se definen por el contenido, de modo que al editar un documento solo cambian
+# los fragmentos cercanos a la edición.
+def iter_text_chunks(blocks, max_chars=5000, model="gpt-4o-mini", overlap=0):
+    budget = chunk_token_budget(max_chars, model)
+    if overlap:
+        return generar_fragmentos(blocks, budget, model=model, solapamiento=overlap)
+    return generar_fragmentos_por_contenido(blocks, budget, model=model)
+
+# Función para dividir el texto en fragmentos manejables según un presupuesto de tokens
+def split_text_into_chunks(text, max_chars=5000, model="gpt-4o-mini", overlap=0):
+    return list(iter_text_chunks([text], max_chars, model, overlap))
+
+# Prompt de traducción concisa, común a ambos idiomas
+CONCISE_PROMPT = (
+    "You are an assistant specialized in translating text into concise {language}. "
+    "Translate the following text into {language}, preserving the informational integrity with the minimum possible characters. "
+    "Do not omit key details, especially in lists. Reduce words without summarizing. Use abbreviations when possible, without losing clarity. "
+    "Do not use bold or other emphasis formats. Omit metadata, links, and references. "
+    "The text to be translated is: {chunk}"
+)
+
+# Función para construir la solicitud de chat que traduce un fragmento al idioma indicado (modelo, mensajes y
+# parámetros). La usan tanto la llamada directa como el modo diferido de la Batch API (ver api_lotes.py).
+def build_concise_request(chunk, model, language):
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": CONCISE_PROMPT.format(language=language, chunk=chunk)}
+        ],
+        temperature=0,
+        max_tokens=MAX_OUTPUT_TOKENS,
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0
+    )
+
+# Función para dar formato de fragmento traducido a la respuesta del modelo
+def format_concise(content):
+    return f"<©>{content.strip()}</©>"
+
+# Prompt para pedir que continúe una traducción que se cortó al alcanzar el máximo de tokens de salida
+CONTINUE_PROMPT = (
+    "Your translation was cut off. Continue it exactly where it stopped, without repeating anything already written "
+    "and without any preamble."
+)
+
+# Función para comprobar la traducción de un fragmento. Devuelve la lista de problemas encontrados (vacía si es
+# correcta): "truncada" si el modelo se detuvo por el máximo de tokens, "longitud" si la traducción es
+# desproporcionadamente corta o larga respecto del original y "listas" si se perdieron elementos de lista.
+def check_translation(chunk, content, finish_reason):
+    problems = []
+    if finish_reason == "length":
+        problems.append("truncada")
+    if len(chunk) >= MIN_CHECK_CHARS and not MIN_LENGTH_RATIO <= len(content) / len(chunk) <= MAX_LENGTH_RATIO:
+        problems.append("longitud")
+    items = len(LIST_ITEM_PATTERN.findall(chunk))
+    if items >= 3 and len(LIST_ITEM_PATTERN.findall(content)) < items * MIN_LIST_RATIO:
+        problems.append("listas")
+    return problems
+
+# Función para traducir un fragmento con un modelo, pidiendo hasta MAX_CONTINUATIONS continuaciones si la respuesta
+# se trunca. Devuelve (traducción, finish_reason de la última respuesta).
+def _translate_with_continuation(_client, chunk, model, language):
+    request = build_concise_request(chunk, model, language)
+    response = completar_chat(_client, **request)
+    parts = [response["contenido"]]
+    for _ in range(MAX_CONTINUATIONS):
+        if response["finish_reason"] != "length":
+            break
+        messages = request["messages"] + [
+            {"role": "assistant", "content": "".join(parts)}, {"role": "user", "content": CONTINUE_PROMPT}
+        ]
+        response = completar_chat(_client, **dict(request, messages=messages))
+        parts.append(response["contenido"])
+    return "".join(parts), response["finish_reason"]
+
+# Función para traducir un fragmento aplicando la política de ejecución: cada modelo de `models`, en orden, traduce
+# el fragmento (con continuaciones si se trunca) y la traducción se comprueba. Si sigue truncada, el fragmento se
+# divide en partes que se traducen por separado (una sola vez); si falla otra comprobación, se escala al modelo
+# siguiente. Si ningún modelo supera las comprobaciones, se devuelve la traducción del último.
+# Devuelve (traducción, si superó las comprobaciones).
+def _translate_with_policy(_client, chunk, models, language, split=True):
+    for position, model in enumerate(models):
+        with tramo("verificacion", modelo=model, escalado=position > 0) as attributes:
+            content, finish_reason = _translate_with_continuation(_client, chunk, model, language)
+            problems = check_translation(chunk, content, finish_reason)
+            attributes["problemas"] = problems
+        if not problems:
+            return content, True
+        if "truncada" in problems and split:
+            parts = split_text_into_chunks(chunk, max_chars=len(chunk) // 2, model=model)
+            if len(parts) > 1:
+                translated = [_translate_with_policy(_client, part, models[position:], language, split=False) for part in parts]
+                return "\n\n".join(content.strip() for content, _ in translated), all(passed for _, passed in translated)
+    return content, False
+
+# Prompt para actualizar la traducción previa de un fragmento casi idéntico, traduciendo solo las oraciones que cambiaron
+PATCH_PROMPT = (
+    "You are updating an existing concise {language} translation after its source text was edited. "
+    "Apply the source edits listed below to the translation: translate added or replaced sentences into concise "
+    "{language} with the same rules (keep key details, especially in lists; reduce words without summarizing; no bold "
+    "or other emphasis; omit metadata, links, and references), drop the content of deleted sentences, and leave "
+    "everything else unchanged. Return only the full updated translation.\n\n"
+    "Previous translation:\n{translation}\n\nSource edits:\n{edits}"
+)
+
+# Fracción máxima de oraciones cambiadas para actualizar una traducción previa en lugar de traducir de nuevo
+MAX_PATCH_FRACTION = 0.3
+
+# Función para calcular el contexto de un fragmento en el índice de duplicados: solo se reutilizan traducciones
+# hechas con el mismo modelo, idioma y prompt
+def reuse_context(model, language):
+    return chunk_hash(json.dumps([model, language, CONCISE_PROMPT], ensure_ascii=False))[:16]
+
+def _describe_edits(changes):
+    lines = []
+    for operation, old, new, previous in changes:
+        if operation == "replace":
+            lines.append(f"- Replaced: «{' '.join(old)}» → «{' '.join(new)}»")
+        elif operation == "delete":
+            lines.append(f"- Deleted: «{' '.join(old)}»")
+        else:
+            lines.append(f"- Added after «{previous}»: «{' '.join(new)}»" if previous else f"- Added at the start: «{' '.join(new)}»")
+    return "\n".join(lines)
+
+# Función para reutilizar la traducción de un fragmento casi idéntico a otro ya traducido (ver duplicados.py).
+# Si solo cambian espacios o números, la traducción previa se corrige localmente sin llamar a la API
+# ("reutilizada"); si cambian pocas oraciones y `allow_patch`, se pide al modelo rápido que actualice la traducción
+# previa traduciendo solo esas oraciones ("parcheada"). En ambos casos la traducción debe superar las comprobaciones.
+# Devuelve (traducción, resultado, similitud) o None si hay que traducir el fragmento completo.
+def reuse_translation(_client, chunk, model, language, allow_patch=True):
+    index = obtener_indice_duplicados()
+    found = index.buscar(chunk, reuse_context(model, language)) if index else None
+    if found is None:
+        return None
+    similarity, previous, translation = found
+    changes, fraction = diferencias_oraciones(previous, chunk)
+    if not changes:
+        patched = parchear_numeros(previous, chunk, translation)
+        if patched is not None and not check_translation(chunk, patched, None):
+            return patched, "reutilizada", similarity
+        # Los números cambiaron de forma ambigua (o la corrección no supera las comprobaciones): se actualizan las
+        # oraciones que los contienen
+        changes = [
+            ("replace", [old], [new], None) for old, new in zip(dividir_oraciones(previous), dividir_oraciones(chunk)) if old != new
+        ]
+    if not changes or not allow_patch or fraction > MAX_PATCH_FRACTION:
+        return None
+    response = completar_chat(
+        _client,
+        model=models_for(model)[0],
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": PATCH_PROMPT.format(language=language, translation=translation, edits=_describe_edits(changes))}
+        ],
+        temperature=0,
+        max_tokens=MAX_OUTPUT_TOKENS
+    )
+    if check_translation(chunk, response["contenido"], response["finish_reason"]):
+        return None
+    return response["contenido"], "parcheada", similarity
+
+# Función para registrar la traducción de un fragmento en el índice de duplicados, para reutilizarla más adelante.
+# Solo deben registrarse traducciones que superaron las comprobaciones.
+def remember_translation(chunk, content, model, language):
+    index = obtener_indice_duplicados()
+    if index:
+        index.agregar(chunk, content, reuse_context(model, language))
+
+# Función para traducir un fragmento de texto al idioma indicado usando la API de OpenAI (con caché persistente).
+# Si el fragmento es casi idéntico a otro ya traducido, se reutiliza o se actualiza su traducción; antes se consulta
+# la caché de respuestas, para que repetir un texto idéntico no llame a la API.
+# Con el modelo "cascada", solo los fragmentos que no superan las comprobaciones se escalan al modelo grande.
+# Devuelve (traducción con formato, si superó las comprobaciones).
+def translate_chunk_to_concise(_client, chunk, model, language):
+    with tramo("duplicados", modelo=model) as attributes:
+        cached = respuesta_en_cache(**build_concise_request(chunk, models_for(model)[0], language))
+        reused = None if cached else reuse_translation(_client, chunk, model, language)
+        attributes.update(
+            resultado="en_cache" if cached else (reused[1] if reused else "nueva"), similitud=reused[2] if reused else None,
+            llamadas_evitadas=1 if reused and reused[1] == "reutilizada" else 0,
+        )
+    if reused:
+        content, passed = reused[0], True
+    else:
+        content, passed = _translate_with_policy(_client, chunk, models_for(model), language)
+    if passed:
+        remember_translation(chunk, content, model, language)
+    return format_concise(content), passed
+
+# Función para traducir un fragmento de texto a español conciso
+def translate_chunk_to_concise_spanish(_client, chunk, model):
+    return translate_chunk_to_concise(_client, chunk, model, "Spanish")
+
+# Función para traducir un fragmento de texto a inglés conciso
+def translate_chunk_to_concise_english(_client, chunk, model):
+    return translate_chunk_to_concise(_client, chunk, model, "English")
+
+# Función para obtener la función de traducción según la opción de idioma de la interfaz
+def translator_for(language):
+    if language == "Español Conciso":
+        return translate_chunk_to_concise_spanish
+    return translate_chunk_to_concise_english
+
+# Función para obtener el idioma del prompt según la opción de idioma de la interfaz
+def prompt_language(language):
+    return "Spanish" if language == "Español Conciso" else "English"
+
+# Directorio de los manifiestos de fragmentos traducidos por documento y tamaño máximo que ocupan: al superarlo se
+# eliminan los usados menos recientemente (cada carga actualiza la fecha de modificación del manifiesto)
+MANIFEST_DIR = os.path.join(DIRECTORIO_CACHE, "manifiestos")
+MAX_MANIFEST_BYTES = int(float(os.getenv("TEXTEADOR_MANIFIESTOS_MAX_MB", "256")) * 1024 * 1024)
+
+# Función para calcular el hash de un fragmento, que lo identifica en el manifiesto
+def chunk_hash(chunk):
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+# Función para calcular el identificador de un documento en los manifiestos. No depende del contenido: así una
+# versión editada del documento encuentra el manifiesto de la anterior.
+def document_id(name, model, chunk_size, language):
+    return chunk_hash(json.dumps([name, model, chunk_size, language], ensure_ascii=False))
+
+def _manifest_path(doc_id):
+    return os.path.join(MANIFEST_DIR, f"{doc_id}.json")
+
+# Función para cargar el manifiesto de un documento: diccionario hash del fragmento -> traducción
+def load_chunk_manifest(doc_id):
+    try:
+        with open(_manifest_path(doc_id), encoding="utf-8") as file:
+            manifest = dict(json.load(file)["fragmentos"])
+        os.utime(_manifest_path(doc_id))
+        return manifest
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+# Función para eliminar los manifiestos usados menos recientemente hasta que el directorio no supere `max_bytes`
+def evict_manifests(max_bytes=MAX_MANIFEST_BYTES):
+    manifests = []
+    for entry in os.scandir(MANIFEST_DIR) if os.path.isdir(MANIFEST_DIR) else []:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        manifests.append((stat.st_mtime, stat.st_size, entry.path))
+    excess = sum(size for _, size, _ in manifests) - max_bytes
+    for _, size, path in sorted(manifests):
+        if excess <= 0:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # otro proceso lo eliminó antes
+        excess -= size
+
+# Función para guardar el manifiesto de un documento a partir de pares (hash del fragmento, traducción) en orden.
+# Las entradas se escriben a medida que se recorren, de modo que pueden leerse de una salida en disco.
+def save_chunk_manifest(doc_id, entries):
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    path = _manifest_path(doc_id)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        file.write('{"fragmentos": [')
+        for i, entry in enumerate(entries):
+            file.write(("," if i else "") + json.dumps(list(entry), ensure_ascii=False))
+        file.write("]}")
+    os.replace(temporary, path)
+    evict_manifests()
+
+# Función para generar el nombre del archivo con los detalles adicionales
+def generate_filename(base_name, model, chunk_size, language):
+    date_str = datetime.now().strftime("%Y%m%d")
+    chunk_str = f"_{chunk_size // 1000}k" if chunk_size >= 1000 else f"_{chunk_size}"
+    lang_str = "es_conciso" if language == "Español Conciso" else "en_conciso"
+    return f"{base_name}_{lang_str}_{date_str}_{model}{chunk_str}.txt"